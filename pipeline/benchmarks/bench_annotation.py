@@ -0,0 +1,86 @@
+"""Annotation benchmarks on synthetic iseg images at several resolutions and class counts."""
+import os
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from util import helpers
+from util import labels
+
+RESOLUTIONS = (320, 640, 1280)
+CLASS_COUNTS = (8, 32, 128)
+
+
+def synthetic_components(n_classes):
+    """Returns n_classes components with distinct colors, two shades (components) per class."""
+    rng = np.random.default_rng(n_classes)
+    colors = rng.choice(255 ** 3, size=2 * n_classes, replace=False)
+    components = []
+    for i, color in enumerate(colors):
+        r, g, b = (color // 255 ** 2 % 255 + 1) / 255, (color // 255 % 255 + 1) / 255, (color % 255 + 1) / 255
+        components.append({'name': 'part-%d' % i, 'category': 'class-%d' % (i // 2), 'R': r, 'G': g, 'B': b})
+    return components
+
+
+def synthetic_iseg(size, components, rng, n_visible=None):
+    """Draws random rectangles and ellipses in component colors on a black background.
+    Returns:
+        np.ndarray: (size, size, 3) uint8 BGR image.
+    """
+    image = np.zeros((size, size, 3), np.uint8)
+    n_visible = n_visible or len(components)
+    for index in rng.choice(len(components), size=min(n_visible, len(components)), replace=False):
+        c = components[index]
+        color = (labels.to_uint8(c['B']), labels.to_uint8(c['G']), labels.to_uint8(c['R']))
+        x, y = rng.integers(0, size, 2)
+        w, h = rng.integers(size // 40 + 1, size // 5, 2)
+        if rng.random() < 0.5:
+            cv2.rectangle(image, (int(x), int(y)), (int(x + w), int(y + h)), color, -1)
+        else:
+            cv2.ellipse(image, (int(x), int(y)), (int(w), int(h)), 0, 0, 360, color, -1)
+    return image
+
+
+def run(n_images=20, resolutions=RESOLUTIONS, class_counts=CLASS_COUNTS, jobs=1):
+    results = []
+    rng = np.random.default_rng(0)
+    for n_classes in class_counts:
+        components = synthetic_components(n_classes)
+        table = labels.build_label_table(components)
+        for size in resolutions:
+            folder = tempfile.mkdtemp(prefix='blendr_bench_')
+            try:
+                iseg_dir = os.path.join(folder, 'iseg')
+                os.makedirs(iseg_dir)
+                for i in range(n_images):
+                    image = synthetic_iseg(size, components, rng, n_visible=min(40, len(components)))
+                    cv2.imwrite(os.path.join(iseg_dir, 'iseg_image_%06d.png' % i), image)
+                    instances = labels.instance_map(image, table)
+                    labels.save_id_map(os.path.join(iseg_dir, 'iseg_image_%06d.npz' % (n_images + i)),
+                                       labels.id_map(instances, len(components)))
+
+                # png and npz inputs are timed separately on the same frames
+                for kind in ('png', 'npz'):
+                    input_dir = os.path.join(folder, kind)
+                    os.makedirs(input_dir)
+                    for f in os.listdir(iseg_dir):
+                        if f.endswith('.' + kind):
+                            os.link(os.path.join(iseg_dir, f), os.path.join(input_dir, f))
+                    labels_dir = os.path.join(folder, 'labels_' + kind)
+                    os.makedirs(labels_dir)
+                    t0 = time.perf_counter()
+                    failures = helpers.extract_bbox_annots(input_dir, labels_dir, components, jobs=jobs)
+                    elapsed = time.perf_counter() - t0
+                    results.append({
+                        'name': 'extract_bbox_annots[%s,%dpx,%dclasses]' % (kind, size, n_classes),
+                        'params': {'input': kind, 'resolution': size, 'classes': n_classes,
+                                   'components': len(components), 'images': n_images, 'jobs': jobs},
+                        'metrics': {'seconds': elapsed, 'ms_per_image': 1000 * elapsed / n_images,
+                                    'images_per_second': n_images / elapsed, 'failures': len(failures)},
+                    })
+            finally:
+                shutil.rmtree(folder)
+    return results
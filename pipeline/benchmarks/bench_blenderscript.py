@@ -0,0 +1,91 @@
+"""Per frame orchestration overhead of blenderscript.py, run against the fake Blender modules."""
+import contextlib
+import io
+import json
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import fake_blender
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+SCRIPT_PATH = os.path.join(ROOT_DIR, 'blenderscript.py')
+CONFIG_PATH = os.path.join(ROOT_DIR, 'config.json')
+STL_DIR = os.path.join(os.path.dirname(ROOT_DIR), 'resources', 'stl')
+
+
+def make_config(folder, n_images, n_textures=40, n_backgrounds=20, overrides=None):
+    """Writes a config.json for the fake run: the repo's config with the bundled STLs and placeholder assets."""
+    with open(CONFIG_PATH, 'r') as f:
+        config = json.load(f)
+
+    for name, count, ext in (('textures', n_textures, '.jpg'), ('backgrounds', n_backgrounds, '.hdr')):
+        os.makedirs(os.path.join(folder, name))
+        for i in range(count):
+            open(os.path.join(folder, name, '%s_%03d%s' % (name, i, ext)), 'w').close()
+
+    config.update(input_dir=STL_DIR, output_dir=os.path.join(folder, 'output'),
+                  textures_dir=os.path.join(folder, 'textures'), backgrounds_dir=os.path.join(folder, 'backgrounds'))
+    config['render_settings'].update(n_images=n_images, asset_cache=0)
+    config['render_settings'].update(overrides or {})
+    path = os.path.join(folder, 'config.json')
+    with open(path, 'w') as f:
+        json.dump(config, f)
+    return path
+
+
+def run_script(config_path, script_args=()):
+    """Executes blenderscript.py like 'blender --python blenderscript.py -- ...' and returns the fake Blender stats."""
+    stats = fake_blender.install()
+    argv = sys.argv
+    sys.argv = ['blender', '--', '--config', config_path] + [str(a) for a in script_args]
+    # util modules bound the previous fake bpy when they were imported
+    for name in [m for m in sys.modules if m == 'util' or m.startswith('util.')]:
+        del sys.modules[name]
+    t0 = time.perf_counter()
+    try:
+        # the frame events of the script are not needed here
+        with contextlib.redirect_stdout(io.StringIO()):
+            runpy.run_path(SCRIPT_PATH, run_name='__main__')
+    finally:
+        sys.argv = argv
+    return stats, t0, time.perf_counter()
+
+
+def run(n_images=50, overrides=None, name='blenderscript.run'):
+    folder = tempfile.mkdtemp(prefix='blendr_bench_')
+    try:
+        config_path = make_config(folder, n_images, overrides=overrides)
+        stats, t_start, t_end = run_script(config_path)
+    finally:
+        shutil.rmtree(folder)
+
+    renders = stats.renders
+    times = np.array([r['time'] for r in renders])
+    frame_times = np.diff(times)
+    first, last = renders[0]['data'], renders[-1]['data']
+    per_frame_growth = {kind: (last[kind] - first[kind]) / max(1, len(renders) - 1) for kind in first}
+    ops_per_frame = (renders[-1]['ops'] - renders[0]['ops']) / max(1, len(renders) - 1)
+
+    return [{
+        'name': '%s[%d]' % (name, n_images),
+        'params': {'images': n_images, 'overrides': overrides or {}},
+        'metrics': {
+            'setup_seconds': renders[0]['time'] - t_start,
+            'loop_seconds': times[-1] - times[0],
+            'total_seconds': t_end - t_start,
+            'ms_per_frame_mean': 1000 * float(frame_times.mean()) if len(frame_times) else 0.0,
+            'ms_per_frame_p95': 1000 * float(np.percentile(frame_times, 95)) if len(frame_times) else 0.0,
+            'ops_per_frame': ops_per_frame,
+            'datablocks_first_frame': first,
+            'datablocks_last_frame': last,
+            'datablock_growth_per_frame': per_frame_growth,
+            'operator_calls': dict(stats.ops),
+            'zpy_calls': dict(stats.zpy),
+        },
+    }]
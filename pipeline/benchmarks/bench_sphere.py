@@ -0,0 +1,39 @@
+"""Scaling of the viewpoint generators with the number of points."""
+import time
+
+import numpy as np
+
+from util import blender_util
+from util import plan
+from util import sampling
+
+POINT_COUNTS = (1000, 10000, 100000)
+
+
+def _best_of(function, repeat=3):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def run(point_counts=POINT_COUNTS, repeat=3):
+    results = []
+    generators = {
+        'fibonacci_sphere': lambda n: blender_util.fibonacci_sphere(n, 5.0),
+        'random_sphere': lambda n: blender_util.random_sphere(n, 5.0, seed=0),
+        'plan.fibonacci_points': lambda n: plan.fibonacci_points(np.arange(n), n, 5.0),
+        'sampling.stratified': lambda n: sampling.ViewpointSampler('stratified', (5.0,), n).sample(
+            np.arange(n), np.random.default_rng(0)),
+    }
+    for name, generate in generators.items():
+        for n in point_counts:
+            elapsed = _best_of(lambda: generate(n), repeat)
+            results.append({
+                'name': '%s[%d]' % (name, n),
+                'params': {'points': n, 'repeat': repeat},
+                'metrics': {'seconds': elapsed, 'us_per_point': 1e6 * elapsed / n},
+            })
+    return results
@@ -0,0 +1,713 @@
+"""Headless stand-ins for the bpy, zpy and mathutils modules.
+
+They implement just enough of the Blender API used by blenderscript.py and util/ to run the
+orchestration code on a machine without Blender. Nothing is rendered; instead every operator
+call, render call and datablock creation is recorded in STATS so benchmarks can measure
+per frame overhead and the growth of objects, materials and images.
+"""
+import json
+import os
+import random
+import sys
+import time
+import types
+from collections import Counter
+
+import numpy as np
+
+
+class Stats():
+    """Records operator calls, renders and datablock counts of the fake Blender session."""
+    def __init__(self):
+        self.ops = Counter()
+        self.zpy = Counter()
+        self.created = Counter()
+        self.removed = Counter()
+        self.renders = []
+
+    def snapshot(self):
+        """Returns the current number of datablocks per bpy.data collection."""
+        return {name: len(collection) for name, collection in DATA.by_kind().items()}
+
+    def record_render(self):
+        self.renders.append({'time': time.perf_counter(), 'ops': sum(self.ops.values()), 'data': self.snapshot()})
+
+
+STATS = Stats()
+
+
+# mathutils
+
+class Vector(tuple):
+    def __new__(cls, values=(0.0, 0.0, 0.0)):
+        return super().__new__(cls, (float(v) for v in values))
+
+    x = property(lambda self: self[0])
+    y = property(lambda self: self[1])
+    z = property(lambda self: self[2])
+
+    def __add__(self, other):
+        return Vector(a + b for a, b in zip(self, other))
+
+    def __sub__(self, other):
+        return Vector(a - b for a, b in zip(self, other))
+
+    def __mul__(self, scalar):
+        return Vector(a * scalar for a in self)
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Vector(-a for a in self)
+
+    @property
+    def length(self):
+        return float(np.linalg.norm(self))
+
+    def normalized(self):
+        length = self.length
+        return Vector(a / length for a in self) if length else Vector(self)
+
+    def to_tuple(self, precision=None):
+        return tuple(self) if precision is None else tuple(round(a, precision) for a in self)
+
+
+class Matrix(list):
+    """4x4 matrix as nested lists, np.array(matrix) gives the numpy matrix."""
+    @property
+    def translation(self):
+        return Vector(row[3] for row in self[:3])
+
+    def inverted(self):
+        return Matrix(np.linalg.inv(np.array(self)).tolist())
+
+
+class BVHTree():
+    """Brute force ray casts against triangles instead of a tree, same results for the few distractor meshes."""
+    def __init__(self, triangles):
+        self.triangles = triangles
+
+    @classmethod
+    def FromPolygons(cls, vertices, polygons):
+        vertices = np.array(vertices, dtype=float)
+        # fan triangulation of every polygon
+        triangles = [(p[0], p[i], p[i + 1]) for p in polygons for i in range(1, len(p) - 1)]
+        return cls(vertices[np.array(triangles)])
+
+    def ray_cast(self, origin, direction, distance=1e30):
+        # Moller-Trumbore for all triangles at once
+        origin, direction = np.array(origin), np.array(direction)
+        a, b, c = self.triangles[:, 0], self.triangles[:, 1], self.triangles[:, 2]
+        e1, e2 = b - a, c - a
+        p = np.cross(direction, e2)
+        det = np.einsum('ij,ij->i', e1, p)
+        ok = np.abs(det) > 1e-12
+        inv = np.where(ok, 1.0 / np.where(ok, det, 1.0), 0.0)
+        t_vec = origin - a
+        u = np.einsum('ij,ij->i', t_vec, p) * inv
+        q = np.cross(t_vec, e1)
+        v = (q @ direction) * inv
+        t = np.einsum('ij,ij->i', e2, q) * inv
+        hit = ok & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > 0) & (t <= distance)
+        if not hit.any():
+            return None, None, None, None
+        index = int(np.flatnonzero(hit)[np.argmin(t[hit])])
+        return Vector(origin + t[index] * direction), None, index, float(t[index])
+
+
+def look_at_matrix(location, target):
+    """Rotation pointing the -z axis of a camera at target, with +y up like zpy.camera.look_at."""
+    forward = np.array(target, dtype=float) - np.array(location, dtype=float)
+    forward /= np.linalg.norm(forward) or 1.0
+    up = np.array((0.0, 0.0, 1.0)) if abs(forward[2]) < 0.999 else np.array((0.0, 1.0, 0.0))
+    right = np.cross(forward, up)
+    right /= np.linalg.norm(right)
+    return np.stack([right, np.cross(right, forward), -forward], axis=1)
+
+
+# bpy.data
+
+class Struct():
+    """Property group that creates nested property groups on first access, e.g. scene.cycles."""
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = Struct()
+        setattr(self, name, value)
+        return value
+
+
+class ID(Struct):
+    """Datablock stored in a bpy.data collection."""
+    kind = 'id'
+
+    def __init__(self, name, **values):
+        super().__init__(name=name, **values)
+
+    @property
+    def users(self):
+        return DATA.users(self)
+
+    def copy(self):
+        return getattr(DATA, self.kind).add(type(self), self.name, source=self)
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.name)
+
+
+class DataCollection():
+    """bpy.data collection keyed by unique datablock names."""
+    def __init__(self, kind, factory):
+        self.kind = kind
+        self.factory = factory
+        self._items = {}
+
+    def unique_name(self, name):
+        if name not in self._items:
+            return name
+        i = 1
+        while '%s.%03d' % (name, i) in self._items:
+            i += 1
+        return '%s.%03d' % (name, i)
+
+    def add(self, factory, name, **kwargs):
+        item = factory(self.unique_name(name), **kwargs)
+        item.kind = self.kind
+        self._items[item.name] = item
+        STATS.created[self.kind] += 1
+        return item
+
+    def new(self, name, data=None, **kwargs):
+        if data is not None:
+            kwargs['data'] = data
+        return self.add(self.factory, name, **kwargs)
+
+    def rename(self, item, name):
+        del self._items[item.name]
+        item.__dict__['name'] = self.unique_name(name)
+        self._items[item.name] = item
+
+    def remove(self, item, do_unlink=True):
+        if self._items.get(item.name) is item:
+            del self._items[item.name]
+            STATS.removed[self.kind] += 1
+            for collection in list(item.__dict__.get('users_collection', [])):
+                collection.unlink(item)
+
+    def load(self, filepath, check_existing=False):
+        name = os.path.basename(str(filepath))
+        if check_existing:
+            for image in self._items.values():
+                if image.filepath == str(filepath):
+                    return image
+        return self.add(self.factory, name, filepath=str(filepath))
+
+    def get(self, name, default=None):
+        return self._items.get(name, default)
+
+    def __getitem__(self, name):
+        return self._items[name]
+
+    def __contains__(self, name):
+        return name in self._items
+
+    def __iter__(self):
+        return iter(list(self._items.values()))
+
+    def __len__(self):
+        return len(self._items)
+
+
+class Named(ID):
+    """Datablock whose name can be changed by assignment, which keeps names unique like Blender."""
+    def __setattr__(self, name, value):
+        if name == 'name' and 'name' in self.__dict__ and 'kind' in self.__dict__:
+            getattr(DATA, self.kind).rename(self, value)
+        else:
+            super().__setattr__(name, value)
+
+
+class Socket(Struct):
+    def __init__(self, node, name, default_value=0.0):
+        super().__init__(node=node, name=name, default_value=default_value, links=[])
+
+    @property
+    def is_linked(self):
+        return bool(self.links)
+
+
+class Sockets():
+    """Node inputs/outputs, created on first access by name."""
+    def __init__(self, node):
+        self._node = node
+        self._sockets = {}
+
+    def __getitem__(self, name):
+        if name not in self._sockets:
+            default = [0.0, 0.0, 0.0] if name in ('Rotation', 'Location', 'Scale', 'Vector') else 0.0
+            self._sockets[name] = Socket(self._node, name, default)
+        return self._sockets[name]
+
+    def __iter__(self):
+        return iter(list(self._sockets.values()))
+
+
+class Node(Struct):
+    def __init__(self, name, type, image=None):
+        super().__init__(name=name, type=type, image=image)
+        self.inputs = Sockets(self)
+        self.outputs = Sockets(self)
+
+
+class Nodes():
+    TYPES = {
+        'ShaderNodeTexCoord': 'TEX_COORD', 'ShaderNodeMapping': 'MAPPING', 'ShaderNodeTexEnvironment': 'TEX_ENVIRONMENT',
+        'ShaderNodeBackground': 'BACKGROUND', 'ShaderNodeOutputWorld': 'OUTPUT_WORLD', 'ShaderNodeTexImage': 'TEX_IMAGE',
+        'ShaderNodeBsdfPrincipled': 'BSDF_PRINCIPLED', 'ShaderNodeOutputMaterial': 'OUTPUT_MATERIAL',
+        'ShaderNodeOutputAOV': 'OUTPUT_AOV',
+    }
+
+    def __init__(self):
+        self._nodes = {}
+
+    def new(self, bl_idname):
+        node_type = self.TYPES.get(bl_idname, bl_idname)
+        name = bl_idname
+        i = 1
+        while name in self._nodes:
+            name = '%s.%03d' % (bl_idname, i)
+            i += 1
+        node = Node(name, node_type)
+        self._nodes[name] = node
+        return node
+
+    def get(self, name, default=None):
+        # names may have changed since the node was created
+        for node in self._nodes.values():
+            if node.name == name:
+                return node
+        return default
+
+    def clear(self):
+        self._nodes.clear()
+
+    def __iter__(self):
+        return iter(list(self._nodes.values()))
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+class Links(list):
+    def new(self, output, input):
+        link = Struct(from_node=output.node, from_socket=output, to_node=input.node, to_socket=input)
+        input.links.append(link)
+        output.links.append(link)
+        self.append(link)
+        return link
+
+
+class NodeTree(Struct):
+    def __init__(self):
+        super().__init__(nodes=Nodes(), links=Links())
+
+
+class Image(Named):
+    def __init__(self, name, filepath='', size=(2048, 1024), channels=4):
+        super().__init__(name, filepath=filepath, size=size, channels=channels, colorspace_settings=Struct(name='sRGB'))
+
+
+class Material(Named):
+    def __init__(self, name, source=None):
+        super().__init__(name, use_nodes=True, node_tree=NodeTree())
+        if source is not None:
+            for node in source.node_tree.nodes:
+                copy = self.node_tree.nodes.new(node.type)
+                copy.name, copy.type, copy.image = node.name, node.type, node.image
+                for socket in node.inputs:
+                    copy.inputs[socket.name].default_value = socket.default_value
+
+
+class MeshElements():
+    def __init__(self):
+        self.count = 0
+        self.data = {}
+
+    def __iter__(self):
+        # polygons, their vertex indices are stored by the primitive operators
+        return iter([Struct(vertices=indices) for indices in self.data.get('indices', [])])
+
+    def add(self, n):
+        self.count += n
+
+    def foreach_set(self, attr, values):
+        self.data[attr] = np.array(values)
+
+    def foreach_get(self, attr, out):
+        out[:] = self.data.get(attr, np.zeros(len(out)))
+
+    def __len__(self):
+        return self.count
+
+
+class UVLayers(dict):
+    def new(self, name):
+        self[name] = Struct(name=name, active=False)
+        return self[name]
+
+
+class Mesh(Named):
+    def __init__(self, name, source=None):
+        super().__init__(name, vertices=MeshElements(), loops=MeshElements(), polygons=MeshElements(), uv_layers=UVLayers())
+        if source is not None:
+            self.vertices.count = source.vertices.count
+            self.vertices.data = source.vertices.data
+            self.polygons.count = source.polygons.count
+            self.polygons.data = source.polygons.data
+
+    def update(self):
+        pass
+
+    def validate(self):
+        return False
+
+
+class Light(Named):
+    def __init__(self, name, type='POINT'):
+        super().__init__(name, type=type, color=(1.0, 1.0, 1.0), energy=10.0)
+
+
+class Object(Named):
+    def __init__(self, name, data=None, object_data=None, source=None):
+        data = data if data is not None else object_data
+        if source is not None:
+            data = source.data
+        if isinstance(data, Mesh):
+            obj_type = 'MESH'
+        elif isinstance(data, Light):
+            obj_type = 'LIGHT'
+        else:
+            obj_type = 'CAMERA' if name == 'Camera' else 'EMPTY'
+        super().__init__(name, data=data, type=obj_type, users_collection=[], material_slots=[None],
+                         rotation_euler=Vector(), hide_render=False, hide_viewport=False, _selected=False)
+        self._location = Vector()
+        self._scale = Vector((1, 1, 1))
+        self._rotation = np.eye(3)
+
+    location = property(lambda self: self._location, lambda self, value: setattr(self, '_location', Vector(value)))
+    scale = property(lambda self: self._scale, lambda self, value: setattr(self, '_scale', Vector(value)))
+
+    @property
+    def active_material(self):
+        return self.material_slots[0]
+
+    @active_material.setter
+    def active_material(self, mat):
+        self.material_slots[0] = mat
+
+    @property
+    def matrix_world(self):
+        matrix = np.eye(4)
+        matrix[:3, :3] = self._rotation @ np.diag(list(self._scale))
+        matrix[:3, 3] = self._location
+        return Matrix(matrix.tolist())
+
+    def evaluated_get(self, depsgraph):
+        return self
+
+    def to_mesh(self):
+        return self.data
+
+    def to_mesh_clear(self):
+        pass
+
+    def calc_matrix_camera(self, depsgraph, x=640, y=640, scale_x=1.0, scale_y=1.0):
+        # perspective projection of a 50mm lens on a 36mm sensor
+        f = 2 * 50.0 / 36.0
+        near, far = 0.1, 100.0
+        return Matrix([[f, 0, 0, 0], [0, f * x / y, 0, 0],
+                       [0, 0, -(far + near) / (far - near), -2 * far * near / (far - near)], [0, 0, -1, 0]])
+
+    @property
+    def bound_box(self):
+        co = self.data.vertices.data.get('co') if isinstance(self.data, Mesh) else None
+        if co is None or len(co) == 0:
+            return [(0.0, 0.0, 0.0)] * 8
+        co = co.reshape(-1, 3)
+        lo, hi = co.min(axis=0), co.max(axis=0)
+        return [(x, y, z) for x in (lo[0], hi[0]) for y in (lo[1], hi[1]) for z in (lo[2], hi[2])]
+
+    def select_set(self, state):
+        self._selected = state
+
+    def select_get(self):
+        return self._selected
+
+
+class ObjectLinks():
+    """Objects linked to a collection."""
+    def __init__(self):
+        self._objects = []
+
+    def link(self, obj):
+        self._objects.append(obj)
+        obj.users_collection.append(self)
+
+    def unlink(self, obj):
+        self._objects.remove(obj)
+        obj.users_collection.remove(self)
+
+    def __iter__(self):
+        return iter(list(self._objects))
+
+    def __len__(self):
+        return len(self._objects)
+
+
+class Collection(Named):
+    def __init__(self, name):
+        super().__init__(name, objects=ObjectLinks(), children=Struct(link=lambda child: None))
+
+
+class World(Named):
+    def __init__(self, name):
+        super().__init__(name, use_nodes=False, node_tree=NodeTree())
+
+
+class BlendData():
+    def __init__(self):
+        self.objects = DataCollection('objects', Object)
+        self.meshes = DataCollection('meshes', Mesh)
+        self.materials = DataCollection('materials', Material)
+        self.images = DataCollection('images', Image)
+        self.lights = DataCollection('lights', Light)
+        self.collections = DataCollection('collections', Collection)
+        self.worlds = DataCollection('worlds', World)
+
+    def by_kind(self):
+        return {kind: getattr(self, kind) for kind in ('objects', 'meshes', 'materials', 'images', 'lights', 'worlds')}
+
+    def users(self, item):
+        """Counts references to an image, material or light, enough for purging unused datablocks."""
+        if isinstance(item, Image):
+            trees = [m.node_tree for m in self.materials] + [w.node_tree for w in self.worlds]
+            return sum(1 for tree in trees for node in tree.nodes if node.image is item)
+        if isinstance(item, Material):
+            return sum(1 for obj in self.objects if obj.active_material is item)
+        if isinstance(item, Light):
+            return sum(1 for obj in self.objects if obj.data is item)
+        return 1
+
+
+DATA = None
+
+
+# bpy.ops
+
+class Operator():
+    def __init__(self, name, function=None):
+        self.name = name
+        self.function = function
+
+    def __call__(self, *args, **kwargs):
+        STATS.ops[self.name] += 1
+        if self.function is not None:
+            return self.function(*args, **kwargs)
+        return {'FINISHED'}
+
+
+def _delete(**kwargs):
+    for obj in DATA.objects:
+        if obj.select_get():
+            DATA.objects.remove(obj)
+    return {'FINISHED'}
+
+
+def _join(**kwargs):
+    # merges the vertices of the selected objects into the active one and removes the others
+    active = CONTEXT.view_layer.objects.active
+    co = [active.data.vertices.data.get('co', np.zeros(0))]
+    for obj in DATA.objects:
+        if obj.select_get() and obj is not active:
+            co.append(obj.data.vertices.data.get('co', np.zeros(0)))
+            DATA.objects.remove(obj)
+    co = np.concatenate(co)
+    active.data.vertices.count = len(co) // 3
+    active.data.vertices.data = dict(active.data.vertices.data, co=co)
+    return {'FINISHED'}
+
+
+def _select_all(action='TOGGLE', **kwargs):
+    if action == 'DESELECT':
+        for obj in DATA.objects:
+            obj.select_set(False)
+    return {'FINISHED'}
+
+
+def _resize(value=(1, 1, 1), **kwargs):
+    for obj in DATA.objects:
+        if obj.select_get():
+            obj.scale = tuple(s * v for s, v in zip(obj.scale, value))
+    return {'FINISHED'}
+
+
+def _primitive(shape):
+    def add(location=(0, 0, 0), **kwargs):
+        mesh = DATA.meshes.new(shape)
+        mesh.vertices.add(8)
+        mesh.vertices.foreach_set('co', np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=float).ravel())
+        # the six faces of the cube, every shape is a cube here
+        mesh.polygons.add(6)
+        mesh.polygons.data['indices'] = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+        obj = DATA.objects.new(shape, mesh)
+        obj.location = location
+        CONTEXT.collection.objects.link(obj)
+        CONTEXT.object = obj
+        return {'FINISHED'}
+    return add
+
+
+def _make_ops():
+    ops = types.SimpleNamespace()
+    ops.object = types.SimpleNamespace(
+        select_all=Operator('object.select_all', _select_all),
+        delete=Operator('object.delete', _delete),
+        join=Operator('object.join', _join),
+        editmode_toggle=Operator('object.editmode_toggle'),
+    )
+    ops.mesh = types.SimpleNamespace(
+        select_all=Operator('mesh.select_all'),
+        primitive_cube_add=Operator('mesh.primitive_cube_add', _primitive('Cube')),
+        primitive_cylinder_add=Operator('mesh.primitive_cylinder_add', _primitive('Cylinder')),
+        primitive_cone_add=Operator('mesh.primitive_cone_add', _primitive('Cone')),
+        primitive_torus_add=Operator('mesh.primitive_torus_add', _primitive('Torus')),
+    )
+    ops.uv = types.SimpleNamespace(smart_project=Operator('uv.smart_project'))
+    ops.transform = types.SimpleNamespace(resize=Operator('transform.resize', _resize))
+    return ops
+
+
+CONTEXT = None
+
+
+def _make_context():
+    scene_collection = Collection('Scene Collection')
+    cycles = Struct(samples=128, use_adaptive_sampling=True, adaptive_threshold=0.01, max_bounces=12, use_denoising=False)
+    render = Struct(engine='CYCLES', resolution_x=640, resolution_y=640, resolution_percentage=100,
+                    threads_mode='AUTO', threads=1, tile_x=64, tile_y=64, pixel_aspect_x=1.0, pixel_aspect_y=1.0)
+    scene = Struct(collection=scene_collection, cycles=cycles, render=render, world=None, node_tree=None)
+    context = Struct(scene=scene, collection=scene_collection, object=None)
+    context.view_layer = Struct(objects=Struct(active=None), update=lambda: None)
+    context.evaluated_depsgraph_get = lambda: Struct()
+    return context
+
+
+class _SceneObjects():
+    """scene.objects, every object like the single scene of renderfile.blend."""
+    def __iter__(self):
+        return iter(DATA.objects)
+
+
+# zpy
+
+def _make_zpy():
+    zpy = types.ModuleType('zpy')
+
+    def record(name, function=None):
+        def call(*args, **kwargs):
+            STATS.zpy[name] += 1
+            return function(*args, **kwargs) if function is not None else None
+        return call
+
+    def set_seed(seed):
+        random.seed(seed)
+        np.random.seed(seed % 2**32)
+
+    def make_mat_from_texture(texture_path, name=None):
+        mat = DATA.materials.new(name or os.path.basename(str(texture_path)))
+        nodes = mat.node_tree.nodes
+        bsdf = nodes.new('ShaderNodeBsdfPrincipled')
+        for name in ('Base Color', 'Roughness', 'Metallic', 'Specular'):
+            bsdf.inputs[name].default_value = 0.5
+        tex = nodes.new('ShaderNodeTexImage')
+        tex.image = DATA.images.load(texture_path, check_existing=True)
+        nodes.new('ShaderNodeOutputMaterial')
+        return mat
+
+    def set_mat(obj, mat):
+        obj.active_material = mat
+
+    def render_aov(rgb_path=None, iseg_path=None, width=640, height=640, **kwargs):
+        STATS.record_render()
+
+    class ImageSaver():
+        def __init__(self, description='', output_dir=None):
+            from pathlib import Path
+            self.output_dir = Path(output_dir)
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.images = []
+            self.categories = []
+
+        def add_image(self, **kwargs):
+            self.images.append(kwargs)
+
+        def add_category(self, **kwargs):
+            self.categories.append(kwargs)
+
+    class OutputZUMO():
+        def __init__(self, saver):
+            self.saver = saver
+
+        def output_annotations(self, annotation_path=None):
+            with open(annotation_path, 'w') as f:
+                json.dump({'images': len(self.saver.images), 'categories': self.saver.categories}, f)
+
+    zpy.blender = types.SimpleNamespace(set_seed=record('blender.set_seed', set_seed))
+    def look_at(obj, target):
+        obj._rotation = look_at_matrix(obj.location, target)
+
+    zpy.camera = types.SimpleNamespace(look_at=record('camera.look_at', look_at))
+    zpy.material = types.SimpleNamespace(make_mat_from_texture=record('material.make_mat_from_texture', make_mat_from_texture),
+                                         set_mat=record('material.set_mat', set_mat),
+                                         jitter=record('material.jitter'))
+    zpy.objects = types.SimpleNamespace(segment=record('objects.segment'))
+    zpy.render = types.SimpleNamespace(render_aov=record('render.render_aov', render_aov))
+    zpy.saver_image = types.SimpleNamespace(ImageSaver=ImageSaver)
+    zpy.output_zumo = types.SimpleNamespace(OutputZUMO=OutputZUMO)
+    return zpy
+
+
+def install():
+    """Puts fresh fake bpy, zpy and mathutils modules into sys.modules and returns the stats recorder.
+    The scene holds a camera, like renderfile.blend.
+    """
+    global DATA, CONTEXT, STATS
+    STATS = Stats()
+    DATA = BlendData()
+    CONTEXT = _make_context()
+    CONTEXT.scene.objects = _SceneObjects()
+    camera = DATA.objects.new('Camera')
+    CONTEXT.collection.objects.link(camera)
+
+    bpy = types.ModuleType('bpy')
+    bpy.data = DATA
+    bpy.context = CONTEXT
+    bpy.ops = _make_ops()
+    bpy.path = types.SimpleNamespace(basename=lambda path: os.path.basename(str(path)))
+    bpy.app = types.SimpleNamespace(version_string='2.92.0 (fake)')
+    bpy.types = types.SimpleNamespace(Object=Object, Scene=Struct, Depsgraph=Struct, Material=Material)
+
+    mathutils = types.ModuleType('mathutils')
+    mathutils.Vector = Vector
+    mathutils.Matrix = Matrix
+    mathutils.bvhtree = types.ModuleType('mathutils.bvhtree')
+    mathutils.bvhtree.BVHTree = BVHTree
+
+    sys.modules['bpy'] = bpy
+    sys.modules['zpy'] = _make_zpy()
+    sys.modules['mathutils'] = mathutils
+    sys.modules['mathutils.bvhtree'] = mathutils.bvhtree
+    return STATS
@@ -0,0 +1,106 @@
+"""Runs the benchmark suite without Blender and writes the results to a JSON file.
+
+    python benchmarks/run.py                      # all suites
+    python benchmarks/run.py -s annotation --quick
+    python benchmarks/run.py --compare benchmarks/results/<earlier>.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+# benchmarks import the pipeline modules like blenderscript.py does
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import numpy as np
+
+from benchmarks import fake_blender
+
+# blender_util and plan import bpy/mathutils, so the fake modules must be installed first
+fake_blender.install()
+
+from benchmarks import bench_annotation
+from benchmarks import bench_blenderscript
+from benchmarks import bench_sphere
+
+SUITES = ('annotation', 'sphere', 'blenderscript')
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+
+
+def run_suite(suite, quick=False, jobs=1):
+    if suite == 'annotation':
+        if quick:
+            return bench_annotation.run(n_images=5, resolutions=(320, 640), class_counts=(8, 32), jobs=jobs)
+        return bench_annotation.run(jobs=jobs)
+    if suite == 'sphere':
+        return bench_sphere.run(point_counts=(1000, 10000) if quick else bench_sphere.POINT_COUNTS)
+    if suite == 'blenderscript':
+        n_images = 10 if quick else 50
+        # the same run with the pre-render visibility check, its cost shows in the per frame times
+        culled = {'cull_min_visible': 0.5, 'cull_min_components': 0.8}
+        return (bench_blenderscript.run(n_images=n_images)
+                + bench_blenderscript.run(n_images=n_images, overrides=culled, name='blenderscript.cull')
+                + bench_blenderscript.run(n_images=n_images, overrides={'static_batch': 1}, name='blenderscript.static_batch'))
+    raise ValueError('unknown suite %s' % suite)
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline_file):
+    """Prints the change of the timing metrics against an earlier results file."""
+    with open(baseline_file, 'r') as f:
+        baseline = {r['name']: r['metrics'] for r in json.load(f)['results']}
+    for result in results:
+        old = baseline.get(result['name'])
+        if old is None:
+            continue
+        for metric, value in result['metrics'].items():
+            if isinstance(value, (int, float)) and isinstance(old.get(metric), (int, float)) and old[metric]:
+                if metric.endswith(('seconds', 'ms_per_image', 'ms_per_frame_mean', 'us_per_point', 'ops_per_frame')):
+                    print('{:60s} {:28s} {:10.4g} -> {:10.4g} ({:+.1%})'.format(
+                        result['name'], metric, old[metric], value, value / old[metric] - 1))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline without Blender')
+    parser.add_argument('-s', '--suite', help='suite to run (default: all)', choices=SUITES, action='append')
+    parser.add_argument('-o', '--output', help='results file (default: benchmarks/results/<timestamp>.json)', default=None)
+    parser.add_argument('-j', '--jobs', help='worker processes for annotation', type=int, default=1)
+    parser.add_argument('--quick', help='smaller inputs for a fast check', action='store_true')
+    parser.add_argument('--compare', help='earlier results file to compare against', default=None)
+    args = parser.parse_args()
+
+    results = []
+    for suite in args.suite or SUITES:
+        t0 = time.perf_counter()
+        suite_results = run_suite(suite, args.quick, args.jobs)
+        for result in suite_results:
+            result['suite'] = suite
+        results += suite_results
+        print('{}: {} results in {:.1f}s'.format(suite, len(suite_results), time.perf_counter() - t0))
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'meta': metadata(), 'results': results}, f, indent=4)
+    print('Results written to {}'.format(output))
+
+    if args.compare:
+        compare(results, args.compare)
@@ -2,9 +2,13 @@ import bpy
 import zpy
 from pathlib import Path
 from mathutils import Vector
-import random
+import argparse
 import os
 import sys
+import time
+import traceback
+
+import numpy as np
 
 
 # Set root dir and ensure modules/packages can be imported by script
@@ -12,63 +16,233 @@ ROOT_DIR = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(ROOT_DIR)
 
 # Import additional custom functions from util package
+from util import asset_cache
+from util import labels
+from util import projection
 from util import blender_util
+from util.background import BackgroundManager
+from util.distractor_pool import DistractorPool
+from util.material_pool import MaterialPool
+from util import dataset
+from util import events
+from util import server
+from util import manifest as mf
+from util import plan as rplan
+from util import render_profile
+from util import sampling
+from util import shard_writer
+from util import timing
 from util import config as conf
 
 # Get current working directory and config path
 CWD_PATH = os.getcwd()
 CONFIG_PATH = os.path.join(ROOT_DIR,'config.json')
 
+# Parse script args, blender passes everything after '--' through sys.argv
+script_parser = argparse.ArgumentParser(prog='blenderscript.py')
+script_parser.add_argument('--start', help='id of the first image to render', type=int, default=0)
+script_parser.add_argument('--count', help='number of images to render (default: n_images)', type=int, default=None)
+script_parser.add_argument('--shard', help='shard index if the run is split across processes', type=int, default=None)
+script_parser.add_argument('--config', help='path for config.json', default=CONFIG_PATH)
+script_parser.add_argument('--resume', help='skip frames recorded as complete in the manifest', action='store_true')
+script_parser.add_argument('--profile', help='render profile from config.json (default: render_settings.profile)', default=None)
+script_parser.add_argument('--plan', help='replay the frame parameters of a plan file instead of sampling them', default=None)
+script_parser.add_argument('--trace', help='write timing spans of the loop stages to <output_dir>/_trace', action='store_true')
+script_parser.add_argument('--keep-previous', help='add the recorded frames before --start to the annotation file', action='store_true')
+script_parser.add_argument('--points', help='number of camera and light positions spread over the whole run (default: max(n_images, start + count))',
+                           type=int, default=None)
+script_parser.add_argument('--stop-file', help='stop before the next frame once this file exists, without writing the annotation file', default=None)
+script_parser.add_argument('--serve', help='keep the prepared scene and render jobs submitted to host:port (default: server_address)',
+                           nargs='?', const='', default=None)
+script_args = script_parser.parse_args(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+CONFIG_PATH = script_args.config
+
 # Check if config file exists
 if not os.path.exists(CONFIG_PATH):
     raise Exception('config.json not found')
 
+def use_config(new_config, start=0, trace=False):
+    """Sets the config and the params read from it, called again by the generation server for every job.
+    Args:
+        new_config (Config): Loaded config.json.
+        start (int, optional): Id of the first image, names the trace file of the process. Defaults to 0.
+        trace (bool, optional): Record timing spans even if render_settings.trace is off. Defaults to False.
+    """
+    global config, tracer, components
+    global n_images, r_camera, r_light, intensity_min_light, intensity_max_light, light_properties_random, \
+        light_position_random, n_distractors_min, n_distractors_max, r_distractors_min, r_distractors_max, \
+        scale_distractors_min, scale_distractors_max, add_distractors, random_seed
+    config = new_config
+
+    # Optional timing spans of the setup and loop stages, one file per process
+    tracer = timing.Tracer(os.path.join(config.output_dir, timing.TRACE_DIRNAME, 'blender_%06d.jsonl' % start)
+                           if trace or config.trace == 1 else None, 'blender %06d' % start)
+
+    # Get various params from config
+    n_images = config.n_images
+    r_camera = config.r_camera
+    r_light = config.r_light
+    intensity_min_light = config.intensity_min_light
+    intensity_max_light = config.intensity_max_light
+    light_properties_random = config.light_properties_random
+    light_position_random = config.light_position_random
+    n_distractors_min = config.n_distractors_min
+    n_distractors_max = config.n_distractors_max
+    r_distractors_min = config.r_distractors_min
+    r_distractors_max = config.r_distractors_max
+    scale_distractors_min = config.scale_distractors_min
+    scale_distractors_max = config.scale_distractors_max
+    add_distractors = config.add_distractors
+    random_seed = config.random_seed
+
+    # Create a dictionary of all components
+    components = {}
+    for c in config.components:
+        components[c['name']] = c['stl-filename'], c['R'], c['G'], c['B'], c['category'], c['sub-category']
+
 # Load config file
-config = conf.Config(CONFIG_PATH)
+use_config(conf.Config(CONFIG_PATH), script_args.start, script_args.trace)
 
 # Get input and output directories from config
 input_dir = config.input_dir
 
-# Get various params from config
-n_images = config.n_images
-r_camera = config.r_camera
-r_light = config.r_light
-intensity_min_light = config.intensity_min_light
-intensity_max_light = config.intensity_max_light
-light_properties_random = config.light_properties_random
-light_position_random = config.light_position_random
-n_distractors_min = config.n_distractors_min
-n_distractors_max = config.n_distractors_max
-r_distractors_min = config.r_distractors_min
-r_distractors_max = config.r_distractors_max
-scale_distractors_min = config.scale_distractors_min
-scale_distractors_max = config.scale_distractors_max
-add_distractors = config.add_distractors
-random_seed = config.random_seed
-
-# Import STL files from the input directory
-blender_util.import_stl_folder(input_dir)
-
-# Create a dictionary of all components
-components = {}
-for c in config.components:
-    components[c['name']] = c['stl-filename'], c['R'], c['G'], c['B'], c['category'], c['sub-category']
-
-# add stls to ignore / not needed if analyzing all parts of assembly!
-ignore = ['QC - auslegerbuchse-1', 'QC - auslegerbuchse-2', 'QC - auslegerbuchse-3', 'QC - auslegerbuchse-4', 'QC - ESC-1', 'QC - ESC-2', 'QC - ESC-3', 'QC - ESC-4', 'QC - FC', 'QC - m3-buchse-1', 'QC - m3-buchse-2', 'QC - m3-buchse-3', 'QC - m3-buchse-4', 'QC - m3-buchse-unten-1', 'QC - m3-buchse-unten-2', 'QC - m3-buchse-unten-3', 'QC - m3-buchse-unten-4', 'QC - mutter-m3-1', 'QC - mutter-m3-2', 'QC - mutter-m3-3', 'QC - mutter-m3-4', 'QC - mutter-m4-1', 'QC - mutter-m4-2', 'QC - mutter-m4-3', 'QC - mutter-m4-4', 'QC - mutter-m6-1', 'QC - mutter-m6-2', 'QC - mutter-m6-3', 'QC - mutter-m6-4', 'QC - PDB', 'QC - schraube-m3x18-1', 'QC - schraube-m3x18-2', 'QC - schraube-m3x18-3', 'QC - schraube-m3x18-4', 'QC - schraube-m4x6-1', 'QC - schraube-m4x6-2', 'QC - schraube-m4x6-3', 'QC - schraube-m4x6-4', 'QC - schraube-m4x6-5', 'QC - schraube-m4x6-6', 'QC - schraube-m4x10-1', 'QC - schraube-m4x10-2', 'QC - schraube-m4x10-3', 'QC - schraube-m4x10-4', 'QC - schraube-m4x16-1', 'QC - schraube-m4x16-2', 'QC - schraube-m4x16-3', 'QC - schraube-m4x16-4', 'QC - spannungstester']
-
-def run(num_steps: int = n_images):
+# stls that are rendered but never annotated, e.g. screws and nuts, from the ignore list of config.json
+ignore = config.ignore
+
+# texture materials of the scene, kept for the later jobs of the generation server
+material_pool = None
+
+def scene_settings(config):
+    """Settings the scene is imported and prepared with once at startup, jobs of the generation server cannot change them."""
+    return {
+        'input_dir': os.path.abspath(config.input_dir),
+        'ignore': sorted(config.ignore),
+        'static_batch': config.static_batch,
+        'static_batch_groups': config.static_batch_groups if config.static_batch == 1 else None,
+        'asset_cache': config.asset_cache,
+    }
+
+server_scene = scene_settings(config)
+
+def add_frame(saver, image_id, rgb_path, iseg_path, width=640, height=640):
+    """Adds the rgb and iseg image of a frame to the saver object (saver object --> json).
+    iseg_path is None if segmentation is not rendered."""
+    saver.add_image(
+        name = rgb_path.name,
+        style='default',
+        output_path=rgb_path,
+        frame=image_id,
+        width=width,
+        height=height,
+    )
+    if iseg_path is None:
+        return
+    saver.add_image(
+        name = iseg_path.name,
+        style='segmentation',
+        output_path=iseg_path,
+        frame=image_id,
+        width=width,
+        height=height,
+    )
+
+def add_recorded_frame(saver, manifest, image_id, width=640, height=640):
+    """Adds a frame completed by a previous run to the saver, wherever its files were moved to.
+    Frames packed into tar shards are not added, their images are no files the saver could point to,
+    neither are frames culled before rendering, which have no files at all."""
+    files = manifest.frames[image_id]
+    if 'shards' in files or not files:
+        return None, None
+    rgb_path = Path(manifest.locate(files['rgb'], 'rgb'))
+    iseg_path = Path(manifest.locate(files['iseg'], 'iseg')) if 'iseg' in files else None
+    add_frame(saver, image_id, rgb_path, iseg_path, width, height)
+    return rgb_path, iseg_path
+
+def record_shard(manifest, closed):
+    """Marks the frames of a completed tar shard complete, closed is the return value of ShardWriter.add/close."""
+    if closed is None:
+        return
+    shard_name, keys = closed
+    for key in keys:
+        manifest.record(int(key), shards=shard_name)
+
+def frame_visible(visibility, camera, target, image_id, params, distractors):
+    """Checks that the components of a planned frame are visible enough to be worth rendering.
+    While they are not, the distractor positions and optionally the camera direction are drawn again,
+    up to cull_retries times, from a generator seeded by the frame so reruns make the same choice.
+    Returns:
+        bool: True if the frame is accepted, its objects are left at the accepted positions.
+    """
+    scene = bpy.context.scene
+    for attempt in range(config.cull_retries + 1):
+        if attempt > 0:
+            rng = np.random.default_rng([random_seed, image_id, attempt])
+            for obj in distractors.active:
+                radius = rng.uniform(r_distractors_min, r_distractors_max)
+                obj.location = Vector((sampling.uniform_directions(rng, 1)[0] * radius).tolist())
+            if config.cull_resample_camera == 1:
+                radius = float(np.linalg.norm(params['camera_position']))
+                camera.location = Vector((sampling.uniform_directions(rng, 1)[0] * radius).tolist())
+                zpy.camera.look_at(camera, target)
+        if visibility.accept(camera, scene, distractors.active, config.cull_min_visible, config.cull_min_components):
+            return True
+    return False
+
+def run(start: int = 0, num_steps: int = n_images, shard: int = None, resume: bool = False, keep_previous: bool = False,
+        plan_path: str = None, profile_name: str = None, stop_file: str = None, n_points: int = None):
+    """Renders the images with ids start..start+num_steps-1.
+    Every frame is seeded from its image id, so a run split into shards gives the same images as a single run.
+    Completed frames are recorded in the manifest of the output dir, which lets a crashed run be resumed.
+    All randomized scene parameters are sampled up front into a plan (see util/plan.py) that the loop replays.
+
+    Args:
+        start (int, optional): Id of the first image. Defaults to 0.
+        num_steps (int, optional): Number of images to render. Defaults to n_images.
+        shard (int, optional): Shard index, selects the name of the annotation file. Defaults to None.
+        resume (bool, optional): Skip frames already recorded as complete. Defaults to False.
+        keep_previous (bool, optional): Add the recorded frames before start to the annotation file,
+            used when appending to an existing dataset. Defaults to False.
+        plan_path (str, optional): Plan file to replay, sampled and saved to the output dir if None. Defaults to None.
+        profile_name (str, optional): Render profile from config.json, the configured one if None. Defaults to None.
+        stop_file (str, optional): Stop before the next frame once this file exists, e.g. when the work queue
+            handed the batch to another worker. Defaults to None.
+        n_points (int, optional): Size of the camera and light lattices. Processes of a split run pass the size of
+            the whole run, so every frame gets the position it has in a single run. Defaults to max(n_images, start + num_steps).
+    """
     
+    setup = tracer.stages('setup.run')
+
     # remove distractors and lights if any in scene
     blender_util.remove_distractors()
     blender_util.remove_lights()
 
     # random seed 
     zpy.blender.set_seed(random_seed)
+
+    # render settings of the selected profile, optionally adapting samples to a per frame time budget
+    profile = config.profile(profile_name)
+    render_profile.apply_profile(profile)
+    width, height = profile['resolution']
+    budget = None
+    if profile['frame_budget'] > 0:
+        budget = render_profile.SampleBudget(profile['frame_budget'], profile.get('samples', bpy.context.scene.cycles.samples),
+                                             profile['min_samples'])
+
+    # alpha matted rgb images for compositing onto other backgrounds, the hdri still lights the scene
+    transparent = config.transparent == 1
+    if not transparent and bpy.context.scene.render.film_transparent:
+        # left over from an earlier job of the generation server
+        render_profile.use_transparent_film(False)
     
     # saver object to store all images, annotations etc.
     # detect and segmentation dataset so ImageSaver is used
     saver = zpy.saver_image.ImageSaver(description="DR dataset", output_dir=config.output_dir)
+
+    # manifest of the frames completed so far
+    manifest = mf.Manifest(saver.output_dir)
+    if keep_previous:
+        for image_id in sorted(i for i in manifest.frames if i < start and manifest.is_complete(i)):
+            add_recorded_frame(saver, manifest, image_id, width, height)
     
     # get handle to camera and light
     camera = bpy.data.objects['Camera']
@@ -94,6 +268,44 @@ def run(num_steps: int = n_images):
         # Segment object
         zpy.objects.segment(obj, name=obj_name, color=(R, G, B))
         
+    # frames are written to rgb/ and iseg/ directly, or packed into tar shards rendered via a scratch folder
+    packed = config.output_format == 'tar'
+    if packed:
+        frame_dir = saver.output_dir / ('_scratch_%06d' % start)
+        writer = shard_writer.ShardWriter(saver.output_dir / 'shards', 'shard-%06d' % start,
+                                          config.shard_max_samples, config.shard_max_mb * 2**20)
+        os.makedirs(frame_dir, exist_ok=True)
+    else:
+        os.makedirs(saver.output_dir / 'rgb', exist_ok=True)
+        os.makedirs(saver.output_dir / 'iseg', exist_ok=True)
+
+    # segmentation can be stored as id maps instead of color PNGs, ids are listed in a mapping file
+    id_maps = config.segmentation_format == 'ids'
+    if id_maps or packed:
+        label_table = labels.build_label_table(config.components)
+    if id_maps:
+        # processes of a split run leave it to render.py, which writes it before starting them
+        if shard is None:
+            labels.write_id_mapping(saver.output_dir / labels.ID_MAPPING_FILENAME, config.components)
+
+    # boxes can be computed from the projected meshes instead of the iseg images
+    geometric = config.annotation_mode == 'geometric'
+    render_iseg = not geometric or config.render_iseg == 1
+    if geometric:
+        annotated_objs = [bpy.data.objects[stl_name] for stl_name, R, G, B, main_category, sub_category in components.values()]
+        class_ids = labels.build_label_table(config.components).class_ids
+        labels_dir = saver.output_dir / 'labels'
+        if not packed:
+            os.makedirs(labels_dir, exist_ok=True)
+
+    # frames whose components would be hidden by distractors or outside the image are rearranged or skipped
+    visibility = None
+    culled = 0
+    if config.cull_min_visible > 0:
+        visibility = projection.VisibilityCheck(
+            [bpy.data.objects[stl_name] for stl_name, R, G, B, main_category, sub_category in components.values()],
+            config.cull_samples)
+
     # Create categories and subcategories
     for main_category, category_id in category_dict.items():
         subcategories = []
@@ -101,124 +313,349 @@ def run(num_steps: int = n_images):
             subcategories.append(sub_category)
         saver.add_category(name=main_category, subcategories=subcategories)
 
-    # list of hdris for background
-    background_files = os.listdir(config.backgrounds_dir)
+    # list of hdris for background, sorted so every process picks the same file for a frame
+    background_files = sorted(os.listdir(config.backgrounds_dir))
     background_paths = []
     for file in background_files:
         background_paths.append(Path(config.backgrounds_dir) / file)
+
+    # hdris are decoded once and swapped on a persistent world node tree
+    backgrounds = BackgroundManager(background_paths, config.hdri_cache_mb * 2**20, config.hdri_preload == 1)
     
     # list of textures for obj mat
-    texture_files = os.listdir(config.textures_dir)
+    texture_files = sorted(os.listdir(config.textures_dir))
     texture_paths = []
     for file in texture_files:
         texture_paths.append(Path(config.textures_dir) / file)
 
-    fib_points = blender_util.fibonacci_sphere(n=num_steps, r=r_camera)
-    random_points = blender_util.random_sphere(n=num_steps, r=r_light)
+    # distractor objects are preallocated once and reused by all frames
+    distractors = DistractorPool(n_distractors_max)
+
+    # materials are made once per texture and reused by all frames and by later jobs of the generation server
+    global material_pool
+    if material_pool is None:
+        material_pool = MaterialPool(texture_paths, config.material_pool_size)
+    else:
+        material_pool.use_textures(texture_paths, config.material_pool_size)
+    # every distractor gets its material now instead of the first frame that shows it
+    for shape_objects in distractors.objects.values():
+        for obj in shape_objects:
+            material_pool.assign(obj, texture_paths[0])
+
+    # objects textured every frame, their order selects the columns of the planned texture indices
+    # parts of the ignore list that are not in the input dir are skipped, joined parts are textured per group
+    ignored = [obj.name for obj in blender_util.static_objects()] or [name for name in ignore if name in bpy.data.objects]
+    textured_objects = [stl_name for stl_name, R, G, B, main_category, sub_category in components.values()] + ignored
+
+    setup.mark('setup.pools')
+
+    # randomized parameters of every frame, camera positions are spread over the whole run
+    if plan_path is None:
+        t0 = time.perf_counter()
+        if n_points is None:
+            n_points = max(n_images, start + num_steps)
+        frame_plan = rplan.make_plan(config, start, num_steps, n_points,
+                                     len(background_paths), len(texture_paths), len(textured_objects))
+        print('Planned {} frames in {:.3f}s'.format(num_steps, time.perf_counter() - t0))
+        frame_plan.save(saver.output_dir / rplan.plan_filename(start, num_steps))
+    else:
+        frame_plan = rplan.Plan.load(plan_path)
+    setup.mark('setup.plan')
+    setup.end()
+    tracer.flush()
 
     # GENERATION LOOP
-    for image_id in range(num_steps):
-
-        # remove old distractors
-        blender_util.remove_distractors()
-
-        # create new set if required
-        if add_distractors == 1:
-            blender_util.create_distractors(r_distractors_min, r_distractors_max, n_distractors_min, n_distractors_max)
-            blender_util.scale_distractors(scale_distractors_min, scale_distractors_max)
-
-        light_color = random.choice([(0.9440666514472968, 0.5833314064014211, 0.8620217891113732), (0.10667940786362784, 0.6366501465055134, 0.8283463249515829), (0.3302847843832679, 0.6345777588778184, 0.1404223675732703), (0.7401648553552618, 0.8317902032242835, 0.10106199897902346), (0.45295583701408515, 0.5915025303641542, 0.6465851385385122), (0.7123306351550376, 0.5129631064977251, 0.21762394723865053), (0.09130264158123913, 0.5537163541914795, 0.16064870877864545), (0.6707118865158586, 0.18080553053619286, 0.6469992264673323), (0.43314508229358095, 0.9122424851506655, 0.11356637786000401), (0.7862445863417918, 0.4991837341778049, 0.8092578403062234), (0.51256704292842, 0.11446145740590452, 0.377651670065407), (0.6092571721767102, 0.9609982643235238, 0.3617614595169364), (0.41775889785188935, 0.5887628033917193, 0.3653242029611167), (0.08168563243279225, 0.20787113902796528, 0.853123892762489), (0.728912072767947, 0.007843865205733658, 0.44430589288037026), (0.4227426992503953, 0.4819567510637641, 0.9994331877106425), (0.43845994505785546, 0.3206641860930485, 0.18213702509162955), (0.14302450174817516, 0.34570045520043546, 0.09624042133049515), (0.06851751916568105, 0.9504095026623458, 0.4436218941396267), (0.44803137650648206, 0.9420336857811692, 0.7011742274582891), (0.9044282823872661, 0.06018959064986862, 0.6672269895484276), (0.17929559468586476, 0.05729827561742895, 0.49895105147336904), (0.7264269847796142, 0.1724740290693172, 0.5732874557940236), (0.23126506532015478, 0.4739532054786436, 0.7826173889280275), (0.9605147974634811, 0.22367623177522433, 0.05426495060923542), (0.9917333698192003, 0.42190722736389363, 0.6050487503476861), (0.05329161480666911, 0.12026604183618406, 0.5627467879416354), (0.7226263870851404, 0.2542508788398701, 0.8884488745881918), (0.6076647881760615, 0.08606657900248538, 0.8287388948003354), (0.5671128089332944, 0.9573173892199068, 0.4108142077323873)])
+    for image_id in range(start, start + num_steps):
+
+        # the frames and the annotation file belong to another process now
+        if stop_file and os.path.exists(stop_file):
+            print('Stopped before frame {}: {} exists'.format(image_id, stop_file), flush=True)
+            tracer.flush()
+            return
+
+        # every mark records the time since the previous one as the named stage of this frame
+        stages = tracer.stages('frame', image_id=image_id)
+
+        # seed every frame from its id so frames do not depend on the frames rendered before
+        zpy.blender.set_seed(blender_util.frame_seed(random_seed, image_id))
+
+        # skip frames completed by a previous run but keep them in the dataset
+        if resume and manifest.is_complete(image_id):
+            rgb_path, iseg_path = add_recorded_frame(saver, manifest, image_id, width, height)
+            events.emit('frame', image_id=image_id, rgb=rgb_path and str(rgb_path), iseg=iseg_path and str(iseg_path),
+                        skipped=True)
+            continue
+
+        # planned parameters of this frame
+        params = frame_plan.frame(image_id)
+        stages.mark('plan')
+
+        # hide old distractors and show the planned set
+        distractors.hide_all()
+        for k in range(params['n_distractors']):
+            distractors.show(rplan.SHAPES[params['distractor_shape'][k]],
+                             Vector(params['distractor_position'][k].tolist()),
+                             Vector(params['distractor_rotation'][k].tolist()),
+                             float(params['distractor_scale'][k]))
+        stages.mark('distractors')
 
         # create light of random color and access through handle
         if light_properties_random == 1:
-            blender_util.create_random_light(intensity_min_light, intensity_max_light, light_color)
+            intensity = int(params['light_intensity'])
+            blender_util.create_random_light(intensity, intensity, tuple(rplan.LIGHT_COLORS[params['light_color']].tolist()))
         else:
             blender_util.create_light(0.5, 0.5, 0.5, 5000)
 
 
         light = bpy.data.objects['PointLight']
         
-        x_cam = fib_points[image_id][0]
-        y_cam = fib_points[image_id][1]
-        z_cam = fib_points[image_id][2]
-        
-        x_light = random_points[image_id][0]
-        y_light = random_points[image_id][1]
-        z_light = random_points[image_id][2]
-        
         if light_position_random == 1:
             # jitter Light
-            light.location = (x_light, y_light, z_light)
+            light.location = tuple(params['light_position'].tolist())
 
         # jitter Camera
-        camera.location = (x_cam,y_cam,z_cam)
+        camera.location = tuple(params['camera_position'].tolist())
 
         
         # make sure obj is always in view of cam
-        zpy.camera.look_at(camera, bpy.data.objects[components[list(components.keys())[0]][0]].location)
+        target = bpy.data.objects[components[list(components.keys())[0]][0]].location
+        zpy.camera.look_at(camera, target)
+        stages.mark('light_camera')
+
+        # cheap visibility estimate before any render time is spent, culled frames are recorded without files
+        if visibility is not None:
+            accepted = frame_visible(visibility, camera, target, image_id, params, distractors)
+            stages.mark('cull')
+            if not accepted:
+                culled += 1
+                manifest.record(image_id)
+                blender_util.remove_lights()
+                events.emit('frame', image_id=image_id, rgb=None, iseg=None, skipped=True, culled=True)
+                stages.end()
+                tracer.flush()
+                continue
         
         # randomize background using locally saved hdris
-        zpy.hdris.load_hdri(random.choice(background_paths))
+        backgrounds.set_background(background_paths[params['hdri']], float(params['hdri_rotation']))
+        stages.mark('background')
         
-        # Add random texture to obj
-        for obj_name, (stl_name, R, G, B, main_category, sub_category) in components.items():
+        # Add random texture to obj, segment again only if the pooled material was recreated
+        textures = params['textures']
+        for j, (obj_name, (stl_name, R, G, B, main_category, sub_category)) in enumerate(components.items()):
             obj = bpy.data.objects[stl_name]
-            texture = zpy.material.make_mat_from_texture(random.choice(texture_paths))
-            zpy.material.set_mat(obj, texture)
-            zpy.objects.segment(obj, name=obj_name, color=(R, G, B))
+            if material_pool.assign(obj, texture_paths[textures[j]]):
+                zpy.objects.segment(obj, name=obj_name, color=(R, G, B))
             zpy.material.jitter(obj.active_material)
 
         # Add random textures of objects to ignore in annots
-        for obj in ignore:
+        for j, obj in enumerate(ignored, start=len(components)):
             obj_ignore = bpy.data.objects[obj]
-            texture_ignore = zpy.material.make_mat_from_texture(random.choice(texture_paths))
-            zpy.material.set_mat(obj_ignore, texture_ignore)
+            material_pool.assign(obj_ignore, texture_paths[textures[j]])
             zpy.material.jitter(obj_ignore.active_material)
 
         # Add random texture to flying distractors
-        for obj in bpy.data.objects:
-            if obj.name.startswith('Cube') or obj.name.startswith('Cylinder') \
-                or obj.name.startswith('Cone') or obj.name.startswith('Torus'):
-                    texture = zpy.material.make_mat_from_texture(random.choice(texture_paths))
-                    zpy.material.set_mat(obj, texture)
+        for obj, texture in zip(distractors.active, params['distractor_textures']):
+            material_pool.assign(obj, texture_paths[texture])
+        stages.mark('textures')
                     
         
         # name images -> based on image id
         rgb_image_name = blender_util.make_rgb_image_name(image_id)
-        iseg_image_name = blender_util.make_iseg_image_name(image_id)
-
-        # render image
-        zpy.render.render_aov(
-            rgb_path = saver.output_dir / rgb_image_name,
-            iseg_path = saver.output_dir / iseg_image_name,
-            width=640,
-            height=640,
-        ) 
+        iseg_image_name = blender_util.make_iseg_image_name(image_id, '.npz' if id_maps else '.png')
+
+        if packed:
+            rgb_path = frame_dir / rgb_image_name
+            iseg_path = frame_dir / iseg_image_name if render_iseg else None
+        else:
+            rgb_path = saver.output_dir / 'rgb' / rgb_image_name
+            iseg_path = saver.output_dir / 'iseg' / iseg_image_name if render_iseg else None
+
+        # segmentation is always rendered as color PNG, id maps are converted from it below
+        iseg_render_path = iseg_path.with_suffix('.png') if iseg_path is not None else None
+
+        # render image, segmentation in a separate single sample pass if the profile asks for it
+        if transparent:
+            render_profile.use_transparent_film()
+        t0 = time.perf_counter()
+        if profile['segmentation'] == 'flat' or iseg_path is None:
+            zpy.render.render_aov(rgb_path=rgb_path, width=width, height=height)
+            elapsed = time.perf_counter() - t0
+            if iseg_path is not None:
+                with render_profile.flat_pass():
+                    zpy.render.render_aov(iseg_path=iseg_render_path, width=width, height=height)
+        else:
+            zpy.render.render_aov(
+                rgb_path = rgb_path,
+                iseg_path = iseg_render_path,
+                width=width,
+                height=height,
+            )
+            elapsed = time.perf_counter() - t0
+        stages.mark('render')
+
+        # replace the color PNG by a single channel component id map
+        if id_maps and iseg_path is not None:
+            instances = labels.instance_map(blender_util.read_image(iseg_render_path), label_table)
+            labels.save_id_map(iseg_path, labels.id_map(instances, len(label_table.names)))
+            os.remove(iseg_render_path)
+            stages.mark('id_map')
+
+        # lower the samples of the next frame if this one ran over budget
+        if budget is not None:
+            budget.update(elapsed)
             
-        # add images to saver object (saver object --> json)
-        saver.add_image(
-            name = rgb_image_name,
-            style='default',
-            output_path=saver.output_dir / rgb_image_name,
-            frame=image_id,
-            width=640,
-            height=640,
-        )
-        saver.add_image(
-            name = iseg_image_name,
-            style='segmentation',
-            output_path=saver.output_dir / iseg_image_name,
-            frame=image_id,
-            width=640,
-            height=640,
-        )
+        # YOLO labels of the projected component meshes
+        if geometric:
+            boxes, present = projection.geometric_boxes(annotated_objs, camera, bpy.context.scene,
+                                                        occlusion_samples=config.occlusion_samples,
+                                                        min_visible=config.min_visible_fraction)
+            yolo_labels = labels.yolo_labels(boxes, present, class_ids, width, height)
+            if not packed:
+                labels.write_labels(labels_dir / labels.label_filename(rgb_image_name), yolo_labels)
+            stages.mark('labels')
+        elif packed:
+            # label the segmentation before it is packed, so the shards are not rewritten after the run
+            if not id_maps:
+                instances = labels.instance_map(blender_util.read_image(iseg_path), label_table)
+            boxes, present = labels.instance_boxes(instances, len(label_table.names))
+            yolo_labels = labels.yolo_labels(boxes, present, label_table.class_ids, width, height)
+            stages.mark('labels')
+
+        if packed:
+            # pack the frame into the current shard, its frames are recorded once the shard is complete
+            members = {'rgb.png': rgb_path}
+            if iseg_path is not None:
+                members['iseg' + iseg_path.suffix] = iseg_path
+            members['txt'] = '\n'.join(yolo_labels).encode('utf-8')
+            record_shard(manifest, writer.add('%06d' % image_id, members))
+            for path in members.values():
+                if isinstance(path, Path):
+                    os.remove(path)
+            events.emit('frame', image_id=image_id, rgb=None, iseg=None, labelled=True, packed=True)
+        else:
+            # add images to saver object and mark the frame complete
+            add_frame(saver, image_id, rgb_path, iseg_path, width, height)
+            if iseg_path is None:
+                manifest.record(image_id, rgb=rgb_image_name)
+            else:
+                manifest.record(image_id, rgb=rgb_image_name, iseg=iseg_image_name)
+
+            # report finished frame so annotation can start while rendering continues
+            events.emit('frame', image_id=image_id, rgb=str(rgb_path), iseg=iseg_path and str(iseg_path),
+                        labelled=geometric)
+        stages.mark('save')
 
         blender_util.remove_lights()
-
-# Get all mesh objects and center them
-mesh_objs = [obj for obj in bpy.data.objects if obj.type == 'MESH']
-       
-blender_util.norm_and_center(mesh_objs)
-blender_util.uv_map()
-
-run()
\ No newline at end of file
+        stages.mark('cleanup')
+        stages.end()
+        tracer.flush()
+
+    # complete the last shard
+    if packed:
+        record_shard(manifest, writer.close())
+        if not os.listdir(frame_dir):
+            os.rmdir(frame_dir)
+
+    # report background cache efficiency
+    print('Background cache: {}'.format(backgrounds.stats()))
+    if visibility is not None:
+        print('Culled {} of {} frames'.format(culled, num_steps))
+
+    # write annotation file, one per shard if the run is split across processes
+    if shard is None:
+        annotation_path = saver.output_dir / dataset.ZUMO_ANNOTATION_FILENAME
+    else:
+        annotation_path = saver.output_dir / dataset.shard_annotation_filename(shard)
+    with tracer.span('annotation_file'):
+        zpy.output_zumo.OutputZUMO(saver).output_annotations(annotation_path=annotation_path)
+    tracer.flush()
+
+# Prepared scenes are cached per content of the STL folder and the settings used to prepare them
+setup = tracer.stages('setup.scene')
+cache_file = None
+if config.asset_cache == 1:
+    cache_dir = os.path.join(ROOT_DIR, config.cache_dir)
+    cache_settings = {'uv_map': 'smart_project', 'stl_loader': 'numpy'}
+    if config.static_batch == 1:
+        cache_settings.update(static_batch=config.static_batch_groups, ignore=sorted(ignore))
+    cache_file = asset_cache.cache_path(cache_dir, asset_cache.scene_key(input_dir, cache_settings))
+
+if cache_file is not None and os.path.exists(cache_file):
+    # Load the imported, centered and uv mapped assembly
+    asset_cache.load_scene(cache_file)
+    setup.mark('setup.load_cache')
+else:
+    # Import STL files from the input directory
+    imported, bounds = blender_util.import_stl_folder(input_dir, config.stl_import_jobs)
+    setup.mark('setup.import')
+
+    # Get all mesh objects and center them
+    mesh_objs = [obj for obj in bpy.data.objects if obj.type == 'MESH']
+
+    blender_util.norm_and_center(mesh_objs, bounds)
+    blender_util.uv_map()
+    setup.mark('setup.prepare')
+
+    # join the ignored parts into a few static meshes
+    if config.static_batch == 1:
+        static_names = {name for name in ignore if name in bpy.data.objects}
+        kept = [obj for obj in imported if obj.name not in static_names]
+        imported = kept + blender_util.join_static([bpy.data.objects[name] for name in sorted(static_names)],
+                                                   config.static_batch_groups)
+        setup.mark('setup.static_batch')
+
+    if cache_file is not None:
+        asset_cache.save_scene(cache_file, imported)
+        setup.mark('setup.save_cache')
+setup.end()
+
+def run_job(job):
+    """Renders a job submitted to the generation server with the resident scene."""
+    job_config = conf.Config(job['config'])
+    job_scene = scene_settings(job_config)
+    changed = [key for key in server_scene if job_scene[key] != server_scene[key]]
+    if changed:
+        raise Exception('job changes {} of the scene prepared by the server, start a server with this config instead'.format(
+            ', '.join(changed)))
+    use_config(job_config, job['start'], job['trace'])
+    num_steps = n_images if job['count'] is None else job['count']
+    run(job['start'], num_steps, None, job['resume'], job['keep_previous'], None, job['profile'])
+
+def serve(address):
+    """Renders the jobs sent by render.py --submit one after another, without loading and preparing the scene again.
+    The events of a job are sent to its client instead of stdout."""
+    with server.listen(address) as listener:
+        print('Generation server listening on {}'.format(address), flush=True)
+        while True:
+            connection, job = listener.accept()
+            with connection:
+                if job.get('stop'):
+                    connection.send({'event': 'job_done', 'code': 0})
+                    return
+                def send(event):
+                    # a client that went away does not stop the job
+                    try:
+                        connection.send(event)
+                    except OSError:
+                        pass
+
+                t0 = time.perf_counter()
+                events.set_sink(send)
+                try:
+                    run_job(job)
+                    result = {'event': 'job_done', 'code': 0}
+                except Exception as e:
+                    traceback.print_exc()
+                    result = {'event': 'job_done', 'code': 1, 'error': repr(e)}
+                finally:
+                    events.set_sink(None)
+                print('Job {} frames {}+{} finished in {:.1f}s'.format(
+                    config.output_dir, job.get('start'), job.get('count'), time.perf_counter() - t0), flush=True)
+                send(result)
+
+if script_args.serve is not None:
+    serve(script_args.serve or config.server_address)
+else:
+    run(script_args.start, n_images if script_args.count is None else script_args.count, script_args.shard,
+        script_args.resume, script_args.keep_previous, script_args.plan, script_args.profile, script_args.stop_file,
+        script_args.points)
\ No newline at end of file
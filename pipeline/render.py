@@ -1,9 +1,22 @@
 import os
 import sys
-import subprocess
+import json
 import argparse
+import tempfile
+import threading
 
+from util import coco
+from util import augment
+from util import composite
 from util import helpers
+from util import dataset
+from util import shard_writer
+from util import timing
+from util import labels
+from util import launcher
+from util import server
+from util import work_queue
+from util import manifest as mf
 from util import config as conf
 
 # set root dir and ensure modules/packages can be imported by script
@@ -19,18 +32,124 @@ CONFIG_PATH = os.path.join(ROOT_DIR,'config.json')
 # Load config file
 config = conf.Config(CONFIG_PATH)
 
-def main(blender_path, python_script, cwd=ROOT_DIR):
+def run_queue(queue_path, blender_path, blender_file, script_path, common_args, workers=1, start=0, on_event=None):
+    """Renders the images as batches of a work queue, see util/work_queue.py.
+    The first process creates the batches, every process (on this or other hosts sharing the output dir)
+    runs workers that claim batches, render them with their own Blender process and retry the ones that
+    crashed, stalled or whose host was lost. The process finishing last merges the annotation files.
+
+    Args:
+        queue_path (str): Path of the queue file.
+        blender_path (str): Path to the blender.exe file.
+        blender_file (str): Path to the .blend file.
+        script_path (str): Path to blenderscript.py.
+        common_args (list): Script arguments passed to every batch.
+        workers (int, optional): Number of concurrent Blender processes on this host. Defaults to 1.
+        start (int, optional): Id of the first image when the queue is created. Defaults to 0.
+        on_event (callable, optional): Called with every event emitted by the Blender processes.
+
+    Returns:
+        int: 0 if all batches were rendered, 1 if some failed for good,
+            None if another process finishes the run.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(queue_path)), exist_ok=True)
+    queue = work_queue.WorkQueue(queue_path, config.queue_lease, config.queue_max_attempts)
+    if queue.finalized():
+        raise Exception('Work queue {} belongs to a finished run, remove it to start a new one'.format(queue_path))
+    if queue.fill(work_queue.batch_ranges(start, config.n_images, config.queue_batch_size)):
+        print('Created work queue {}'.format(queue_path))
+
+    threads = max(1, (os.cpu_count() or 1) // max(1, workers))
+    batches = queue.batches()
+    first_batch = batches[0]['id']
+    # lattice size of the whole run, taken from the queue as processes joining later may see another start
+    n_points = max(b['start'] + b['count'] for b in batches)
+    event_lock = threading.Lock()
+
+    def locked_event(event):
+        # the workers run in threads, the callback only ever sees one event at a time
+        with event_lock:
+            on_event(event)
+
+    def render_batch(batch, index, lost):
+        # frames of an earlier attempt are kept, the annotation file still lists all frames of the batch
+        script_args = common_args + ['--start', batch['start'], '--count', batch['count'], '--shard', batch['id'], '--resume',
+                                     '--points', n_points]
+        if batch['id'] == first_batch and batch['start'] > 0:
+            script_args.append('--keep-previous')
+        # blender stops before its next frame if the batch is handed to another worker meanwhile
+        stop_file = os.path.join(tempfile.gettempdir(), 'blendr-stop-%d-%d-%d' % (os.getpid(), index, batch['id']))
+        if os.path.exists(stop_file):
+            os.remove(stop_file)
+        script_args += ['--stop-file', stop_file]
+        command = launcher.blender_command(blender_path, blender_file, script_path, script_args, threads)
+        code = launcher.run_blender(command, on_event=locked_event if on_event else None,
+                                    stall_timeout=config.stall_timeout or None, stop=lost, stop_file=stop_file)
+        if lost.is_set():
+            return 'claim lost'
+        if code:
+            return 'blender exited with code {}'.format(code)
+
+        manifest = mf.Manifest(config.output_dir, readonly=True)
+        missing = [i for i in range(batch['start'], batch['start'] + batch['count']) if not manifest.is_complete(i)]
+        if missing:
+            return '{} frames missing, first {}'.format(len(missing), missing[0])
+        if not os.path.exists(os.path.join(config.output_dir, dataset.shard_annotation_filename(batch['id']))):
+            return 'annotation file missing'
+        return None
+
+    work_queue.run_workers(queue, render_batch, workers, config.queue_heartbeat)
+
+    # only one process post-processes the run
+    if not queue.claim_finalize(work_queue.worker_name()):
+        return None
+    batches = queue.batches()
+    failed = [b for b in batches if b['state'] == 'failed']
+    for b in failed:
+        print('Batch {} (frames {}..{}) failed: {}'.format(b['id'], b['start'], b['start'] + b['count'] - 1, b['error']))
+
+    # merge the annotation files of the rendered batches
+    shard_files = [os.path.join(config.output_dir, dataset.shard_annotation_filename(b['id'])) for b in batches if b['state'] == 'done']
+    if shard_files:
+        dataset.merge_zumo_annotations(shard_files, os.path.join(config.output_dir, dataset.ZUMO_ANNOTATION_FILENAME))
+        for f in shard_files:
+            os.remove(f)
+    return 1 if failed else 0
+
+
+def main(blender_path, python_script, cwd=ROOT_DIR, on_event=None, shards=1, start=0, resume=False, profile=None,
+         trace=False, queue_path=None, server_address=None, config_path=None):
     """Main function that runs the Blender process using the provided blender path, script path and working directory.
+    With shards > 1 the images are split into disjoint id ranges rendered by concurrent Blender processes,
+    whose annotation files are merged into one dataset afterwards. With a queue path the images are rendered
+    as batches of a fault tolerant work queue instead, see run_queue. With a server address the images are
+    rendered as a job of a running generation server, which keeps the prepared scene between jobs.
 
     Args:
         blender_path (str): Path to the blender.exe file.
         python_script (str): Path to the python script that will be used in blender.
         cwd (str, optional): The current working directory, default is ROOT_DIR.
+        on_event (callable, optional): Called with every event emitted by the script, e.g. finished frames.
+        shards (int, optional): Number of concurrent Blender processes, default is 1.
+        start (int, optional): Id of the first image, images already in the output dir are kept if > 0. Default is 0.
+        resume (bool, optional): Skip frames completed by a previous run, default is False.
+        profile (str, optional): Render profile from config.json, default is the configured one.
+        trace (bool, optional): Write timing spans of the loop stages to <output_dir>/_trace, default is False.
+        queue_path (str, optional): Work queue file shared by the processes of the run, default is None.
+        server_address (str, optional): 'host:port' of a generation server to submit the job to, default is None.
+        config_path (str, optional): Config passed to the Blender processes, default is config.json of the script.
 
     Returns:
-        None
+        int: Return code of the Blender process, the first non-zero one if sharded,
+            1 if a shard exited without writing its annotation file.
+            None if the run uses a work queue and is finished by another process.
     """
 
+    # jobs of a running generation server skip the startup of Blender
+    if server_address:
+        job = server.make_job(config.data, start, config.n_images, resume, start > 0, profile, trace)
+        return server.submit(server_address, job, on_event)
+
     # Set the directory 
     dir_path = cwd
 
@@ -45,8 +164,59 @@ def main(blender_path, python_script, cwd=ROOT_DIR):
         raise Exception('Python script not found: {}'.format(script_path))
 
     # Define the arguments to be passed to blender.exe and run
-    args = [blender_path, '-b', blender_file, '--python', script_path]
-    subprocess.run(args)
+    # Arguments shared by all blender processes
+    common_args = []
+    if config_path:
+        common_args += ['--config', config_path]
+    if resume:
+        common_args.append('--resume')
+    if profile:
+        common_args += ['--profile', profile]
+    if trace:
+        common_args.append('--trace')
+
+    # written once for all processes of a split run, their shard indices or batch ids do not tell the first one
+    if config.segmentation_format == 'ids' and (queue_path or shards > 1):
+        os.makedirs(config.output_dir, exist_ok=True)
+        labels.write_id_mapping(os.path.join(config.output_dir, labels.ID_MAPPING_FILENAME), config.components)
+
+    if queue_path:
+        return run_queue(queue_path, blender_path, blender_file, script_path, common_args, shards, start, on_event)
+
+    if shards <= 1:
+        script_args = common_args + ['--start', start, '--count', config.n_images]
+        if start > 0:
+            script_args.append('--keep-previous')
+        args = launcher.blender_command(blender_path, blender_file, script_path, script_args)
+        return launcher.run_blender(args, on_event=on_event)
+
+    # Split the image ids and the cores between the shards
+    ranges = launcher.shard_ranges(config.n_images, shards)
+    threads = max(1, (os.cpu_count() or 1) // len(ranges))
+    commands = []
+    for shard, (shard_start, count) in enumerate(ranges):
+        # every shard samples the camera and light lattices of the whole run
+        script_args = common_args + ['--start', start + shard_start, '--count', count, '--shard', shard,
+                                     '--points', start + config.n_images]
+        # the first shard carries the frames of previous runs when appending
+        if shard == 0 and start > 0:
+            script_args.append('--keep-previous')
+        commands.append(launcher.blender_command(blender_path, blender_file, script_path, script_args, threads))
+    return_codes = launcher.run_blenders(commands, on_event=on_event)
+
+    # Merge the annotation files written by the shards
+    shard_files = [os.path.join(config.output_dir, dataset.shard_annotation_filename(shard)) for shard in range(len(ranges))]
+    missing = [f for f in shard_files if not os.path.exists(f)]
+    if missing:
+        print('Shard annotation files missing, not merging: {}'.format(missing))
+        # a shard that exited with code 0 but wrote no annotation file still failed
+        return next((code for code in return_codes if code), 1)
+    else:
+        dataset.merge_zumo_annotations(shard_files, os.path.join(config.output_dir, dataset.ZUMO_ANNOTATION_FILENAME))
+        for f in shard_files:
+            os.remove(f)
+
+    return next((code for code in return_codes if code), 0)
 
     
 # Set up the argument parser for the script cmd line args
@@ -54,24 +224,183 @@ parser = argparse.ArgumentParser(description='Render Modeldata via Blender')
 parser.add_argument('-bp', '--blender-path', help='path for blender.exe', default=BP_DEFAULT, required=False)
 parser.add_argument('-s', '--python-script', help='path for py script to be used in blender', default=S_DEFAULT, required=False)
 parser.add_argument('-wd', '--working-dir', help='working dir if not cwd', default=ROOT_DIR)
+parser.add_argument('-n', '--shards', help='number of concurrent blender processes', type=int, default=1)
+parser.add_argument('--queue', help='render batches of a work queue shared with other render.py processes (default: <output_dir>/_queue.sqlite)',
+                    nargs='?', const='', default=None)
+parser.add_argument('-p', '--profile', help='render profile from config.json (default: render_settings.profile)', default=None)
+parser.add_argument('--resume', help='skip frames completed by a previous run of the same dataset', action='store_true')
+parser.add_argument('--append', help='add n_images new frames to an existing dataset', action='store_true')
+parser.add_argument('--stream', help='annotate frames while blender is still rendering', action='store_true')
+parser.add_argument('--coco', help='also export COCO instance masks as rle or polygon segmentation', nargs='?', const='rle', choices=['rle', 'polygon'], default=None)
+parser.add_argument('--composite', help='blend every transparent frame onto N backgrounds from backgrounds_dir into <output_dir>/composited (default: composite.backgrounds)', nargs='?', type=int, const=0, default=None, metavar='N')
+parser.add_argument('--augment', help='write K augmented variants of every labelled frame to <output_dir>/augmented (default: augment.variants)', nargs='?', type=int, const=0, default=None, metavar='K')
+parser.add_argument('--trace', help='record timing spans of blender and post-processing stages in <output_dir>/_trace', action='store_true')
+parser.add_argument('--progress', help='print progress and ETA while rendering', action='store_true')
+parser.add_argument('--set', help='override a config value, e.g. --set render_settings.n_images=200', action='append', default=[], metavar='KEY=VALUE')
+parser.add_argument('--serve', help='start a generation server that keeps the prepared scene for submitted jobs (default: server_address)',
+                    nargs='?', const='', default=None)
+parser.add_argument('--submit', help='render as a job of a running generation server (default: server_address)', nargs='?', const='', default=None)
+parser.add_argument('--stop-server', help='stop the generation server after its current job', action='store_true')
+parser.add_argument('-j', '--jobs', help='number of worker processes for annotation (default: one per cpu)', type=int, default=None)
 
 args = parser.parse_args()
 
 # Check if the script is being run as the main module
 if __name__ == '__main__':
 
-    # generate synthetic dataset
-    main(args.blender_path, args.python_script, args.working_dir)
+    # config overrides are written next to the dataset and passed to the blender processes
+    config_path = None
+    if args.set:
+        config = conf.Config(conf.apply_overrides(config.data, args.set))
+        os.makedirs(config.output_dir, exist_ok=True)
+        config_path = os.path.join(config.output_dir, '_config.json')
+        with open(config_path, 'w') as f:
+            json.dump(config.data, f, indent=4)
+
+    # generation server, runs until stopped
+    if args.serve is not None:
+        blender_file = os.path.join(args.working_dir, 'renderfile.blend')
+        script_args = ['--serve', args.serve or config.server_address]
+        if config_path:
+            script_args += ['--config', config_path]
+        sys.exit(launcher.run_blender(launcher.blender_command(args.blender_path, blender_file, args.python_script, script_args)))
+    if args.stop_server:
+        server.stop(args.submit or config.server_address)
+        sys.exit(0)
 
-    # move rgb and iseg images to folders
-    helpers.move_images_to_folder(config.output_dir)
-    
     # define labels and iseg path
-    labels_path = os.path.join(config.output_dir, 'labels')    
+    labels_path = os.path.join(config.output_dir, 'labels')
     iseg_path = os.path.join(config.output_dir, 'iseg')
 
-    # Create the 'labels' folder
-    os.makedirs(labels_path)
+    # new frames get ids after the ones recorded in the manifest when appending
+    start = mf.Manifest(config.output_dir).next_id() if args.append else 0
+    # optional timing spans, written next to the ones of the blender processes
+    trace = args.trace or config.trace == 1
+    trace_dir = os.path.join(config.output_dir, timing.TRACE_DIRNAME)
+    if trace and os.path.isdir(trace_dir):
+        for f in os.listdir(trace_dir):
+            os.remove(os.path.join(trace_dir, f))
+    tracer = timing.Tracer(os.path.join(trace_dir, 'render.jsonl') if trace else None, 'render.py')
+
+    # progress and ETA are read from the frame events of the blender processes
+    progress = timing.Progress(config.n_images) if trace or args.progress else None
+    on_progress = progress.on_event if progress else None
+
+    # with a work queue several processes, also on other hosts, render the batches of one run
+    queue_path = None
+    if args.queue is not None:
+        queue_path = args.queue or os.path.join(config.output_dir, work_queue.QUEUE_FILENAME)
+    server_address = None
+    if args.submit is not None:
+        server_address = args.submit or config.server_address
+    run_args = dict(shards=args.shards, start=start, resume=args.resume or args.append, profile=args.profile, trace=trace,
+                    queue_path=queue_path, server_address=server_address, config_path=config_path)
+
+    def render(on_event):
+        """Runs the Blender processes, exits if another process finishes the queued run."""
+        code = main(args.blender_path, args.python_script, args.working_dir, on_event=on_event, **run_args)
+        if code is None:
+            print('All batches are finished, the annotation is done by the process that finished last')
+            sys.exit(0)
+        return code
+
+    # frames are rendered into rgb/ and iseg/ directly, or packed into tar shards
+    packed = config.output_format == 'tar'
+    if args.stream and packed:
+        print('--stream has no effect with output_format tar, blender labels the frames as it packs them')
+    if args.stream and queue_path:
+        print('--stream has no effect with --queue, frames are annotated after all batches are finished')
+
+    if args.stream and not packed and not queue_path:
+        # annotate every frame as soon as blender reports it finished
+        os.makedirs(labels_path, exist_ok=True)
+        with tracer.span('blender'), \
+                helpers.StreamingAnnotator(labels_path, config.components, jobs=args.jobs) as annotator:
+            code = render(timing.chain(annotator.on_event, on_progress))
+        failures = annotator.failures
+    elif packed:
+        # generate synthetic dataset
+        with tracer.span('blender'):
+            code = render(on_progress)
+
+        # blender packs the labels with the frames, only shards of earlier versions are labelled here
+        shards_path = os.path.join(config.output_dir, 'shards')
+        failures = []
+        if config.annotation_mode != 'geometric':
+            with tracer.span('annotate'):
+                failures = helpers.annotate_tar_shards(shards_path, config.components, jobs=args.jobs)
+        with tracer.span('index'):
+            shard_writer.write_index(shards_path, os.path.join(config.output_dir, 'shards.json'))
+    else:
+        # generate synthetic dataset
+        with tracer.span('blender'):
+            code = render(on_progress)
+
+        # Create the 'labels' folder
+        os.makedirs(labels_path, exist_ok=True)
+
+        # Extract bbox annots from iseg images, geometric labels were written by blender already
+        failures = []
+        if config.annotation_mode != 'geometric':
+            with tracer.span('annotate'):
+                failures = helpers.extract_bbox_annots(iseg_path, labels_path, config.components, jobs=args.jobs)
+
+    # failed files of every post-processing stage, reported at the end
+    stage_failures = {'Annotation': failures}
+
+    # export instance masks of the iseg images or id maps
+    if args.coco and packed:
+        print('--coco needs output_format files, skipping the COCO export')
+    elif args.coco:
+        with tracer.span('coco'):
+            stage_failures['COCO export'] = coco.export_coco(iseg_path, os.path.join(config.output_dir, coco.COCO_ANNOTATION_FILENAME),
+                                                             config.components, mode=args.coco, jobs=args.jobs)
+
+    # alpha matted frames blended onto several backgrounds each, reusing their labels
+    images_path = os.path.join(config.output_dir, 'rgb')
+    if args.composite is not None and packed:
+        print('--composite needs output_format files, skipping the compositing')
+    elif args.composite is not None:
+        if config.transparent != 1:
+            print('--composite needs frames rendered with render_settings.transparent: 1')
+        settings = dict(config.composite)
+        if args.composite:
+            settings['backgrounds'] = args.composite
+        composited_path = os.path.join(config.output_dir, composite.COMPOSITED_DIRNAME)
+        with tracer.span('composite'):
+            stage_failures['Compositing'] = composite.composite_dataset(images_path, labels_path, config.backgrounds_dir,
+                                                                        composited_path, settings, seed=config.random_seed, jobs=args.jobs)
+        # the transparent frames themselves are no training images, augment the composites instead
+        images_path = os.path.join(composited_path, 'images')
+        labels_path = os.path.join(composited_path, 'labels')
+
+    # photometric and geometric variants of the labelled frames
+    if args.augment is not None and packed:
+        print('--augment needs output_format files, skipping the augmentation')
+    elif args.augment is not None:
+        settings = dict(config.augment)
+        if args.augment:
+            settings['variants'] = args.augment
+        with tracer.span('augment'):
+            stage_failures['Augmentation'] = augment.augment_dataset(images_path, labels_path,
+                                                                     os.path.join(config.output_dir, augment.AUGMENTED_DIRNAME),
+                                                                     settings, seed=config.random_seed, jobs=args.jobs)
+
+    # per stage summary of all processes and a trace viewable in chrome://tracing
+    if trace:
+        tracer.flush()
+        spans = timing.read_spans(trace_dir)
+        timing.write_chrome_trace(spans, os.path.join(trace_dir, 'trace.json'))
+        summary = timing.summarize(spans)
+        with open(os.path.join(trace_dir, 'summary.json'), 'w') as f:
+            json.dump(summary, f, indent=4)
+        print(timing.format_summary(summary))
+
+    for stage, failures in stage_failures.items():
+        for filename, error in failures:
+            print('{} failed for {}: {}'.format(stage, filename, error))
 
-    # Extract bbox annots from iseg images
-    helpers.extract_bbox_annots(iseg_path, labels_path)
\ No newline at end of file
+    # the frames that were rendered are processed anyway, but a failed shard or batch fails the run
+    if code:
+        print('Rendering failed with code {}'.format(code))
+        sys.exit(code)
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# tests import the pipeline modules the way render.py does, from the pipeline dir
+PIPELINE_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, PIPELINE_DIR)
+
+# example renders of the repository, iseg colors match the components of config.json
+EXAMPLES_DIR = os.path.join(os.path.dirname(PIPELINE_DIR), 'examples')
+
+
+@pytest.fixture
+def fake_bpy():
+    """Installs fresh fake bpy, zpy and mathutils modules and returns their stats recorder.
+    util modules importing bpy are dropped, so tests import them again against the fake.
+    """
+    from benchmarks import fake_blender
+    stats = fake_blender.install()
+    package = sys.modules.get('util')
+    for name in [m for m in sys.modules if m.startswith('util.')]:
+        if hasattr(sys.modules[name], 'bpy'):
+            del sys.modules[name]
+            if package is not None and hasattr(package, name[len('util.'):]):
+                delattr(package, name[len('util.'):])
+    return stats
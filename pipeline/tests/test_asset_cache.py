@@ -0,0 +1,23 @@
+import os
+
+
+def test_scene_key_follows_content_and_settings(fake_bpy, tmp_path):
+    from util import asset_cache
+
+    stl_dir = tmp_path / 'stl'
+    os.makedirs(str(stl_dir))
+    (stl_dir / 'a.stl').write_bytes(b'solid a')
+    (stl_dir / 'b.stl').write_bytes(b'solid b')
+    settings = {'uv_map': 'smart_project', 'stl_loader': 'numpy'}
+
+    key = asset_cache.scene_key(str(stl_dir), settings)
+    assert key == asset_cache.scene_key(str(stl_dir), dict(reversed(list(settings.items()))))
+    assert key != asset_cache.scene_key(str(stl_dir), dict(settings, static_batch=8))
+
+    (stl_dir / 'b.stl').write_bytes(b'solid b changed')
+    changed = asset_cache.scene_key(str(stl_dir), settings)
+    assert changed != key
+    os.rename(str(stl_dir / 'b.stl'), str(stl_dir / 'c.stl'))
+    assert asset_cache.scene_key(str(stl_dir), settings) != changed
+
+    assert asset_cache.cache_path('cache', key) == os.path.join('cache', 'scene_%s.blend' % key)
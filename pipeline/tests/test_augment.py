@@ -0,0 +1,58 @@
+import os
+
+import cv2
+import numpy as np
+
+from util import augment
+from util import labels
+
+
+def make_frames(folder, n=5, size=(48, 64)):
+    os.makedirs(folder / 'rgb')
+    os.makedirs(folder / 'labels')
+    rng = np.random.default_rng(0)
+    for i in range(n):
+        name = 'rgb_image_%06d.png' % i
+        cv2.imwrite(str(folder / 'rgb' / name), rng.integers(0, 256, size + (3,), dtype=np.uint8))
+        boxes = np.array([[8, 4, 24, 20], [30, 10, 60, 40]])
+        labels.write_labels(str(folder / 'labels' / labels.label_filename(name)),
+                            labels.yolo_labels(boxes, np.array([True, True]), np.array([0, 1]), size[1], size[0]))
+
+
+def test_flip_moves_boxes():
+    images = np.zeros((1, 10, 20, 3), np.uint8)
+    images[0, :, :5] = 255
+    settings = dict(augment.DEFAULTS, hflip=1.0, scale=[1.0, 1.0])
+    [(box, keep)] = augment.geometric(images, [np.array([[0.0, 0.0, 0.25, 1.0]])], np.random.default_rng(0), settings)
+    assert np.allclose(box, [[0.75, 0.0, 1.0, 1.0]]) and keep.all()
+    assert images[0, :, -5:].min() == 255 and images[0, :, :-5].max() == 0
+
+
+def test_crop_drops_boxes_that_leave_the_image():
+    images = np.zeros((1, 100, 100, 3), np.uint8)
+    settings = dict(augment.DEFAULTS, hflip=0.0, scale=[0.6, 0.6])
+    boxes = np.array([[0.0, 0.0, 1.0, 1.0], [0.0, 0.0, 0.01, 0.01], [0.99, 0.99, 1.0, 1.0]])
+    for seed in range(20):
+        [(box, keep)] = augment.geometric(images, [boxes], np.random.default_rng(seed), settings)
+        # a crop keeps 0.36 of the image, above min_visible
+        assert keep[0] and np.allclose(box[0], [0, 0, 1, 1])
+        # tiny boxes in opposite corners cannot both be inside the crop
+        assert not (keep[1] and keep[2])
+
+
+def test_results_do_not_depend_on_jobs(tmp_path):
+    make_frames(tmp_path)
+    outputs = []
+    for jobs in (1, 2):
+        output = tmp_path / ('out%d' % jobs)
+        failures = augment.augment_dataset(str(tmp_path / 'rgb'), str(tmp_path / 'labels'), str(output),
+                                           seed=3, jobs=jobs, chunksize=2)
+        assert failures == []
+        outputs.append(output)
+
+    names = sorted(os.listdir(outputs[0] / 'images'))
+    assert len(names) == 5 * augment.DEFAULTS['variants']
+    for name in names:
+        assert (cv2.imread(str(outputs[0] / 'images' / name)) == cv2.imread(str(outputs[1] / 'images' / name))).all()
+        label = os.path.splitext(name)[0] + '.txt'
+        assert (outputs[0] / 'labels' / label).read_text() == (outputs[1] / 'labels' / label).read_text()
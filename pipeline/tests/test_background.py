@@ -0,0 +1,29 @@
+def test_backgrounds_are_cached_and_evicted(fake_bpy, tmp_path):
+    import bpy
+    from util.background import BackgroundManager
+
+    paths = [str(tmp_path / ('hdri_%d.hdr' % i)) for i in range(3)]
+    manager = BackgroundManager(paths)
+    for path in paths + paths:
+        manager.set_background(path, 0.5)
+    assert manager.stats()['misses'] == 3 and manager.stats()['hits'] == 3
+    assert len(bpy.data.images) == 3
+    assert manager._env.image.filepath == paths[-1]
+
+    # room for a single background: every switch evicts the previous one
+    size = manager.stats()['bytes'] // 3
+    small = BackgroundManager(paths, max_bytes=size)
+    for path in paths:
+        small.set_background(path)
+    assert small.stats()['cached'] == 1 and small.stats()['evictions'] == 2
+
+
+def test_world_nodes_are_built_once(fake_bpy, tmp_path):
+    import bpy
+    from util.background import BackgroundManager
+
+    BackgroundManager([])
+    nodes = len(bpy.context.scene.world.node_tree.nodes)
+    manager = BackgroundManager([str(tmp_path / 'a.hdr')], preload=True)
+    assert len(bpy.context.scene.world.node_tree.nodes) == nodes
+    assert manager.stats()['misses'] == 1
@@ -0,0 +1,57 @@
+import numpy as np
+
+from util import coco
+
+
+def decode_rle(counts, shape):
+    """Decodes a compressed COCO RLE string like pycocotools' rleFrString and rleDecode."""
+    runs, pos = [], 0
+    while pos < len(counts):
+        x, shift, more = 0, 0, True
+        while more:
+            byte = ord(counts[pos]) - 48
+            x |= (byte & 0x1f) << 5 * shift
+            more = byte & 0x20
+            pos += 1
+            shift += 1
+            if not more and byte & 0x10:
+                x |= -1 << 5 * shift
+        if len(runs) > 2:
+            x += runs[-2]
+        runs.append(x)
+    flat = np.repeat(np.arange(len(runs)) % 2, runs).astype(bool)
+    return flat.reshape(shape, order='F')
+
+
+def test_rle_round_trip():
+    rng = np.random.default_rng(0)
+    for shape in [(1, 1), (7, 5), (64, 48), (300, 200)]:
+        for density in (0.0, 0.02, 0.5, 1.0):
+            mask = rng.random(shape) < density
+            string = coco.rle_string(coco.rle_counts(mask))
+            assert (decode_rle(string, shape) == mask).all()
+
+
+def test_rle_starts_with_zeros():
+    mask = np.ones((2, 2), bool)
+    assert coco.rle_counts(mask).tolist() == [0, 4]
+
+
+def test_image_instances_drop_fragments_and_split_blobs():
+    instances = np.full((50, 60), -1, dtype=np.int32)
+    instances[5:15, 10:30] = 0
+    instances[30:40, 40:50] = 0
+    instances[45:47, 2:4] = 0     # speck below min_area
+    instances[20:22, 20:22] = 1   # component made of a speck only
+    class_ids = np.array([3, 4])
+
+    merged = coco.image_instances(instances, class_ids)
+    assert len(merged) == 1
+    assert merged[0]['category_id'] == 4
+    assert merged[0]['bbox'] == [10, 5, 40, 35]
+    assert merged[0]['area'] == 300
+    mask = decode_rle(merged[0]['segmentation']['counts'], instances.shape)
+    assert mask.sum() == 300 and not mask[45:47, 2:4].any()
+
+    blobs = coco.image_instances(instances, class_ids, split_blobs=True)
+    assert sorted(a['bbox'] for a in blobs) == [[10, 5, 20, 10], [40, 30, 10, 10]]
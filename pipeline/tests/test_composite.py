@@ -0,0 +1,59 @@
+import os
+
+import cv2
+import numpy as np
+
+from util import composite
+from util import labels
+
+
+def test_blend_uses_straight_alpha():
+    foregrounds = np.zeros((2, 1, 3, 4), np.uint8)
+    foregrounds[..., :3] = 200
+    foregrounds[..., 3] = [[[0, 255, 128]], [[255, 255, 255]]]
+    backgrounds = np.full((2, 1, 3, 3), 100, np.uint8)
+    images = composite.blend(foregrounds, backgrounds)
+    assert images[0, 0, :, 0].tolist() == [100, 200, 150]
+    assert (images[1] == 200).all()
+
+
+def test_background_crop_keeps_the_frame_size():
+    background = np.arange(300 * 400 * 3, dtype=np.uint32).reshape(300, 400, 3).astype(np.uint8)
+    settings = dict(composite.DEFAULTS, scale=[1.0, 1.0], hflip=0.0)
+    crop = composite.background_crop(background, 64, 48, np.random.default_rng(0), settings)
+    assert crop.shape == (48, 64, 3)
+    for seed in range(5):
+        assert composite.background_crop(background, 30, 90, np.random.default_rng(seed), composite.DEFAULTS).shape == (90, 30, 3)
+
+
+def test_unreadable_backgrounds_are_skipped(tmp_path):
+    composite.load_background.cache_clear()
+    (tmp_path / 'broken.png').write_bytes(b'not an image')
+    cv2.imwrite(str(tmp_path / 'good.png'), np.full((20, 20, 3), 7, np.uint8))
+    paths = [str(tmp_path / 'broken.png'), str(tmp_path / 'good.png')]
+    for seed in range(5):
+        assert (composite.pick_background(paths, 0, np.random.default_rng(seed)) == 7).all()
+
+
+def test_composite_dataset_with_hdr_backgrounds(tmp_path):
+    composite.load_background.cache_clear()
+    for folder in ('rgb', 'labels', 'backgrounds'):
+        os.makedirs(tmp_path / folder)
+    frame = np.zeros((32, 32, 4), np.uint8)
+    frame[8:24, 8:24] = (0, 0, 255, 255)
+    cv2.imwrite(str(tmp_path / 'rgb' / 'rgb_image_000000.png'), frame)
+    labels.write_labels(str(tmp_path / 'labels' / 'rgb_image_000000.txt'), ['0 0.5 0.5 0.5 0.5'])
+    try:
+        cv2.imwrite(str(tmp_path / 'backgrounds' / 'sky.exr'), np.full((40, 40, 3), 0.5, np.float32))
+    except cv2.error:
+        # OpenCV built without OpenEXR, the file cannot be read and has to be skipped
+        (tmp_path / 'backgrounds' / 'sky.exr').write_bytes(b'v/1\x01')
+    cv2.imwrite(str(tmp_path / 'backgrounds' / 'sky.hdr'), np.full((40, 40, 3), 0.5, np.float32))
+
+    output = tmp_path / 'composited'
+    failures = composite.composite_dataset(str(tmp_path / 'rgb'), str(tmp_path / 'labels'), str(tmp_path / 'backgrounds'),
+                                           str(output), {'backgrounds': 2})
+    assert failures == []
+    image = cv2.imread(str(output / 'images' / 'rgb_image_000000_1.png'))
+    assert image[16, 16].tolist() == [0, 0, 255] and image[0, 0].tolist() != [0, 0, 0]
+    assert (output / 'labels' / 'rgb_image_000000_2.txt').read_text().strip() == '0 0.5 0.5 0.5 0.5'
@@ -0,0 +1,26 @@
+import os
+
+from benchmarks import bench_blenderscript
+from util import manifest as mf
+
+
+def run(folder, n_images, overrides):
+    config_path = bench_blenderscript.make_config(str(folder), n_images, n_textures=5, n_backgrounds=2,
+                                                  overrides=overrides)
+    stats, _, _ = bench_blenderscript.run_script(config_path)
+    return stats, mf.Manifest(os.path.join(str(folder), 'output'), readonly=True)
+
+
+def test_culled_frames_are_recorded_without_render(tmp_path):
+    # every component fully visible is more than most views of the scene show
+    stats, manifest = run(tmp_path, 10, {'cull_min_visible': 1.0, 'cull_min_components': 1.0, 'cull_retries': 0})
+    assert sorted(manifest.frames) == list(range(10))
+    culled = [image_id for image_id, files in manifest.frames.items() if not files]
+    assert culled
+    assert len(stats.renders) == 10 - len(culled)
+
+
+def test_no_culling_renders_every_frame(tmp_path):
+    stats, manifest = run(tmp_path, 10, {'cull_min_visible': 0.0})
+    assert len(stats.renders) == 10
+    assert all(files for files in manifest.frames.values())
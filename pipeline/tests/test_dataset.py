@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from util import dataset
+
+
+def write_shard(path, image_ids):
+    annotations = {
+        'metadata': {'description': 'DR dataset', 'num_images': len(image_ids), 'num_annotations': len(image_ids)},
+        'categories': {'0': {'id': 0, 'name': 'frame'}},
+        'images': {str(i): {'id': i, 'name': 'rgb_image_%06d.png' % i} for i in image_ids},
+        'annotations': [{'id': n, 'image_id': i, 'category_id': 0} for n, i in enumerate(image_ids)],
+    }
+    with open(path, 'w') as f:
+        json.dump(annotations, f)
+    return str(path)
+
+
+def test_merge_renumbers_images_in_shard_order(tmp_path):
+    files = [write_shard(tmp_path / dataset.shard_annotation_filename(0), [0, 1, 2]),
+             write_shard(tmp_path / dataset.shard_annotation_filename(1), [0, 1])]
+    output = str(tmp_path / dataset.ZUMO_ANNOTATION_FILENAME)
+    merged = dataset.merge_zumo_annotations(files, output)
+
+    assert [image['name'] for image in merged['images'].values()] == \
+        ['rgb_image_%06d.png' % i for i in (0, 1, 2, 0, 1)]
+    assert list(merged['images']) == [0, 1, 2, 3, 4]
+    assert [a['image_id'] for a in merged['annotations']] == [0, 1, 2, 3, 4]
+    assert [a['id'] for a in merged['annotations']] == [0, 1, 2, 3, 4]
+    assert merged['metadata']['num_images'] == 5
+    with open(output) as f:
+        assert json.load(f)['metadata']['num_annotations'] == 5
+
+
+def test_merge_needs_files(tmp_path):
+    with pytest.raises(ValueError):
+        dataset.merge_zumo_annotations([], str(tmp_path / 'out.json'))
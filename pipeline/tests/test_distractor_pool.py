@@ -0,0 +1,24 @@
+def test_distractors_are_reused_across_frames(fake_bpy):
+    import bpy
+    from util.distractor_pool import DistractorPool
+
+    pool = DistractorPool(3)
+    objects = len(bpy.data.objects)
+    meshes = len(bpy.data.meshes)
+    assert sum(len(objs) for objs in pool.objects.values()) == 3 * len(DistractorPool.SHAPES)
+
+    for frame in range(5):
+        pool.hide_all()
+        shown = [pool.show('cube', (frame, 0, 0), (0, 0, 0), 0.5), pool.show('cube', (0, frame, 0), (0, 0, 0)),
+                 pool.show('torus', (0, 0, frame), (0, 0, 0))]
+        assert pool.active == shown
+        assert len({obj.name for obj in shown}) == 3
+        assert all(not obj.hide_render for obj in shown)
+        assert sum(not obj.hide_render for obj in pool.collection.objects) == 3
+    assert shown[0].scale == (0.5, 0.5, 0.5)
+
+    # a second pool, e.g. of the next job of the generation server, takes over the same objects
+    again = DistractorPool(3)
+    assert again.objects['cube'][0] is pool.objects['cube'][0]
+    assert len(bpy.data.objects) == objects and len(bpy.data.meshes) == meshes
+    assert not any(not obj.hide_render for obj in again.collection.objects)
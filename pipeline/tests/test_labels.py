@@ -0,0 +1,97 @@
+import glob
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+from conftest import EXAMPLES_DIR, PIPELINE_DIR
+from util import helpers
+from util import labels
+
+with open(os.path.join(PIPELINE_DIR, 'config.json')) as f:
+    COMPONENTS = json.load(f)['components']
+
+EXAMPLES = sorted(glob.glob(os.path.join(EXAMPLES_DIR, 'iseg_image_*.png')))
+
+
+def contour_labels(image, components, min_area=30):
+    """YOLO labels as computed by the original contour based extraction, one box per color."""
+    class_ids = labels.category_ids(components)
+    yolo_labels = []
+    for c in components:
+        color = tuple(labels.to_uint8(c[k]) for k in ('B', 'G', 'R'))
+        mask = cv2.inRange(image, color, color)
+        contours, hierarchy = cv2.findContours(mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+        boxes = []
+        for i, contour in enumerate(contours):
+            # holes inside another contour
+            if hierarchy[0][i][3] != -1:
+                continue
+            x, y, w, h = cv2.boundingRect(contour)
+            if w * h < min_area:
+                continue
+            boxes.append((x, y, x + w, y + h))
+        if boxes:
+            boxes = np.array(boxes)
+            box = np.array([[boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max()]])
+            yolo_labels += labels.yolo_labels(box, np.array([True]), np.array([class_ids[c['category']]]),
+                                              image.shape[1], image.shape[0])
+    return yolo_labels
+
+
+@pytest.mark.parametrize('path', EXAMPLES, ids=os.path.basename)
+def test_labels_match_contour_extraction(path):
+    image = cv2.imread(path)
+    table = labels.build_label_table(COMPONENTS)
+    assert helpers.annotate_iseg_image(image, table) == contour_labels(image, COMPONENTS)
+
+
+@pytest.mark.parametrize('path', EXAMPLES, ids=os.path.basename)
+def test_labels_without_opencv_match(path, monkeypatch):
+    # blender labels packed frames with the numpy fragment search
+    image = cv2.imread(path)
+    table = labels.build_label_table(COMPONENTS)
+    expected = helpers.annotate_iseg_image(image, table)
+    monkeypatch.setitem(sys.modules, 'cv2', None)
+    assert helpers.annotate_iseg_image(image, table) == expected
+
+
+def test_fragment_rects_match_opencv():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        mask = (rng.random(rng.integers(1, 40, 2)) < rng.uniform(0.1, 0.7)).astype(np.uint8)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        rects = sorted(zip(*[a.tolist() for a in labels.fragment_rects(mask)]))
+        assert rects == sorted(map(tuple, stats[1:, :4].tolist()))
+
+
+def test_specks_do_not_stretch_boxes():
+    instances = np.full((100, 100), -1, dtype=np.int32)
+    instances[10:30, 10:40] = 0
+    # a 2x2 speck far away and a component made of specks only
+    instances[90:92, 90:92] = 0
+    instances[50:52, 50:52] = 1
+    boxes, present = labels.instance_boxes(instances, 3)
+    assert present.tolist() == [True, False, False]
+    assert boxes[0].tolist() == [10, 10, 40, 30]
+
+
+def test_id_map_round_trip(tmp_path):
+    instances = np.full((8, 8), -1, dtype=np.int32)
+    instances[2:4, 3:6] = 4
+    path = str(tmp_path / 'iseg_image_000001.npz')
+    labels.save_id_map(path, labels.id_map(instances, 5))
+    assert np.array_equal(labels.load_id_map(path), instances)
+
+
+def test_read_labels_inverts_yolo_labels(tmp_path):
+    boxes = np.array([[10, 20, 50, 80], [0, 0, 640, 320]])
+    yolo_labels = labels.yolo_labels(boxes, np.array([True, True]), np.array([2, 5]), 640, 320)
+    label_file = str(tmp_path / 'rgb_image_000001.txt')
+    labels.write_labels(label_file, yolo_labels)
+    read, class_ids = labels.read_labels(label_file, 640, 320)
+    assert np.allclose(read, boxes, atol=1e-3)
+    assert class_ids.tolist() == [2, 5]
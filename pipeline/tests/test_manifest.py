@@ -0,0 +1,84 @@
+import json
+import os
+
+import pytest
+
+from util import manifest as mf
+
+
+def touch(output_dir, kind, name):
+    os.makedirs(os.path.join(output_dir, kind), exist_ok=True)
+    open(os.path.join(output_dir, kind, name), 'w').close()
+
+
+def test_resume_sees_complete_frames_only(tmp_path):
+    output_dir = str(tmp_path)
+    manifest = mf.Manifest(output_dir)
+    for image_id in range(3):
+        touch(output_dir, 'rgb', 'rgb_image_%06d.png' % image_id)
+        manifest.record(image_id, rgb='rgb_image_%06d.png' % image_id)
+    os.remove(os.path.join(output_dir, 'rgb', 'rgb_image_000001.png'))
+
+    resumed = mf.Manifest(output_dir)
+    assert [i for i in range(3) if resumed.is_complete(i)] == [0, 2]
+    assert resumed.next_id() == 3
+
+
+def test_culled_frames_are_complete(tmp_path):
+    manifest = mf.Manifest(str(tmp_path))
+    manifest.record(7)
+    assert mf.Manifest(str(tmp_path)).is_complete(7)
+
+
+def test_append_continues_after_all_parts(tmp_path):
+    output_dir = str(tmp_path)
+    mf.Manifest(output_dir).record(4)
+    # part of another process and a manifest of an earlier version
+    with open(os.path.join(output_dir, mf.MANIFEST_PART.format('other-1')), 'w') as f:
+        f.write(json.dumps({'image_id': 9, 'files': {}}) + '\n')
+    with open(os.path.join(output_dir, mf.MANIFEST_FILENAME), 'w') as f:
+        f.write(json.dumps({'image_id': 2, 'files': {}}) + '\n')
+    manifest = mf.Manifest(output_dir, readonly=True)
+    assert sorted(manifest.frames) == [2, 4, 9]
+    assert manifest.next_id() == 10
+
+
+def test_torn_lines_are_skipped_not_truncated(tmp_path):
+    output_dir = str(tmp_path)
+    other = os.path.join(output_dir, mf.MANIFEST_PART.format('other-1'))
+    torn = json.dumps({'image_id': 0, 'files': {}}) + '\n' + '{"image_id": 1, "fi'
+    with open(other, 'w') as f:
+        f.write(torn)
+
+    manifest = mf.Manifest(output_dir)
+    manifest.record(5)
+    assert sorted(manifest.frames) == [0, 5]
+    # the part another process may still be appending to is left as it is
+    with open(other) as f:
+        assert f.read() == torn
+
+
+def test_record_starts_a_fresh_line_after_a_torn_one(tmp_path):
+    manifest = mf.Manifest(str(tmp_path))
+    with open(manifest.path, 'w') as f:
+        f.write('{"image_id": 1, "fi')
+    manifest.record(2)
+    assert sorted(mf.Manifest(str(tmp_path)).frames) == [2]
+
+
+def test_readonly_manifest_does_not_record(tmp_path):
+    with pytest.raises(Exception):
+        mf.Manifest(str(tmp_path), readonly=True).record(1)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_record_after_torn_line_without_pread(tmp_path, monkeypatch):
+    # os.pread does not exist on Windows
+    monkeypatch.delattr(os, 'pread', raising=False)
+    manifest = mf.Manifest(str(tmp_path))
+    manifest.record(0)
+    with open(manifest.path, 'ab') as f:
+        f.write(b'{"image_id": 1, "fi')
+    manifest.record(2)
+    manifest.record(3)
+    assert sorted(mf.Manifest(str(tmp_path)).frames) == [0, 2, 3]
@@ -0,0 +1,27 @@
+import shutil
+
+import pytest
+
+from benchmarks import bench_blenderscript
+
+
+@pytest.fixture(scope='module')
+def stats(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('fake_run')
+    config_path = bench_blenderscript.make_config(str(folder), 60, n_textures=40, n_backgrounds=3)
+    stats, _, _ = bench_blenderscript.run_script(config_path)
+    shutil.rmtree(str(folder))
+    return stats
+
+
+def test_materials_are_built_once_per_texture(stats):
+    assert stats.zpy['material.make_mat_from_texture'] == 40
+
+
+def test_datablocks_stay_flat_across_frames(stats):
+    counts = [render['data'] for render in stats.renders]
+    for kind in ('objects', 'meshes', 'materials', 'lights'):
+        assert len({c[kind] for c in counts}) == 1, kind
+    assert counts[0]['lights'] == 1
+    # the background cache grows by the hdris seen so far, up to the 3 of the folder
+    assert counts[-1]['images'] - counts[0]['images'] <= 2
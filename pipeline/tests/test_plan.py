@@ -0,0 +1,27 @@
+import os
+
+import numpy as np
+
+from conftest import PIPELINE_DIR
+from util import config as conf
+from util import plan
+
+CONFIG = conf.Config(os.path.join(PIPELINE_DIR, 'config.json'))
+
+
+def test_split_run_matches_single_run():
+    # frames 100..109 appended to a dataset, rendered by one process and by two shards or batches
+    single = plan.make_plan(CONFIG, 100, 10, 110, 5, 7, 3)
+    parts = [plan.make_plan(CONFIG, 100, 4, 110, 5, 7, 3), plan.make_plan(CONFIG, 104, 6, 110, 5, 7, 3)]
+    for name, values in single.arrays.items():
+        assert np.array_equal(np.concatenate([part.arrays[name] for part in parts]), values), name
+
+
+def test_plan_round_trip(tmp_path):
+    sampled = plan.make_plan(CONFIG, 0, 5, 5, 5, 7, 3)
+    path = str(tmp_path / plan.plan_filename(0, 5))
+    sampled.save(path)
+    loaded = plan.Plan.load(path)
+    assert 4 in loaded and 5 not in loaded
+    for name, values in sampled.arrays.items():
+        assert np.array_equal(loaded.arrays[name], values), name
@@ -0,0 +1,71 @@
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from benchmarks import fake_blender
+
+
+@pytest.fixture(scope='module')
+def projection():
+    fake_blender.install()
+    sys.modules.pop('util.projection', None)
+    from util import projection
+    yield projection
+    sys.modules.pop('util.projection', None)
+
+
+def sphere_points(center, radius, n=200):
+    # fibonacci lattice on the sphere surface
+    i = np.arange(n) + 0.5
+    z = 1 - 2 * i / n
+    phi = np.pi * (1 + 5**0.5) * i
+    r = np.sqrt(1 - z**2)
+    return np.asarray(center) + radius * np.stack([r * np.cos(phi), r * np.sin(phi), z], axis=1)
+
+
+class SphereScene():
+    """Scene of spheres with Blender's scene.ray_cast signature."""
+    def __init__(self, spheres):
+        self.spheres = spheres
+
+    def ray_cast(self, depsgraph, origin, direction, distance=1e30):
+        origin, direction = np.array(origin), np.array(direction)
+        best = None
+        for obj, center, radius in self.spheres:
+            oc = origin - center
+            b = oc @ direction
+            disc = b * b - (oc @ oc - radius * radius)
+            if disc < 0:
+                continue
+            t = -b - disc**0.5
+            if 0 < t <= distance and (best is None or t < best[0]):
+                best = (t, obj)
+        if best is None:
+            return False, None, None, None, None, None
+        return True, None, None, None, best[1], None
+
+
+def test_unoccluded_object_is_fully_visible(projection):
+    from mathutils import Vector
+    obj = SimpleNamespace(name='part')
+    camera = SimpleNamespace(matrix_world=SimpleNamespace(translation=Vector((0.0, 0.0, -10.0))))
+    scene = SphereScene([(obj, np.zeros(3), 1.0)])
+    points = sphere_points((0, 0, 0), 1.0)
+    assert projection.visible_fraction(scene, None, camera, obj, points, samples=200) == 1.0
+
+    # an occluder covering the middle of the part hides some of its facing vertices
+    occluder = SimpleNamespace(name='distractor')
+    scene = SphereScene([(obj, np.zeros(3), 1.0), (occluder, np.array([0.0, 0.0, -3.0]), 0.5)])
+    fraction = projection.visible_fraction(scene, None, camera, obj, points, samples=200)
+    assert 0.3 < fraction < 0.9
+    assert projection.visible_fraction(scene, None, camera, obj, points, samples=200, occluders=set()) == 1.0
+
+
+def test_segments_near_spheres(projection):
+    origin = np.zeros(3)
+    points = np.array([[10.0, 0, 0], [0, 10.0, 0], [2.0, 0, 0]])
+    centers = np.array([[5.0, 0.5, 0]])
+    assert projection.segments_near_spheres(origin, points, centers, np.array([1.0])).tolist() == [True, False, False]
+    assert projection.segments_near_spheres(origin, points, np.zeros((0, 3)), np.zeros(0)).tolist() == [False] * 3
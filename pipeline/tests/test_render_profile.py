@@ -0,0 +1,93 @@
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks import fake_blender
+
+
+@pytest.fixture
+def render_profile():
+    fake_blender.install()
+    sys.modules.pop('util.render_profile', None)
+    from util import render_profile
+    yield render_profile
+    sys.modules.pop('util.render_profile', None)
+
+
+def node(bl_idname, name):
+    return SimpleNamespace(bl_idname=bl_idname, name=name, format=SimpleNamespace(color_mode='RGB'))
+
+
+def link(from_node, socket, to_node):
+    return SimpleNamespace(from_node=from_node, from_socket=SimpleNamespace(name=socket), to_node=to_node)
+
+
+def test_only_image_outputs_get_alpha(render_profile):
+    layers = node('CompositorNodeRLayers', 'Render Layers')
+    # names do not tell the outputs apart, the linked sockets do
+    rgb = node('CompositorNodeOutputFile', 'File Output')
+    iseg = node('CompositorNodeOutputFile', 'File Output.001')
+    tree = SimpleNamespace(nodes=[layers, rgb, iseg], links=[link(layers, 'Image', rgb), link(layers, 'instance', iseg)])
+    scene = SimpleNamespace(render=SimpleNamespace(film_transparent=False, image_settings=SimpleNamespace(color_mode='RGB')),
+                            node_tree=tree)
+
+    render_profile.use_transparent_film(scene=scene)
+    assert scene.render.film_transparent and scene.render.image_settings.color_mode == 'RGBA'
+    assert rgb.format.color_mode == 'RGBA' and iseg.format.color_mode == 'RGB'
+
+    render_profile.use_transparent_film(False, scene=scene)
+    assert rgb.format.color_mode == 'RGB' and not scene.render.film_transparent
+
+
+def scene_for_profiles():
+    render = SimpleNamespace(engine='BLENDER_EEVEE', resolution_x=1920, resolution_y=1080, resolution_percentage=50,
+                             threads_mode='AUTO', threads=1, tile_x=64, tile_y=64)
+    cycles = SimpleNamespace(samples=128, use_adaptive_sampling=False, adaptive_threshold=0.01, max_bounces=12,
+                             use_denoising=True)
+    return SimpleNamespace(render=render, cycles=cycles)
+
+
+def test_apply_profile(render_profile):
+    scene = scene_for_profiles()
+    render_profile.apply_profile({'engine': 'CYCLES', 'resolution': [640, 480], 'threads': 4, 'tile_size': 32,
+                                  'samples': 16, 'adaptive_threshold': 0.05, 'denoise': 0}, scene=scene)
+    assert (scene.render.engine, scene.render.resolution_x, scene.render.resolution_y) == ('CYCLES', 640, 480)
+    assert scene.render.resolution_percentage == 100
+    assert (scene.render.threads_mode, scene.render.threads) == ('FIXED', 4)
+    assert scene.render.tile_x == scene.render.tile_y == 32
+    assert scene.cycles.samples == 16 and scene.cycles.use_adaptive_sampling and scene.cycles.adaptive_threshold == 0.05
+    assert not scene.cycles.use_denoising
+
+
+def test_apply_profile_keeps_missing_settings(render_profile):
+    scene = scene_for_profiles()
+    render_profile.apply_profile({'samples': 8, 'threads': 0}, scene=scene)
+    assert scene.cycles.samples == 8 and scene.render.threads_mode == 'AUTO'
+    assert (scene.render.engine, scene.render.resolution_x, scene.cycles.max_bounces) == ('BLENDER_EEVEE', 1920, 12)
+    assert scene.cycles.use_denoising
+
+
+def test_flat_pass_restores_settings(render_profile):
+    scene = scene_for_profiles()
+    with render_profile.flat_pass(scene=scene):
+        assert (scene.cycles.samples, scene.cycles.max_bounces) == (1, 0)
+        assert not scene.cycles.use_adaptive_sampling and not scene.cycles.use_denoising
+    assert (scene.cycles.samples, scene.cycles.max_bounces, scene.cycles.use_denoising) == (128, 12, True)
+
+    with pytest.raises(RuntimeError):
+        with render_profile.flat_pass(scene=scene):
+            raise RuntimeError('render failed')
+    assert scene.cycles.samples == 128 and scene.cycles.max_bounces == 12
+
+
+def test_sample_budget(render_profile):
+    scene = scene_for_profiles()
+    budget = render_profile.SampleBudget(1.0, max_samples=128, min_samples=4, scene=scene)
+    assert budget.update(4.0) == 32 and scene.cycles.samples == 32
+    assert budget.update(100.0) == 4
+    assert budget.update(0.9) == 4
+    assert budget.update(0.1) == 5
+    for _ in range(100):
+        budget.update(0.1)
+    assert budget.samples == 128
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from util import sampling
+
+
+def baseline_fibonacci(n, r):
+    """Points of the fibonacci_sphere list the sampler replaces."""
+    indices = np.arange(0, n, dtype=float) + 0.5
+    phi = np.arccos(1 - 2 * indices / n)
+    theta = np.pi * (1 + 5**0.5) * indices
+    return np.round(np.stack([np.cos(theta) * np.sin(phi), np.sin(theta) * np.sin(phi), np.cos(phi)], axis=1) * r, 3)
+
+
+def test_fibonacci_matches_the_baseline_lattice():
+    sampler = sampling.ViewpointSampler('fibonacci', radii=(2.5,), n_points=500, decimals=3)
+    assert np.allclose(sampler.sample(np.arange(500)), baseline_fibonacci(500, 2.5))
+    # indices wrap around the lattice
+    assert np.allclose(sampler.sample([501]), baseline_fibonacci(500, 2.5)[1])
+
+
+@pytest.mark.parametrize('method', sampling.METHODS)
+def test_batches_are_deterministic(method):
+    sampler = sampling.ViewpointSampler(method, radii=(1.0, 2.0), n_points=100, jitter=0.01)
+    first = np.concatenate(list(sampler.batches(10, 50, batch_size=7, rng=np.random.default_rng(4))))
+    second = np.concatenate(list(sampler.batches(10, 50, batch_size=7, rng=np.random.default_rng(4))))
+    assert first.shape == (50, 3)
+    assert np.array_equal(first, second)
+    assert np.allclose(np.linalg.norm(first, axis=1), np.where(np.arange(10, 60) % 2, 2.0, 1.0))
+
+
+@pytest.mark.parametrize('method', sampling.METHODS)
+def test_elevation_band(method):
+    sampler = sampling.ViewpointSampler(method, n_points=200, elevation=(10, 60))
+    points = sampler.sample(np.arange(200), np.random.default_rng(0))
+    elevation = np.degrees(np.arcsin(points[:, 2]))
+    assert elevation.min() >= 10 - 1e-9 and elevation.max() <= 60 + 1e-9
+
+
+def test_random_methods_need_a_generator():
+    with pytest.raises(ValueError):
+        sampling.ViewpointSampler('uniform').sample([0])
+    with pytest.raises(ValueError):
+        sampling.ViewpointSampler('spiral')
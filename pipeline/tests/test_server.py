@@ -0,0 +1,74 @@
+import socket
+import threading
+
+import pytest
+
+from util import server
+
+
+@pytest.fixture(autouse=True)
+def key_file(tmp_path, monkeypatch):
+    monkeypatch.delenv(server.AUTHKEY_ENV, raising=False)
+    monkeypatch.setattr(server, 'KEY_FILE', str(tmp_path / 'blendr' / 'server_key'))
+    return tmp_path / 'blendr' / 'server_key'
+
+
+def serve_one(listener, received):
+    # answers a single job like blenderscript.py --serve
+    connection, job = listener.accept()
+    with connection:
+        received.append(job)
+        connection.send({'event': 'frame', 'image_id': job['start']})
+        connection.send({'event': 'job_done', 'code': 0})
+
+
+def test_jobs_are_plain_json_with_a_random_key(key_file):
+    received, events = [], []
+    with server.listen('localhost:0') as listener:
+        thread = threading.Thread(target=serve_one, args=(listener, received))
+        thread.start()
+        address = '%s:%d' % listener.address
+        job = server.make_job({'output_dir': 'out'}, start=7, count=1)
+        assert server.submit(address, job, events.append) == 0
+        thread.join()
+    assert received == [job]
+    assert events == [{'event': 'frame', 'image_id': 7}]
+    assert key_file.stat().st_mode & 0o777 == 0o600
+    assert len(key_file.read_bytes()) == 64
+
+
+def test_clients_with_another_key_are_rejected(monkeypatch):
+    with server.listen('localhost:0') as listener:
+        thread = threading.Thread(target=serve_one, args=(listener, []), daemon=True)
+        thread.start()
+        monkeypatch.setenv(server.AUTHKEY_ENV, 'guess')
+        with pytest.raises(Exception, match='rejected the key'):
+            server.submit('%s:%d' % listener.address, server.make_job({}))
+
+
+def test_public_addresses_need_an_explicit_key(monkeypatch):
+    with pytest.raises(Exception, match='Refusing to serve'):
+        server.listen('0.0.0.0:0')
+    monkeypatch.setenv(server.AUTHKEY_ENV, 'secret')
+    server.listen('0.0.0.0:0').close()
+
+
+def test_idle_clients_do_not_block_the_server(monkeypatch):
+    monkeypatch.setattr(server, 'CLIENT_TIMEOUT', 0.2)
+    received = []
+    with server.listen('localhost:0') as listener:
+        address = '%s:%d' % listener.address
+        thread = threading.Thread(target=serve_one, args=(listener, received), daemon=True)
+        thread.start()
+        # authenticated but never sends a job
+        idle = server.connect(address)
+        assert server.submit(address, server.make_job({}, start=3)) == 0
+        thread.join(5)
+        idle.close()
+        # a client that does not even answer the challenge
+        silent = socket.create_connection(listener.address)
+        thread = threading.Thread(target=serve_one, args=(listener, received), daemon=True)
+        thread.start()
+        assert server.submit(address, server.make_job({}, start=4)) == 0
+        silent.close()
+    assert [job['start'] for job in received] == [3, 4]
@@ -0,0 +1,52 @@
+import json
+import os
+
+import numpy as np
+
+from test_labels import COMPONENTS
+from util import helpers
+from util import labels
+from util import shard_writer
+
+
+def test_partial_shards_of_a_crashed_run_are_removed(tmp_path):
+    (tmp_path / 'shard-000000-00000.tar.tmp').write_bytes(b'partial')
+    (tmp_path / 'shard-000100-00000.tar.tmp').write_bytes(b'other range')
+    writer = shard_writer.ShardWriter(tmp_path, 'shard-000000', max_samples=2)
+    assert not (tmp_path / 'shard-000000-00000.tar.tmp').exists()
+    # partial shards of other processes are theirs to clean up
+    assert (tmp_path / 'shard-000100-00000.tar.tmp').exists()
+
+    writer.add('000000', {'rgb.png': b'rgb', 'txt': b''})
+    assert writer.add('000001', {'rgb.png': b'rgb', 'txt': b''}) == ('shard-000000-00000.tar', ['000000', '000001'])
+    assert [key for key, _ in shard_writer.read_samples(str(tmp_path / 'shard-000000-00000.tar'))] == ['000000', '000001']
+
+
+def test_index_records_labels(tmp_path):
+    writer = shard_writer.ShardWriter(tmp_path, 'shard', max_samples=1)
+    writer.add('000000', {'rgb.png': b'rgb', 'txt': b'0 0.5 0.5 0.1 0.1'})
+    writer.add('000001', {'rgb.png': b'rgb'})
+    assert shard_writer.is_labelled(str(tmp_path / 'shard-00000.tar'))
+    assert not shard_writer.is_labelled(str(tmp_path / 'shard-00001.tar'))
+
+
+def test_only_unlabelled_shards_are_rewritten(tmp_path):
+    table = labels.build_label_table(COMPONENTS)
+    instances = np.full((64, 64), -1, dtype=np.int32)
+    instances[8:40, 16:48] = 0
+    id_map = str(tmp_path / 'iseg.npz')
+    labels.save_id_map(id_map, labels.id_map(instances, len(table.names)))
+
+    shards = tmp_path / 'shards'
+    writer = shard_writer.ShardWriter(shards, 'shard', max_samples=1)
+    writer.add('000000', {'iseg.npz': id_map, 'txt': b'packed'})
+    writer.add('000001', {'iseg.npz': id_map})
+    labelled = str(shards / 'shard-00000.tar')
+    mtime = os.stat(labelled).st_mtime_ns
+
+    assert helpers.annotate_tar_shards(str(shards), COMPONENTS) == []
+    assert os.stat(labelled).st_mtime_ns == mtime
+    samples = dict(shard_writer.read_samples(str(shards / 'shard-00001.tar')))
+    assert samples['000001']['txt'].decode() == helpers.annotate_instances(instances, table)[0]
+    with open(str(shards / 'shard-00001.tar.json')) as f:
+        assert json.load(f)['labelled']
@@ -0,0 +1,20 @@
+from benchmarks import bench_blenderscript
+
+
+def run(folder, overrides):
+    config_path = bench_blenderscript.make_config(str(folder), 5, n_textures=5, n_backgrounds=2, overrides=overrides)
+    stats, _, _ = bench_blenderscript.run_script(config_path)
+    return stats
+
+
+def test_static_batch_joins_ignored_parts(tmp_path):
+    plain = run(tmp_path / 'plain', {'static_batch': 0})
+    batched = run(tmp_path / 'batched', {'static_batch': 1, 'static_batch_groups': 4})
+
+    # the annotated components are segmented as before
+    assert batched.zpy['objects.segment'] == plain.zpy['objects.segment']
+    assert len(batched.renders) == len(plain.renders) == 5
+    # ignored parts are textured as a few joined objects instead of one by one
+    assert batched.renders[0]['data']['objects'] < plain.renders[0]['data']['objects']
+    assert batched.zpy['material.set_mat'] < plain.zpy['material.set_mat']
+    assert batched.zpy['material.jitter'] < plain.zpy['material.jitter']
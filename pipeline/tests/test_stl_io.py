@@ -0,0 +1,57 @@
+import glob
+import os
+
+import numpy as np
+
+from conftest import PIPELINE_DIR
+from util import stl_io
+
+# two triangles of a unit square sharing an edge, one corner written as -0.0
+SQUARE = np.array([[[0, 0, 0], [1, 0, 0], [1, 1, 0]],
+                   [[-0.0, 0, 0], [1, 1, 0], [0, 1, 0]]], dtype=np.float32)
+
+
+def write_binary(path, triangles):
+    records = np.zeros(len(triangles), dtype=stl_io._TRIANGLE_DTYPE)
+    records['vertices'] = triangles
+    with open(path, 'wb') as f:
+        f.write(b'solid header'.ljust(80, b' '))
+        f.write(np.uint32(len(triangles)).tobytes())
+        f.write(records.tobytes())
+
+
+def write_ascii(path, triangles):
+    with open(path, 'w') as f:
+        f.write('solid square\n')
+        for triangle in triangles:
+            f.write('  facet normal 0 0 1\n    outer loop\n')
+            for x, y, z in triangle:
+                f.write('      vertex %r %r %r\n' % (float(x), float(y), float(z)))
+            f.write('    endloop\n  endfacet\n')
+        f.write('endsolid square\n')
+
+
+def test_binary_and_ascii_give_the_same_triangles(tmp_path):
+    write_binary(str(tmp_path / 'binary.stl'), SQUARE)
+    write_ascii(str(tmp_path / 'ascii.stl'), SQUARE)
+    assert np.array_equal(stl_io.read_triangles(str(tmp_path / 'binary.stl')), SQUARE)
+    assert np.array_equal(stl_io.read_triangles(str(tmp_path / 'ascii.stl')), SQUARE)
+
+
+def test_empty_binary_file(tmp_path):
+    write_binary(str(tmp_path / 'empty.stl'), SQUARE[:0])
+    assert stl_io.read_triangles(str(tmp_path / 'empty.stl')).shape == (0, 3, 3)
+
+
+def test_shared_corners_are_merged():
+    vertices, faces = stl_io.index_triangles(SQUARE)
+    assert len(vertices) == 4
+    assert np.array_equal(vertices[faces], SQUARE + np.float32(0.0))
+
+
+def test_repository_stls_round_trip():
+    paths = sorted(glob.glob(os.path.join(os.path.dirname(PIPELINE_DIR), 'resources', 'stl', '*.STL')))[:5]
+    assert paths
+    for mesh, path in zip(stl_io.load_stl_files(paths, jobs=1), paths):
+        assert np.array_equal(mesh['vertices'][mesh['faces']], stl_io.read_triangles(path) + np.float32(0.0))
+        assert np.array_equal(mesh['bounds'][0], mesh['vertices'].min(axis=0))
@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+import pytest
+
+from util import timing
+
+
+def span(name, start, duration, process='blender 000000'):
+    return {'name': name, 'start': start, 'duration': duration, 'process': process, 'args': {}}
+
+
+@pytest.mark.parametrize('q', [0, 10, 50, 90, 99, 100])
+def test_percentile_matches_numpy(q):
+    values = sorted(np.random.default_rng(0).random(37).tolist())
+    assert timing.percentile(values, q) == pytest.approx(np.percentile(values, q))
+    assert timing.percentile([], q) == 0.0
+
+
+def test_summarize_stages_and_frame_rate():
+    # two processes rendering two frames each between t=0 and t=4
+    spans = [span('frame', 0, 2), span('frame', 2, 2), span('frame', 1, 1, 'b'), span('frame', 3, 1, 'b'),
+             span('render', 0, 1.5), span('render', 2, 0.5)]
+    summary = timing.summarize(spans)
+    assert summary['render']['count'] == 2
+    assert summary['render']['total'] == 2.0
+    assert summary['render']['max'] == 1.5
+    assert summary['render']['p50'] == 1.0
+    assert summary['frames_per_second'] == 1.0
+    assert 'render' in timing.format_summary(summary)
+
+
+def test_tracer_round_trip(tmp_path):
+    tracer = timing.Tracer(str(tmp_path / 'trace' / 'blender_000000.jsonl'), 'blender 000000')
+    stages = tracer.stages('frame', image_id=1)
+    stages.mark('render')
+    stages.end()
+    with tracer.span('annotate'):
+        pass
+    tracer.flush()
+    spans = timing.read_spans(str(tmp_path / 'trace'))
+    assert [s['name'] for s in spans] == ['render', 'frame', 'annotate']
+    assert spans[1]['args'] == {'image_id': 1}
+
+    timing.write_chrome_trace(spans, str(tmp_path / 'trace.json'))
+    with open(str(tmp_path / 'trace.json')) as f:
+        events = json.load(f)['traceEvents']
+    assert [e['ph'] for e in events] == ['M', 'X', 'X', 'X']
+
+
+def test_disabled_tracer_writes_nothing(tmp_path):
+    tracer = timing.Tracer()
+    with tracer.span('render'):
+        pass
+    tracer.stages('frame').end()
+    tracer.flush()
+    assert not tracer.enabled
@@ -0,0 +1,103 @@
+import sys
+import threading
+import time
+
+from util import launcher
+from util import work_queue
+
+
+def make_queue(tmp_path, n_images=10, batch_size=4, **kwargs):
+    queue = work_queue.WorkQueue(str(tmp_path / work_queue.QUEUE_FILENAME), **kwargs)
+    queue.fill(work_queue.batch_ranges(0, n_images, batch_size))
+    return queue
+
+
+def test_batch_ranges_cover_the_run():
+    assert work_queue.batch_ranges(5, 10, 4) == [(5, 4), (9, 4), (13, 2)]
+
+
+def test_fill_only_once(tmp_path):
+    queue = make_queue(tmp_path)
+    assert not queue.fill([(0, 1)])
+    assert [(b['start'], b['count']) for b in queue.batches()] == [(0, 4), (4, 4), (8, 2)]
+
+
+def test_claim_hands_out_every_batch_once(tmp_path):
+    queue = make_queue(tmp_path)
+    claimed = [queue.claim('a'), queue.claim('b'), queue.claim('a')]
+    assert [b['id'] for b in claimed] == [1, 2, 3]
+    assert queue.claim('b') is None
+    assert queue.counts() == {'pending': 0, 'running': 3, 'done': 0, 'failed': 0}
+
+
+def test_reap_returns_lost_batches_until_max_attempts(tmp_path):
+    queue = make_queue(tmp_path, n_images=4, lease=0.05, max_attempts=2)
+    batch = queue.claim('a')
+    time.sleep(0.1)
+    assert queue.reap() == [batch['id']]
+    assert not queue.heartbeat(batch['id'], 'a')
+    assert not queue.complete(batch['id'], 'a')
+
+    retried = queue.claim('b')
+    assert retried['id'] == batch['id'] and retried['attempts'] == 2
+    time.sleep(0.1)
+    queue.reap()
+    assert queue.counts()['failed'] == 1
+
+
+def test_heartbeat_keeps_the_claim(tmp_path):
+    queue = make_queue(tmp_path, n_images=4, lease=0.2)
+    batch = queue.claim('a')
+    for _ in range(3):
+        time.sleep(0.1)
+        assert queue.heartbeat(batch['id'], 'a')
+        assert queue.reap() == []
+    assert queue.complete(batch['id'], 'a')
+    assert queue.finished()
+
+
+def test_fail_retries_the_batch(tmp_path):
+    queue = make_queue(tmp_path, n_images=4, max_attempts=2)
+    batch = queue.claim('a')
+    queue.fail(batch['id'], 'a', 'boom')
+    assert queue.batches()[0]['state'] == 'pending'
+    queue.fail(queue.claim('a')['id'], 'a', 'boom')
+    assert queue.batches()[0]['state'] == 'failed'
+    assert queue.finished()
+
+
+def test_worker_stops_and_leaves_a_lost_batch(tmp_path):
+    queue = make_queue(tmp_path, n_images=4)
+    stopped = []
+
+    def render_batch(batch, lost):
+        # another worker takes the batch over while this one renders
+        queue.reap()
+        with queue._transaction() as db:
+            db.execute("UPDATE batches SET worker = 'b' WHERE id = ?", (batch['id'],))
+        stopped.append(lost.wait(5))
+        assert queue.batches()[0]['state'] == 'running'
+        # the new owner finishes it, the lost worker must not mark it done or failed
+        queue.complete(batch['id'], 'b')
+        return 'interrupted'
+
+    assert work_queue.run_worker(queue, render_batch, 'a', heartbeat=0.05, poll=0.05) == 0
+    assert stopped == [True]
+    assert queue.batches()[0]['attempts'] == 1 and queue.batches()[0]['error'] is None
+
+
+def test_stop_event_creates_the_stop_file(tmp_path):
+    stop_file = str(tmp_path / 'stop')
+    # stands in for blenderscript.py, which checks the stop file before every frame
+    script = ('import os, time\n'
+              'for frame in range(100):\n'
+              '    if os.path.exists(%r):\n'
+              '        print("stopped at", frame, flush=True)\n'
+              '        break\n'
+              '    time.sleep(0.05)\n' % stop_file)
+    stop = threading.Event()
+    threading.Timer(0.2, stop.set).start()
+    t0 = time.monotonic()
+    assert launcher.run_blender([sys.executable, '-c', script], stop=stop, stop_file=stop_file) == 0
+    assert time.monotonic() - t0 < 4
+    assert not (tmp_path / 'stop').exists()
@@ -0,0 +1,61 @@
+import bpy
+import hashlib
+import json
+import os
+
+# Bump to invalidate cached scenes when the preparation steps change
+CACHE_VERSION = 1
+
+
+def scene_key(input_dir, settings):
+    """Hashes the content of the STL folder and the settings used to prepare it.
+    Args:
+        input_dir (str): Folder holding the STL files.
+        settings (dict): JSON serializable settings that influence the prepared scene.
+    Returns:
+        str: Hex digest identifying the prepared scene.
+    """
+    digest = hashlib.sha1()
+    digest.update(json.dumps(dict(settings, version=CACHE_VERSION, blender=bpy.app.version_string),
+                             sort_keys=True).encode('utf-8'))
+    for name in sorted(os.listdir(input_dir)):
+        digest.update(name.encode('utf-8'))
+        with open(os.path.join(input_dir, name), 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def cache_path(cache_dir, key):
+    """Returns the path of the prepared scene with the given key."""
+    return os.path.join(cache_dir, 'scene_%s.blend' % key)
+
+
+def save_scene(path, objs):
+    """Writes the prepared objects and their meshes/materials to a .blend library.
+    Args:
+        path (str): Cache file created by cache_path.
+        objs (list): Prepared objects.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # shards may build the same cache concurrently, only complete files are moved in place
+    tmp_path = '%s.%d.tmp.blend' % (path[:-len('.blend')], os.getpid())
+    bpy.data.libraries.write(tmp_path, set(objs))
+    os.replace(tmp_path, path)
+
+
+def load_scene(path):
+    """Appends the prepared objects of a cache file to the current scene.
+    Args:
+        path (str): Cache file written by save_scene.
+    Returns:
+        list: The appended objects.
+    """
+    with bpy.data.libraries.load(path, link=False) as (data_from, data_to):
+        data_to.objects = data_from.objects
+
+    objs = [obj for obj in data_to.objects if obj is not None]
+    for obj in objs:
+        bpy.context.scene.collection.objects.link(obj)
+    return objs
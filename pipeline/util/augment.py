@@ -0,0 +1,239 @@
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import cv2
+import numpy as np
+
+from util import labels
+
+# Folder in the output dir holding the augmented images and labels in YOLO layout (images/, labels/)
+AUGMENTED_DIRNAME = 'augmented'
+
+# Defaults of the augment entry of config.json, ranges are +- around no change unless noted
+DEFAULTS = {
+    'variants': 2,          # augmented copies per rendered frame
+    'exposure': 0.5,        # stops
+    'contrast': 0.2,
+    'saturation': 0.3,
+    'hue': 0.05,            # fraction of a full turn
+    'noise': 0.02,          # maximum standard deviation, relative to full range
+    'blur': 0.3,            # probability of a gaussian blur
+    'blur_sigma': [0.5, 1.5],
+    'jpeg': 0.3,            # probability of a jpeg round trip
+    'jpeg_quality': [40, 95],
+    'hflip': 0.5,           # probabilities of horizontal/vertical flips
+    'vflip': 0.0,
+    'scale': [0.75, 1.0],   # side of the random crop relative to the image, resized back to full size
+    'min_visible': 0.3,     # boxes keeping less of their area after cropping are dropped
+    'format': 'png',
+}
+
+# RGB <-> YIQ, hue is a rotation of the chroma plane IQ
+_RGB_TO_YIQ = np.array([[0.299, 0.587, 0.114], [0.596, -0.274, -0.322], [0.211, -0.523, 0.312]])
+_YIQ_TO_RGB = np.linalg.inv(_RGB_TO_YIQ)
+
+
+def color_matrices(saturation, hue):
+    """Returns one 3x3 BGR color matrix per image combining a saturation scale and a hue rotation.
+    Args:
+        saturation (np.ndarray): (b,) saturation factors, 1 keeps the colors.
+        hue (np.ndarray): (b,) hue rotation in turns.
+    Returns:
+        np.ndarray: (b, 3, 3) matrices.
+    """
+    angle = 2 * np.pi * hue
+    yiq = np.zeros((len(saturation), 3, 3))
+    yiq[:, 0, 0] = 1.0
+    yiq[:, 1, 1] = yiq[:, 2, 2] = saturation * np.cos(angle)
+    yiq[:, 1, 2] = -saturation * np.sin(angle)
+    yiq[:, 2, 1] = saturation * np.sin(angle)
+    rgb = _YIQ_TO_RGB @ yiq @ _RGB_TO_YIQ
+    # images are BGR as loaded by cv2
+    return rgb[:, ::-1, ::-1]
+
+
+def photometric(images, rng, settings):
+    """Applies exposure, contrast, saturation, hue and noise to a batch in one fused pass.
+    Args:
+        images (np.ndarray): (b, h, w, 3) uint8 BGR images.
+        rng (np.random.Generator): Random number generator.
+        settings (dict): Augmentation settings, see DEFAULTS.
+    Returns:
+        np.ndarray: (b, h, w, 3) uint8 augmented images.
+    """
+    b = len(images)
+    gain = 2.0 ** rng.uniform(-settings['exposure'], settings['exposure'], b)
+    contrast = rng.uniform(1 - settings['contrast'], 1 + settings['contrast'], b)
+    matrices = color_matrices(rng.uniform(1 - settings['saturation'], 1 + settings['saturation'], b),
+                              rng.uniform(-settings['hue'], settings['hue'], b))
+
+    # contrast around the mean level of every image, estimated on a coarse grid
+    mean = images[:, ::8, ::8].reshape(b, -1).mean(axis=1) / 255
+    scale = (gain * contrast)[:, None, None] * matrices / 255
+    offset = (gain * (1 - contrast) * mean)[:, None] * matrices.sum(axis=2)
+
+    x = np.matmul(images.astype(np.float32), scale.transpose(0, 2, 1)[:, None].astype(np.float32))
+    x += offset[:, None, None, :].astype(np.float32)
+    if settings['noise'] > 0:
+        sigma = rng.uniform(0, settings['noise'], b).astype(np.float32)
+        x += rng.standard_normal(x.shape, dtype=np.float32) * sigma[:, None, None, None]
+    x *= 255
+    x += 0.5
+    np.clip(x, 0, 255, out=x)
+    return x.astype(np.uint8)
+
+
+def degrade(images, rng, settings):
+    """Blurs and jpeg compresses a random subset of the images, in place.
+    Args:
+        images (np.ndarray): (b, h, w, 3) uint8 images.
+        rng (np.random.Generator): Random number generator.
+        settings (dict): Augmentation settings, see DEFAULTS.
+    """
+    b = len(images)
+    blur = rng.random(b) < settings['blur']
+    sigmas = rng.uniform(*settings['blur_sigma'], b)
+    jpeg = rng.random(b) < settings['jpeg']
+    qualities = rng.integers(settings['jpeg_quality'][0], settings['jpeg_quality'][1] + 1, b)
+    for i in np.flatnonzero(blur):
+        images[i] = cv2.GaussianBlur(images[i], (0, 0), float(sigmas[i]))
+    for i in np.flatnonzero(jpeg):
+        ok, data = cv2.imencode('.jpg', images[i], [cv2.IMWRITE_JPEG_QUALITY, int(qualities[i])])
+        if ok:
+            images[i] = cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+def geometric(images, boxes, rng, settings):
+    """Flips and crops the images and moves their boxes along.
+    Args:
+        images (np.ndarray): (b, h, w, 3) uint8 images, changed in place.
+        boxes (list): (n, 4) box arrays per image, normalized (x_min, y_min, x_max, y_max).
+        rng (np.random.Generator): Random number generator.
+        settings (dict): Augmentation settings, see DEFAULTS.
+    Returns:
+        list: (n, 4) transformed boxes and (n,) bool mask of the boxes that are still visible, per image.
+    """
+    b, h, w = images.shape[:3]
+    hflip = rng.random(b) < settings['hflip']
+    vflip = rng.random(b) < settings['vflip']
+    side = rng.uniform(*settings['scale'], b)
+    x0 = rng.uniform(0, 1, b) * (1 - side)
+    y0 = rng.uniform(0, 1, b) * (1 - side)
+
+    images[hflip] = images[hflip, :, ::-1]
+    images[vflip] = images[vflip, ::-1]
+
+    out = []
+    for i in range(b):
+        if side[i] < 1:
+            cx, cy = int(round(x0[i] * w)), int(round(y0[i] * h))
+            cw, ch = max(1, int(round(side[i] * w))), max(1, int(round(side[i] * h)))
+            images[i] = cv2.resize(images[i, cy:cy + ch, cx:cx + cw], (w, h), interpolation=cv2.INTER_LINEAR)
+
+        box = boxes[i].copy()
+        if hflip[i]:
+            box[:, [0, 2]] = 1 - box[:, [2, 0]]
+        if vflip[i]:
+            box[:, [1, 3]] = 1 - box[:, [3, 1]]
+        area = (box[:, 2] - box[:, 0]) * (box[:, 3] - box[:, 1])
+        box[:, [0, 2]] = (box[:, [0, 2]] - x0[i]) / side[i]
+        box[:, [1, 3]] = (box[:, [1, 3]] - y0[i]) / side[i]
+        np.clip(box, 0, 1, out=box)
+        visible = (box[:, 2] - box[:, 0]) * (box[:, 3] - box[:, 1]) * side[i]**2
+        keep = (visible >= settings['min_visible'] * area) & (box[:, 2] > box[:, 0]) & (box[:, 3] > box[:, 1])
+        out.append((box, keep))
+    return out
+
+
+def _label_name(image_filename):
+    # rendered frames and composites share the name of their label file, e.g. rgb_image_000001_2.png
+    return os.path.splitext(image_filename)[0] + '.txt'
+
+
+def _augment_chunk(filenames, rgb_folder, labels_folder, output_folder, settings, seed):
+    """Loads a chunk of frames once and writes all of their variants, collecting failures instead of raising."""
+    failures = []
+    frames = []
+    for filename in filenames:
+        try:
+            image = cv2.imread(os.path.join(rgb_folder, filename), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError('unreadable image')
+            h, w = image.shape[:2]
+            label_file = os.path.join(labels_folder, _label_name(filename))
+            boxes, class_ids = labels.read_labels(label_file, w, h)
+            frames.append((filename, image, boxes / [w, h, w, h], class_ids))
+        except Exception as e:
+            failures.append((filename, repr(e)))
+    if not frames:
+        return failures
+
+    # frames of different size are batched separately
+    by_shape = {}
+    for frame in frames:
+        by_shape.setdefault(frame[1].shape, []).append(frame)
+
+    ext = '.jpg' if settings['format'] == 'jpg' else '.png'
+    for batch in by_shape.values():
+        images = np.stack([image for _, image, _, _ in batch])
+        h, w = images.shape[1:3]
+        first = zlib.crc32(batch[0][0].encode())
+        for variant in range(1, settings['variants'] + 1):
+            # the random parameters depend on the frames of the chunk, not on the worker running it
+            rng = np.random.default_rng([seed, first, variant])
+            augmented = photometric(images, rng, settings)
+            degrade(augmented, rng, settings)
+            moved = geometric(augmented, [boxes for _, _, boxes, _ in batch], rng, settings)
+            for (filename, _, _, class_ids), image, (box, keep) in zip(batch, augmented, moved):
+                stem = '%s_%d' % (os.path.splitext(filename)[0], variant)
+                try:
+                    cv2.imwrite(os.path.join(output_folder, 'images', stem + ext), image)
+                    yolo_labels = labels.yolo_labels(box * [w, h, w, h], keep, class_ids, w, h)
+                    labels.write_labels(os.path.join(output_folder, 'labels', stem + '.txt'), yolo_labels)
+                except Exception as e:
+                    failures.append((stem, repr(e)))
+    return failures
+
+
+def augment_dataset(rgb_folder, labels_folder, output_folder, settings=None, seed=0, jobs=1, chunksize=16):
+    """Writes augmented variants of every labelled rgb frame with transformed YOLO labels.
+    Frames are loaded once per chunk and augmented as one batch per variant: exposure, contrast,
+    saturation, hue and noise are a single vectorized pass, blur and jpeg artifacts are applied to
+    a random subset and flips and crops move the boxes along. Chunks are handed to worker processes
+    if jobs > 1, results only depend on the seed and the chunk size.
+
+    Args:
+        rgb_folder (str): Folder containing the rgb images, or the images of a composited dataset.
+        labels_folder (str): Folder containing their YOLO label files, named like the images.
+        output_folder (str): Folder the variants are written to, as images/ and labels/.
+        settings (dict, optional): Augmentation settings, missing keys use DEFAULTS.
+        seed (int, optional): Random seed. Defaults to 0.
+        jobs (int, optional): Number of worker processes, None for one per CPU. Defaults to 1.
+        chunksize (int, optional): Number of frames per batch handed to a worker. Defaults to 16.
+    Returns:
+        list: (filename, error) tuples of the frames that could not be augmented.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    settings = dict(DEFAULTS, **(settings or {}))
+    os.makedirs(os.path.join(output_folder, 'images'), exist_ok=True)
+    os.makedirs(os.path.join(output_folder, 'labels'), exist_ok=True)
+
+    # frames without labels, e.g. culled or failed ones, are skipped
+    filenames = sorted(f for f in os.listdir(rgb_folder) if f.endswith('.png')
+                       and os.path.exists(os.path.join(labels_folder, _label_name(f))))
+    chunks = [filenames[i:i + chunksize] for i in range(0, len(filenames), chunksize)]
+    worker = partial(_augment_chunk, rgb_folder=rgb_folder, labels_folder=labels_folder,
+                     output_folder=output_folder, settings=settings, seed=seed)
+
+    failures = []
+    if jobs <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            failures.extend(worker(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(chunks))) as executor:
+            for chunk_failures in executor.map(worker, chunks):
+                failures.extend(chunk_failures)
+    return failures
@@ -0,0 +1,96 @@
+import bpy
+import math
+import random
+from collections import OrderedDict
+
+
+class BackgroundManager():
+    """Keeps decoded HDRIs in memory and switches the world background between them.
+
+    The world gets a persistent node tree once (coordinates -> mapping -> environment texture -> background);
+    switching backgrounds only points the environment texture node to a cached image.
+    Images are loaded lazily and evicted least recently used first when max_bytes is exceeded.
+    """
+    NODE_NAME = 'blendr_environment'
+
+    def __init__(self, background_paths, max_bytes=0, preload=False):
+        self.background_paths = [str(p) for p in background_paths]
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._images = OrderedDict()
+        self._sizes = {}
+        self._env, self._mapping = self._setup_world()
+        if preload:
+            for path in self.background_paths:
+                self._get(path)
+
+    def _setup_world(self):
+        scene = bpy.context.scene
+        if scene.world is None:
+            scene.world = bpy.data.worlds.new('World')
+        world = scene.world
+        world.use_nodes = True
+        nodes = world.node_tree.nodes
+        links = world.node_tree.links
+
+        env = nodes.get(self.NODE_NAME)
+        if env is None:
+            nodes.clear()
+            coords = nodes.new('ShaderNodeTexCoord')
+            mapping = nodes.new('ShaderNodeMapping')
+            env = nodes.new('ShaderNodeTexEnvironment')
+            env.name = self.NODE_NAME
+            background = nodes.new('ShaderNodeBackground')
+            output = nodes.new('ShaderNodeOutputWorld')
+            links.new(coords.outputs['Generated'], mapping.inputs['Vector'])
+            links.new(mapping.outputs['Vector'], env.inputs['Vector'])
+            links.new(env.outputs['Color'], background.inputs['Color'])
+            links.new(background.outputs['Background'], output.inputs['Surface'])
+        mapping = env.inputs['Vector'].links[0].from_node
+        return env, mapping
+
+    def _get(self, path):
+        image = self._images.get(path)
+        if image is not None and image.name in bpy.data.images:
+            self.hits += 1
+            self._images.move_to_end(path)
+            return image
+
+        self.misses += 1
+        image = bpy.data.images.load(path, check_existing=True)
+        width, height = image.size
+        self._images[path] = image
+        self._sizes[path] = width * height * image.channels * 4
+
+        # evict least recently used backgrounds, never the one just loaded
+        while self.max_bytes and len(self._images) > 1 and sum(self._sizes.values()) > self.max_bytes:
+            old_path, old = self._images.popitem(last=False)
+            del self._sizes[old_path]
+            if self._env.image == old:
+                self._env.image = None
+            bpy.data.images.remove(old)
+            self.evictions += 1
+        return image
+
+    def set_background(self, path, z_rotation=None):
+        """Uses the HDRI at path as world background.
+        Args:
+            path (Path): HDRI file.
+            z_rotation (float, optional): Rotation of the background around the z axis, random if None.
+        """
+        self._env.image = self._get(str(path))
+        if z_rotation is None:
+            z_rotation = random.uniform(0, 2 * math.pi)
+        self._mapping.inputs['Rotation'].default_value[2] = z_rotation
+
+    def stats(self):
+        """Returns the cache hit/miss counts and the memory used by cached backgrounds."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'cached': len(self._images),
+            'bytes': sum(self._sizes.values()),
+        }
@@ -6,47 +6,72 @@ import random
 import math
 import os
 
-# Import all stl files from input folder
-def import_stl_folder(input_dir):
-    files = os.listdir(input_dir)
-    for file in files:
-        absolut = os.path.join(input_dir, file)
-        bpy.ops.import_mesh.stl(
-            filepath=absolut, axis_forward='Y', axis_up='Z')
-        
-# Calculate BBox of objects
-def calcBoundingBox(objs):
-    cornerApointsX = []
-    cornerApointsY = []
-    cornerApointsZ = []
-    cornerBpointsX = []
-    cornerBpointsY = []
-    cornerBpointsZ = []
-
+from util import sampling
+from util import stl_io
+
+# Name prefix of the joined static parts
+STATIC_NAME = 'Static'
+
+# Import all stl files from input folder, returns the imported objects and their local bounds
+def import_stl_folder(input_dir, jobs=None):
+    files = sorted(f for f in os.listdir(input_dir) if f.lower().endswith('.stl'))
+    paths = [os.path.join(input_dir, file) for file in files]
+
+    # parse in worker processes, fall back to this process if Blender can't spawn them
+    try:
+        parts = stl_io.load_stl_files(paths, jobs)
+    except (OSError, RuntimeError):
+        parts = stl_io.load_stl_files(paths, 1)
+
+    imported = []
+    bounds = {}
+    for part in parts:
+        mesh = bpy.data.meshes.new(part['name'])
+        build_mesh(mesh, part['vertices'], part['faces'])
+        obj = bpy.data.objects.new(part['name'], mesh)
+        bpy.context.collection.objects.link(obj)
+        imported.append(obj)
+        bounds[obj.name] = part['bounds']
+    return imported, bounds
+
+# Fill an empty mesh with triangles in bulk
+def build_mesh(mesh, vertices, faces):
+    n_faces = len(faces)
+    mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set('co', vertices.astype(np.float32).ravel())
+    mesh.loops.add(3 * n_faces)
+    mesh.loops.foreach_set('vertex_index', faces.astype(np.int32).ravel())
+    mesh.polygons.add(n_faces)
+    mesh.polygons.foreach_set('loop_start', np.arange(0, 3 * n_faces, 3, dtype=np.int32))
+    mesh.polygons.foreach_set('loop_total', np.full(n_faces, 3, dtype=np.int32))
+    mesh.update()
+    # drop triangles that collapsed when identical corners were merged
+    mesh.validate()
+
+# Calculate BBox of objects, bounds maps object names to known local (min, max) corners
+def calcBoundingBox(objs, bounds=None):
+    world_corners = []
     for ob in objs:
-        bbox_corners = [ob.matrix_world @
-                        Vector(corner) for corner in ob.bound_box]
-        cornerApointsX.append(bbox_corners[0].x)
-        cornerApointsY.append(bbox_corners[0].y)
-        cornerApointsZ.append(bbox_corners[0].z)
-        cornerBpointsX.append(bbox_corners[6].x)
-        cornerBpointsY.append(bbox_corners[6].y)
-        cornerBpointsZ.append(bbox_corners[6].z)
-
-    minA = Vector((min(cornerApointsX), min(
-        cornerApointsY), min(cornerApointsZ)))
-    maxB = Vector((max(cornerBpointsX), max(
-        cornerBpointsY), max(cornerBpointsZ)))
-
-    center_point = Vector(
-        ((minA.x + maxB.x)/2, (minA.y + maxB.y)/2, (minA.z + maxB.z)/2))
-    dimensions = Vector((maxB.x - minA.x, maxB.y - minA.y, maxB.z - minA.z))
+        if bounds is not None and ob.name in bounds:
+            lo, hi = bounds[ob.name]
+            local = np.array([[x, y, z] for x in (lo[0], hi[0]) for y in (lo[1], hi[1]) for z in (lo[2], hi[2])])
+        else:
+            local = np.array([tuple(corner) for corner in ob.bound_box])
+        matrix = np.array(ob.matrix_world)
+        world_corners.append(local @ matrix[:3, :3].T + matrix[:3, 3])
+
+    world_corners = np.concatenate(world_corners)
+    minA = world_corners.min(axis=0)
+    maxB = world_corners.max(axis=0)
+
+    center_point = Vector(((minA + maxB) / 2).tolist())
+    dimensions = Vector((maxB - minA).tolist())
 
     return center_point, dimensions
 
 # Center objects in scene
-def center_objects(objs):
-    center_point, _ = calcBoundingBox(objs)
+def center_objects(objs, bounds=None):
+    center_point, _ = calcBoundingBox(objs, bounds)
     for obj in objs:
         obj.location -= center_point
         obj.rotation_euler = (0.0, 0.0, 0.0)
@@ -77,73 +102,82 @@ def rescale_all(objs, value=(1, 1, 1)):
     unselect_all()
 
 # Re-size and center mesh objects
-def norm_and_center(mesh_objs):
+def norm_and_center(mesh_objs, bounds=None):
     unhide_all()
-    center, dims = calcBoundingBox(mesh_objs)
+    center, dims = calcBoundingBox(mesh_objs, bounds)
     select_objs(mesh_objs)
     resize_factor = 1 / max(dims)
     rescale_all(mesh_objs, (resize_factor, resize_factor, resize_factor))
-    center_objects(mesh_objs)
+    bpy.context.view_layer.update()
+    center_objects(mesh_objs, bounds)
     return center, dims
 
 def fibonacci_sphere(n, r):
     """
     This function generates n points evenly spaced on the surface of a sphere of radius r.
-    Uses the fibonacci lattice / golden spiral method.
+    Uses the fibonacci lattice / golden spiral method, see sampling.ViewpointSampler for elevation bands,
+    multiple radii and jitter.
 
     :param n: number of points to generate.
     :param r: sphere radius.
+    :return: (n, 3) array of points rounded to 3 decimals.
     """
-    from numpy import pi, cos, sin, arccos, arange
-
-    # generate indices for each point
-    indices = arange(0, n, dtype=float) + 0.5
-
-    # Calculate angles phi and theta
-    phi = arccos(1 - 2*indices/n)
-    theta = pi * (1 + 5**0.5) * indices
-
-    # calculate x,y,z cartersian coordinates
-    x, y, z = cos(theta) * sin(phi), sin(theta) * sin(phi), cos(phi)
+    return sampling.ViewpointSampler('fibonacci', (r,), n, decimals=3).sample(np.arange(n))
 
-    # Scale coordinates by radius
-    x, y, z = x * r, y * r, z * r
-
-    # Round each coordinate to 3 decimal places
-    round_3 = lambda x: round(x, 3)
-    x = np.fromiter(map(round_3, x), dtype=float)
-    y = np.fromiter(map(round_3, y), dtype=float)
-    z = np.fromiter(map(round_3, z), dtype=float)
+def frame_seed(seed, image_id):
+    """
+    Derives the random seed of a single frame from the run seed and the image id.
 
-    # Combine x,y,z coordinates into list of tuples
-    points = [(x[i], y[i], z[i]) for i in range(n)]
-    
-    return points
+    :param seed: random seed of the run.
+    :param image_id: id of the frame.
+    """
+    return (seed * 1000003 + image_id) % 2**32
 
 def random_sphere(n, r, seed=None):
     """
-    This function generates n random points on the surface of a sphere of radius r.
+    This function generates n random points uniformly distributed on the surface of a sphere of radius r.
 
     :param n: number of points to generate.
     :param r: sphere radius.
-    :param seed: seed for the random number generator.
+    :param seed: seed for the random number generator, the global numpy state is not touched.
+    :return: (n, 3) array of points.
     """
-    if seed is not None:
-        np.random.seed(seed)
-
-    # Generate n random points in spherical coordinates
-    theta = np.random.uniform(0, 2 * np.pi, size=n)
-    phi = np.random.uniform(0, np.pi, size=n)
+    return sampling.uniform_directions(np.random.default_rng(seed), n) * r
 
-    # Convert spherical coordinates to cartesian coordinates
-    x = r * np.sin(phi) * np.cos(theta)
-    y = r * np.sin(phi) * np.sin(theta)
-    z = r * np.cos(phi)
+def join_static(objs, n_groups=4):
+    """
+    Joins parts that are never annotated into a few static meshes, so every frame textures
+    a handful of objects instead of every screw and nut. Consecutive objects of the list are joined,
+    sorted names keep similar parts in the same group.
 
-    # Combine x,y,z coordinates into list of tuples
-    random_points = [(x[i], y[i], z[i]) for i in range(n)]
+    :param objs: mesh objects to join.
+    :param n_groups: number of joined objects.
+    :return: the joined objects, named Static.000, Static.001, ...
+    """
+    if not objs:
+        return []
+    n_groups = max(1, min(n_groups, len(objs)))
+    bounds = np.linspace(0, len(objs), n_groups + 1).astype(int)
+    joined = []
+    for i in range(n_groups):
+        group = objs[bounds[i]:bounds[i + 1]]
+        bpy.ops.object.select_all(action='DESELECT')
+        for obj in group:
+            obj.select_set(True)
+        bpy.context.view_layer.objects.active = group[0]
+        bpy.ops.object.join()
+        obj = bpy.context.view_layer.objects.active
+        obj.name = '%s.%03d' % (STATIC_NAME, i)
+        obj.data.name = obj.name
+        joined.append(obj)
+    bpy.ops.object.select_all(action='DESELECT')
+    return joined
 
-    return random_points
+def static_objects():
+    """
+    Returns the objects joined by join_static, sorted by name.
+    """
+    return sorted((obj for obj in bpy.data.objects if obj.name.startswith(STATIC_NAME + '.')), key=lambda obj: obj.name)
 
 def uv_map():
     """Projects a model's surface to a 2D image to enable texture mapping of imported stls.
@@ -182,7 +216,7 @@ def make_rgb_image_name(id: int, extension: str = ".png") -> str:
     Returns:
         str: Image name.
     """
-    return "rgb_image_%03d" % id + extension
+    return "rgb_image_%06d" % id + extension
 
 def make_iseg_image_name(id: int, extension: str = ".png") -> str:
     """Creates a RGB image name given an integer id.
@@ -192,7 +226,24 @@ def make_iseg_image_name(id: int, extension: str = ".png") -> str:
     Returns:
         str: Image name.
     """
-    return "iseg_image_%03d" % id + extension
+    return "iseg_image_%06d" % id + extension
+
+def read_image(path):
+    """
+    Reads an image file through Blender, which has no OpenCV available.
+    :param path: path of the image file.
+    :return: (H, W, 3) uint8 array in OpenCV channel order (BGR), first row at the top.
+    """
+    image = bpy.data.images.load(str(path))
+    image.colorspace_settings.name = 'Non-Color'
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    bpy.data.images.remove(image)
+
+    # blender stores RGBA floats bottom to top
+    rgba = (pixels.reshape(height, width, 4)[::-1] * 255 + 0.5).astype(np.uint8)
+    return np.ascontiguousarray(rgba[..., 2::-1])
 
 def create_light(R, G, B, intensity):
     """Create a new point light object.
@@ -272,10 +323,11 @@ def generate_position_vector(r_min, r_max, seed=None):
     return Vector((x, y, z))
 
 
-def create_distractors(r_min, r_max, n_min, n_max, seed=None):
+def create_distractors(pool, r_min, r_max, n_min, n_max, seed=None):
     """
-    Creates random distractors within a sphere of minimum radius r_min and maximum radius r_max.
+    Shows random distractors of a DistractorPool within a sphere of minimum radius r_min and maximum radius r_max.
 
+    :param pool: DistractorPool holding the preallocated distractor objects.
     :param r_min: minimum radius of the sphere.
     :param r_max: maximum radius of the sphere.
     :param n_min: minimum number of distractors to create.
@@ -285,52 +337,37 @@ def create_distractors(r_min, r_max, n_min, n_max, seed=None):
     if seed is not None:
         random.seed(seed)
 
-    # create dictionary of shape names to function names
-    shape_functions = {
-        'cube': bpy.ops.mesh.primitive_cube_add,
-        'cylinder': bpy.ops.mesh.primitive_cylinder_add,
-        'cone': bpy.ops.mesh.primitive_cone_add,
-        'torus': bpy.ops.mesh.primitive_torus_add
-    }
-
     # generate random number of distractors
     num_distractors = random.randint(n_min, n_max)
 
-    # create distractor objects
+    # place distractor objects
     for i in range(num_distractors):
         # choose random shape and position
-        shape = random.choice(list(shape_functions.keys()))
+        shape = random.choice(list(pool.SHAPES.keys()))
         position = generate_position_vector(r_min, r_max)
         orientation = Vector([random.uniform(0, 2 * math.pi) for i in range(3)])
 
-        # create object and set its location and orientation
-        shape_functions[shape](location=position)
-        obj = bpy.context.object
-        obj.rotation_euler = orientation
+        # show pooled object at its location and orientation
+        pool.show(shape, position, orientation)
 
-def scale_distractors(min_scale_factor, max_scale_factor):
+def scale_distractors(objs, min_scale_factor, max_scale_factor):
     """
-    Scales down all the distractors in the scene by a random factor between the given minimum and maximum scale factors.
+    Scales the given distractors by a random factor between the given minimum and maximum scale factors.
 
+    :param objs: distractor objects, e.g. DistractorPool.active.
     :param min_scale_factor: the minimum scale factor to apply.
     :param max_scale_factor: the maximum scale factor to apply.
     """
-    # get a reference to the current scene
-    scene = bpy.context.scene
-
-    # iterate over all objects in the scene
-    for obj in scene.objects:
-        # check if the object is a distractor (i.e., has a shape name in the shape_functions dictionary)
-        if obj.name.startswith('Cube') or obj.name.startswith('Cylinder') or obj.name.startswith('Cone') or obj.name.startswith('Torus'):
-            # generate a random scale factor between min_scale_factor and max_scale_factor
-            scale_factor = random.uniform(min_scale_factor, max_scale_factor)
+    for obj in objs:
+        # generate a random scale factor between min_scale_factor and max_scale_factor
+        scale_factor = random.uniform(min_scale_factor, max_scale_factor)
 
-            # scale down the object by the random factor
-            obj.scale *= scale_factor
+        # pooled objects are reused, so set the scale instead of multiplying it
+        obj.scale = (scale_factor, scale_factor, scale_factor)
 
 def remove_distractors():
     """
-    Removes all distractors in the scene.
+    Removes all distractors created with bpy.ops in the scene, e.g. left over in the .blend file.
     """
     # select all objects with names starting with "Cube", "Cylinder", "Cone", or "Torus"
     bpy.ops.object.select_all(action='DESELECT')
@@ -353,3 +390,7 @@ def remove_lights():
             obj.select_set(True)
     # delete selected objects
     bpy.ops.object.delete()
+    # deleting an object keeps its light data, it would pile up over the frames
+    for light in list(bpy.data.lights):
+        if light.name.startswith('PointLight') and light.users == 0:
+            bpy.data.lights.remove(light)
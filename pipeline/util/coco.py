@@ -0,0 +1,216 @@
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import cv2
+import numpy as np
+
+from util import labels
+
+# COCO instance annotation file, written to the output dir
+COCO_ANNOTATION_FILENAME = '_annotations.coco.json'
+
+
+def rle_counts(mask):
+    """Run-length encodes a binary mask in COCO order (column major, starting with a run of zeros).
+    Args:
+        mask (np.ndarray): (H, W) bool mask.
+    Returns:
+        np.ndarray: Run lengths.
+    """
+    flat = np.asfortranarray(mask).ravel(order='F').astype(np.int8)
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], changes, [flat.size])))
+    if flat.size and flat[0]:
+        counts = np.concatenate(([0], counts))
+    return counts
+
+
+def rle_string(counts):
+    """Compresses run lengths to the string format of pycocotools (LEB128 like, deltas after the third run).
+    Args:
+        counts (np.ndarray): Run lengths as returned by rle_counts.
+    Returns:
+        str: Compressed counts.
+    """
+    chars = []
+    counts = [int(c) for c in counts]
+    for i, c in enumerate(counts):
+        x = c - counts[i - 2] if i > 2 else c
+        more = True
+        while more:
+            byte = x & 0x1f
+            x >>= 5
+            more = not (x == 0 and not byte & 0x10 or x == -1 and byte & 0x10)
+            if more:
+                byte |= 0x20
+            chars.append(chr(byte + 48))
+    return ''.join(chars)
+
+
+def polygons(mask, epsilon=1.0):
+    """Traces the outer contours of a binary mask as simplified COCO polygons.
+    Args:
+        mask (np.ndarray): (H, W) bool mask.
+        epsilon (float, optional): Maximum distance of the simplified polygon in pixels. Defaults to 1.0.
+    Returns:
+        list: Polygons as flat [x1, y1, x2, y2, ...] lists.
+    """
+    contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    result = []
+    for contour in contours:
+        if epsilon > 0:
+            contour = cv2.approxPolyDP(contour, epsilon, True)
+        if len(contour) >= 3:
+            result.append(contour.reshape(-1).astype(float).tolist())
+    return result
+
+
+def read_instances(iseg_file, table):
+    """Reads an iseg image or id map as component index map.
+    Args:
+        iseg_file (str): Path of the iseg PNG or .npz id map.
+        table (labels.LabelTable): Color lookup table built from config.components.
+    Returns:
+        np.ndarray: (H, W) int32 array of component indices, -1 for background.
+    """
+    if iseg_file.endswith('.npz'):
+        return labels.load_id_map(iseg_file)
+    image = cv2.imread(iseg_file)
+    if image is None:
+        raise ValueError(f'could not read image {iseg_file}')
+    return labels.instance_map(image, table)
+
+
+def image_instances(instances, class_ids, min_area=30, mode='rle', split_blobs=False, epsilon=1.0):
+    """Splits a component index map into COCO instance annotations, one per component shade.
+    Connected component statistics drop fragments smaller than min_area (e.g. anti-aliased edges)
+    and give box and area of what is left.
+
+    Args:
+        instances (np.ndarray): (H, W) array of component indices, -1 for background.
+        class_ids (np.ndarray): YOLO class id per component.
+        min_area (int, optional): Fragments covering fewer pixels are dropped. Defaults to 30.
+        mode (str, optional): 'rle' or 'polygon' segmentation. Defaults to 'rle'.
+        split_blobs (bool, optional): Annotate every connected blob of a component separately. Defaults to False.
+        epsilon (float, optional): Polygon simplification in pixels. Defaults to 1.0.
+    Returns:
+        list: Annotation dicts without id and image_id.
+    """
+    h, w = instances.shape
+    annotations = []
+    for index in np.unique(instances):
+        if index < 0:
+            continue
+        _, blob_labels, stats, _ = cv2.connectedComponentsWithStats((instances == index).astype(np.uint8), connectivity=8)
+        keep = np.flatnonzero(stats[1:, cv2.CC_STAT_AREA] >= min_area) + 1
+        if len(keep) == 0:
+            continue
+        groups = [[k] for k in keep] if split_blobs else [keep]
+        for group in groups:
+            mask = np.isin(blob_labels, group)
+            x0 = stats[group, cv2.CC_STAT_LEFT].min()
+            y0 = stats[group, cv2.CC_STAT_TOP].min()
+            x1 = (stats[group, cv2.CC_STAT_LEFT] + stats[group, cv2.CC_STAT_WIDTH]).max()
+            y1 = (stats[group, cv2.CC_STAT_TOP] + stats[group, cv2.CC_STAT_HEIGHT]).max()
+            if mode == 'polygon':
+                segmentation = polygons(mask, epsilon)
+            else:
+                segmentation = {'size': [h, w], 'counts': rle_string(rle_counts(mask))}
+            annotations.append({
+                'category_id': int(class_ids[index]) + 1,
+                'segmentation': segmentation,
+                'area': int(stats[group, cv2.CC_STAT_AREA].sum()),
+                'bbox': [int(x0), int(y0), int(x1 - x0), int(y1 - y0)],
+                'iscrowd': 0,
+            })
+    return annotations
+
+
+# Color lookup table of a worker process
+_worker_table = None
+
+
+def _init_worker(components):
+    global _worker_table
+    _worker_table = labels.build_label_table(components)
+
+
+def _export_one(iseg_file, min_area, mode, split_blobs, epsilon):
+    try:
+        instances = read_instances(iseg_file, _worker_table)
+    except Exception as e:
+        return None, repr(e)
+    annotations = image_instances(instances, _worker_table.class_ids, min_area, mode, split_blobs, epsilon)
+    return (instances.shape, annotations), None
+
+
+def image_entry(iseg_filename, width, height):
+    """Returns the COCO image entry of the rgb image belonging to an iseg image or id map."""
+    image_id = int(os.path.splitext(iseg_filename)[0].split('_')[-1])
+    file_name = os.path.splitext(iseg_filename)[0].replace('iseg_image_', 'rgb_image_') + '.png'
+    return {'id': image_id, 'file_name': os.path.join('rgb', file_name), 'width': width, 'height': height}
+
+
+def export_coco(input_folder, output_file, components, min_area=30, mode='rle', split_blobs=False, epsilon=1.0,
+                jobs=1, chunksize=16):
+    """Writes a COCO instance segmentation file for all iseg images or id maps in input_folder.
+    Images are processed by a pool of worker processes; images and annotations are streamed to
+    temporary files as results arrive and joined at the end, so masks are never all held in memory.
+
+    Args:
+        input_folder (str): Folder containing the iseg images or id maps.
+        output_file (str): Path of the COCO JSON file.
+        components (list): Component entries from config.json.
+        min_area (int, optional): Fragments covering fewer pixels are dropped. Defaults to 30.
+        mode (str, optional): 'rle' or 'polygon' segmentation. Defaults to 'rle'.
+        split_blobs (bool, optional): Annotate every connected blob of a component separately. Defaults to False.
+        epsilon (float, optional): Polygon simplification in pixels. Defaults to 1.0.
+        jobs (int, optional): Number of worker processes, None for one per CPU. Defaults to 1.
+        chunksize (int, optional): Number of images per task handed to a worker. Defaults to 16.
+    Returns:
+        list: (filename, error) tuples of the images that could not be read.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    filenames = sorted(f for f in os.listdir(input_folder) if f.endswith(('.png', '.npz')))
+    paths = [os.path.join(input_folder, f) for f in filenames]
+    categories = [{'id': class_id + 1, 'name': name} for name, class_id in labels.category_ids(components).items()]
+
+    failures = []
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    worker = partial(_export_one, min_area=min_area, mode=mode, split_blobs=split_blobs, epsilon=epsilon)
+    with tempfile.TemporaryFile('w+', dir=output_dir) as images_tmp, \
+            tempfile.TemporaryFile('w+', dir=output_dir) as annotations_tmp:
+        n_images = 0
+        n_annotations = 0
+        with ProcessPoolExecutor(max_workers=max(1, jobs), initializer=_init_worker, initargs=(components,)) as executor:
+            for filename, (result, error) in zip(filenames, executor.map(worker, paths, chunksize=chunksize)):
+                if error is not None:
+                    failures.append((filename, error))
+                    continue
+                (height, width), annotations = result
+                image = image_entry(filename, width, height)
+
+                # records are appended as they arrive, the first one of each file needs no separator
+                images_tmp.write((',\n' if n_images else '') + json.dumps(image))
+                n_images += 1
+                for annotation in annotations:
+                    n_annotations += 1
+                    annotation.update(id=n_annotations, image_id=image['id'])
+                    annotations_tmp.write((',\n' if n_annotations > 1 else '') + json.dumps(annotation))
+
+        # join header, images and annotations without loading them
+        tmp_file = str(output_file) + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write('{"categories": %s,\n"images": [\n' % json.dumps(categories))
+            for tmp, end in ((images_tmp, '\n],\n"annotations": [\n'), (annotations_tmp, '\n]}\n')):
+                tmp.seek(0)
+                for block in iter(lambda: tmp.read(1 << 20), ''):
+                    f.write(block)
+                f.write(end)
+        os.replace(tmp_file, output_file)
+    return failures
@@ -0,0 +1,206 @@
+import os
+import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+
+# OpenCV only decodes exr files if this is set before the first one is read
+os.environ.setdefault('OPENCV_IO_ENABLE_OPENEXR', '1')
+
+import cv2
+import numpy as np
+
+from util import labels
+
+# Folder in the output dir holding the composited images and their labels in YOLO layout (images/, labels/)
+COMPOSITED_DIRNAME = 'composited'
+
+# Background formats read from backgrounds_dir, hdris are tone mapped
+BACKGROUND_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.hdr', '.exr')
+
+# Defaults of the composite entry of config.json
+DEFAULTS = {
+    'backgrounds': 4,       # composited copies per rendered frame, each on another background
+    'scale': [0.3, 1.0],    # side of the background crop relative to the largest crop of the frame aspect
+    'hflip': 0.5,           # probability of a mirrored background
+    'max_side': 2048,       # backgrounds are downscaled to this size once when loaded
+}
+
+
+def tone_map(image):
+    """Maps a linear float hdri to an 8 bit sRGB like image (Reinhard, gamma 2.2)."""
+    image = np.maximum(image.astype(np.float32), 0)
+    # expose the median luminance to middle grey before compressing the highlights
+    image *= 0.18 / max(float(np.median(image[::8, ::8])), 1e-6)
+    image = (image / (1 + image)) ** (1 / 2.2)
+    return (image * 255 + 0.5).astype(np.uint8)
+
+
+@lru_cache(maxsize=16)
+def load_background(path, max_side=2048):
+    """Loads a background image as (h, w, 3) uint8 BGR, downscaled to at most max_side pixels.
+    Backgrounds are cached per worker process, hdris are decoded and tone mapped only once.
+    Returns None for a file OpenCV cannot read, which is cached as well.
+    """
+    image = cv2.imread(path, cv2.IMREAD_ANYDEPTH | cv2.IMREAD_COLOR)
+    if image is None:
+        print('Skipping unreadable background {}'.format(path))
+        return None
+    if image.dtype == np.uint16:
+        image = (image >> 8).astype(np.uint8)
+    elif image.dtype != np.uint8:
+        image = tone_map(image)
+    scale = max_side / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return image
+
+
+def pick_background(background_paths, index, rng, max_side=2048):
+    """Loads a picked background, an unreadable one is replaced by another random background.
+    Args:
+        background_paths (list): Paths of all backgrounds.
+        index (int): Index of the picked background.
+        rng (np.random.Generator): Random number generator, only used to replace an unreadable pick.
+        max_side (int, optional): Size backgrounds are downscaled to. Defaults to 2048.
+    Returns:
+        np.ndarray: (h, w, 3) uint8 background.
+    """
+    image = load_background(background_paths[index], max_side)
+    if image is not None:
+        return image
+    for i in rng.permutation(len(background_paths)):
+        image = load_background(background_paths[i], max_side)
+        if image is not None:
+            return image
+    raise ValueError('no readable background in {}'.format(os.path.dirname(background_paths[index])))
+
+
+def background_crop(background, width, height, rng, settings):
+    """Cuts a random window with the aspect of the frame out of a background and resizes it to the frame size.
+    Args:
+        background (np.ndarray): (h, w, 3) uint8 background.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+        rng (np.random.Generator): Random number generator.
+        settings (dict): Compositing settings, see DEFAULTS.
+    Returns:
+        np.ndarray: (height, width, 3) uint8 image.
+    """
+    bh, bw = background.shape[:2]
+    # largest window of the frame aspect fitting into the background
+    fit = min(bw / width, bh / height)
+    side = rng.uniform(*settings['scale'])
+    cw, ch = max(1, int(width * fit * side)), max(1, int(height * fit * side))
+    x0, y0 = rng.integers(0, bw - cw + 1), rng.integers(0, bh - ch + 1)
+    crop = background[y0:y0 + ch, x0:x0 + cw]
+    if rng.random() < settings['hflip']:
+        crop = crop[:, ::-1]
+    interpolation = cv2.INTER_AREA if cw > width else cv2.INTER_LINEAR
+    return cv2.resize(crop, (width, height), interpolation=interpolation)
+
+
+def blend(foregrounds, backgrounds):
+    """Blends a batch of alpha matted renders onto backgrounds in one vectorized pass.
+    Args:
+        foregrounds (np.ndarray): (b, h, w, 4) uint8 BGRA renders with straight alpha as written by Blender.
+        backgrounds (np.ndarray): (b, h, w, 3) uint8 BGR backgrounds.
+    Returns:
+        np.ndarray: (b, h, w, 3) uint8 images.
+    """
+    alpha = foregrounds[..., 3:].astype(np.float32) * (1 / 255)
+    out = backgrounds.astype(np.float32)
+    out += (foregrounds[..., :3] - out) * alpha
+    out += 0.5
+    return out.astype(np.uint8)
+
+
+def _composite_chunk(filenames, rgb_folder, labels_folder, background_paths, output_folder, settings, seed):
+    """Loads a chunk of renders once and writes all of their composites, collecting failures instead of raising."""
+    failures = []
+    frames = []
+    for filename in filenames:
+        image = cv2.imread(os.path.join(rgb_folder, filename), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            failures.append((filename, 'unreadable image'))
+        elif image.ndim != 3 or image.shape[2] != 4:
+            failures.append((filename, 'no alpha channel, render with render_settings.transparent: 1'))
+        else:
+            frames.append((filename, image))
+    if not frames:
+        return failures
+
+    # frames of different size are batched separately
+    by_shape = {}
+    for frame in frames:
+        by_shape.setdefault(frame[1].shape, []).append(frame)
+
+    for batch in by_shape.values():
+        foregrounds = np.stack([image for _, image in batch])
+        h, w = foregrounds.shape[1:3]
+        # the backgrounds depend on the frames of the chunk, not on the worker running it
+        rng = np.random.default_rng([seed, zlib.crc32(batch[0][0].encode())])
+        for variant in range(1, settings['backgrounds'] + 1):
+            try:
+                picks = rng.integers(0, len(background_paths), len(batch))
+                backgrounds = np.stack([background_crop(pick_background(background_paths, i, rng, settings['max_side']),
+                                                        w, h, rng, settings) for i in picks])
+                images = blend(foregrounds, backgrounds)
+            except Exception as e:
+                failures.extend(('%s_%d' % (os.path.splitext(filename)[0], variant), repr(e)) for filename, _ in batch)
+                continue
+            for (filename, _), image in zip(batch, images):
+                stem = '%s_%d' % (os.path.splitext(filename)[0], variant)
+                try:
+                    cv2.imwrite(os.path.join(output_folder, 'images', stem + '.png'), image)
+                    # the geometry did not change, so the labels of the render apply as they are
+                    shutil.copyfile(os.path.join(labels_folder, labels.label_filename(filename)),
+                                    os.path.join(output_folder, 'labels', stem + '.txt'))
+                except Exception as e:
+                    failures.append((stem, repr(e)))
+    return failures
+
+
+def composite_dataset(rgb_folder, labels_folder, backgrounds_dir, output_folder, settings=None, seed=0, jobs=1, chunksize=16):
+    """Composites every labelled alpha matted render onto several backgrounds and copies its labels along.
+    Renders are loaded once per chunk and blended as one batch per background draw. Every worker process keeps
+    the backgrounds it loaded, hdris are tone mapped to 8 bit. Results only depend on the seed and the chunk size.
+
+    Args:
+        rgb_folder (str): Folder containing the rgb images rendered with render_settings.transparent.
+        labels_folder (str): Folder containing their YOLO label files.
+        backgrounds_dir (str): Folder containing the background images or hdris.
+        output_folder (str): Folder the composites are written to, as images/ and labels/.
+        settings (dict, optional): Compositing settings, missing keys use DEFAULTS.
+        seed (int, optional): Random seed. Defaults to 0.
+        jobs (int, optional): Number of worker processes, None for one per CPU. Defaults to 1.
+        chunksize (int, optional): Number of frames per batch handed to a worker. Defaults to 16.
+    Returns:
+        list: (filename, error) tuples of the frames that could not be composited.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    settings = dict(DEFAULTS, **(settings or {}))
+    background_paths = [os.path.join(backgrounds_dir, f) for f in sorted(os.listdir(backgrounds_dir))
+                        if f.lower().endswith(BACKGROUND_EXTENSIONS)]
+    if not background_paths:
+        raise Exception('No background images in {}'.format(backgrounds_dir))
+    os.makedirs(os.path.join(output_folder, 'images'), exist_ok=True)
+    os.makedirs(os.path.join(output_folder, 'labels'), exist_ok=True)
+
+    # frames without labels, e.g. culled or failed ones, are skipped
+    filenames = sorted(f for f in os.listdir(rgb_folder) if f.endswith('.png')
+                       and os.path.exists(os.path.join(labels_folder, labels.label_filename(f))))
+    chunks = [filenames[i:i + chunksize] for i in range(0, len(filenames), chunksize)]
+    worker = partial(_composite_chunk, rgb_folder=rgb_folder, labels_folder=labels_folder,
+                     background_paths=background_paths, output_folder=output_folder, settings=settings, seed=seed)
+
+    failures = []
+    if jobs <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            failures.extend(worker(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(chunks))) as executor:
+            for chunk_failures in executor.map(worker, chunks):
+                failures.extend(chunk_failures)
+    return failures
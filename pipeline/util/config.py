@@ -4,13 +4,18 @@ import os
 class Config():
     def __init__(self,config_path):
 
-        # Check if the config file exists
-        if not os.path.exists(config_path):
-            raise FileNotFoundError(f'{config_path} not found')
+        # An already loaded config can be passed as dict, e.g. a job sent to the generation server
+        if isinstance(config_path, dict):
+            json_config = config_path
+        else:
+            # Check if the config file exists
+            if not os.path.exists(config_path):
+                raise FileNotFoundError(f'{config_path} not found')
 
-        # Open the config file and load it as a JSON object
-        with open(config_path, 'r') as file:
-            json_config = json.load(file)
+            # Open the config file and load it as a JSON object
+            with open(config_path, 'r') as file:
+                json_config = json.load(file)
+        self.data = json_config
 
         # Load data from the config file
         self.input_dir = json_config['input_dir']
@@ -18,6 +23,19 @@ class Config():
         self.textures_dir = json_config['textures_dir']
         self.backgrounds_dir = json_config['backgrounds_dir']
         self.components = json_config['components']
+        self.ignore = json_config.get('ignore', [])
+        self.cache_dir = json_config.get('cache_dir', 'cache')
+        self.output_format = json_config.get('output_format', 'files')
+        self.shard_max_samples = json_config.get('shard_max_samples', 1000)
+        self.shard_max_mb = json_config.get('shard_max_mb', 1024)
+        self.queue_batch_size = json_config.get('queue_batch_size', 50)
+        self.queue_heartbeat = json_config.get('queue_heartbeat', 30)
+        self.queue_lease = json_config.get('queue_lease', 300)
+        self.queue_max_attempts = json_config.get('queue_max_attempts', 3)
+        self.stall_timeout = json_config.get('stall_timeout', 0)
+        self.server_address = json_config.get('server_address', 'localhost:6011')
+        self.augment = json_config.get('augment', {})
+        self.composite = json_config.get('composite', {})
 
         render_settings=json_config['render_settings']
         self.n_images= render_settings['n_images']
@@ -35,4 +53,61 @@ class Config():
         self.scale_distractors_max = render_settings["scale_distractors_max"]
         self.add_distractors = render_settings["add_distractors"]
         self.random_seed = render_settings["random_seed"]
+        self.material_pool_size = render_settings.get("material_pool_size", 0)
+        self.hdri_cache_mb = render_settings.get("hdri_cache_mb", 0)
+        self.hdri_preload = render_settings.get("hdri_preload", 0)
+        self.asset_cache = render_settings.get("asset_cache", 1)
+        self.stl_import_jobs = render_settings.get("stl_import_jobs", None)
+        self.render_profile = render_settings.get("profile", "default")
+        self.render_profiles = render_settings.get("profiles", {})
+        self.annotation_mode = render_settings.get("annotation_mode", "iseg")
+        self.render_iseg = render_settings.get("render_iseg", 1)
+        self.occlusion_samples = render_settings.get("occlusion_samples", 0)
+        self.min_visible_fraction = render_settings.get("min_visible_fraction", 0.0)
+        self.segmentation_format = render_settings.get("segmentation_format", "rgb")
+        self.trace = render_settings.get("trace", 0)
+        self.camera_sampling = render_settings.get("camera_sampling", {"method": "fibonacci"})
+        self.light_sampling = render_settings.get("light_sampling", {"method": "uniform"})
+        self.cull_min_visible = render_settings.get("cull_min_visible", 0.0)
+        self.cull_min_components = render_settings.get("cull_min_components", 1.0)
+        self.cull_samples = render_settings.get("cull_samples", 32)
+        self.cull_retries = render_settings.get("cull_retries", 3)
+        self.cull_resample_camera = render_settings.get("cull_resample_camera", 0)
+        self.static_batch = render_settings.get("static_batch", 0)
+        self.static_batch_groups = render_settings.get("static_batch_groups", 4)
+        self.transparent = render_settings.get("transparent", 0)
+
+    def profile(self, name=None):
+        """Returns the render profile with the given name, the configured one if None.
+        Keys: engine, samples, adaptive_threshold, resolution, tile_size, threads, denoise,
+        segmentation ('combined' or 'flat'), frame_budget (seconds, 0 = off) and min_samples.
+        """
+        name = name or self.render_profile
+        if name not in self.render_profiles and name != "default":
+            raise KeyError(f'render profile {name} not found in config')
+        profile = {"resolution": [640, 640], "segmentation": "combined", "frame_budget": 0, "min_samples": 1}
+        profile.update(self.render_profiles.get(name, {}))
+        return profile
+
+
+def apply_overrides(json_config, assignments):
+    """Returns a copy of a loaded config with KEY=VALUE assignments applied.
+    Nested keys are separated by dots, e.g. render_settings.n_images=200. Values are parsed as JSON,
+    anything that is no valid JSON is used as string.
+    """
+    json_config = json.loads(json.dumps(json_config))
+    for assignment in assignments:
+        key, sep, text = assignment.partition('=')
+        if not sep:
+            raise ValueError(f'config override {assignment} is not of the form KEY=VALUE')
+        try:
+            value = json.loads(text)
+        except ValueError:
+            value = text
+        entry = json_config
+        *parents, name = key.split('.')
+        for parent in parents:
+            entry = entry.setdefault(parent, {})
+        entry[name] = value
+    return json_config
         
\ No newline at end of file
@@ -0,0 +1,66 @@
+import json
+import os
+
+# Annotation file written by zpy's OutputZUMO
+ZUMO_ANNOTATION_FILENAME = '_annotations.zumo.json'
+
+
+def shard_annotation_filename(shard):
+    """Returns the name of the zumo annotation file written by a render shard."""
+    return '_annotations.shard_%03d.zumo.json' % shard
+
+
+def _values(entries):
+    # zumo files store images and categories as dicts keyed by id
+    return list(entries.values()) if isinstance(entries, dict) else list(entries)
+
+
+def merge_zumo_annotations(annotation_files, output_file):
+    """Merges the zumo annotation files of several render shards into one dataset.
+    Image ids are renumbered in file order and the annotations are remapped accordingly,
+    so shards given in order of their frame ranges give the same ids as a single process run.
+    Args:
+        annotation_files (list): Shard annotation files, ordered by frame range.
+        output_file (str): Path of the merged annotation file.
+    Returns:
+        dict: The merged annotations.
+    """
+    merged = None
+    for annotation_file in annotation_files:
+        with open(annotation_file, 'r') as file:
+            shard = json.load(file)
+
+        if merged is None:
+            merged = {
+                'metadata': shard.get('metadata', {}),
+                'categories': shard.get('categories', {}),
+                'images': {},
+                'annotations': [],
+            }
+
+        # renumber images and remap the annotations pointing to them
+        id_map = {}
+        for image in _values(shard.get('images', {})):
+            new_id = len(merged['images'])
+            id_map[image['id']] = new_id
+            merged['images'][new_id] = dict(image, id=new_id)
+        for annotation in shard.get('annotations', []):
+            annotation = dict(annotation)
+            if annotation.get('image_id') in id_map:
+                annotation['image_id'] = id_map[annotation['image_id']]
+            if 'id' in annotation:
+                annotation['id'] = len(merged['annotations'])
+            merged['annotations'].append(annotation)
+
+    if merged is None:
+        raise ValueError('no annotation files to merge')
+
+    for key, entries in (('num_images', merged['images']), ('num_annotations', merged['annotations'])):
+        if key in merged['metadata']:
+            merged['metadata'][key] = len(entries)
+
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, 'w') as file:
+        json.dump(merged, file, indent=4)
+    os.replace(tmp_file, output_file)
+    return merged
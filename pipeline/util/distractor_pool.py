@@ -0,0 +1,80 @@
+import bpy
+
+
+class DistractorPool():
+    """Preallocated distractor objects that are shown, moved and hidden instead of created and deleted.
+
+    n_per_shape objects of every shape are made once in a dedicated collection,
+    each with its own mesh so materials can be assigned per object.
+    """
+    COLLECTION_NAME = 'Distractors'
+
+    # shape name -> operator used once to build the template mesh
+    SHAPES = {
+        'cube': bpy.ops.mesh.primitive_cube_add,
+        'cylinder': bpy.ops.mesh.primitive_cylinder_add,
+        'cone': bpy.ops.mesh.primitive_cone_add,
+        'torus': bpy.ops.mesh.primitive_torus_add,
+    }
+
+    def __init__(self, n_per_shape):
+        self.collection = bpy.data.collections.get(self.COLLECTION_NAME)
+        if self.collection is None:
+            self.collection = bpy.data.collections.new(self.COLLECTION_NAME)
+            bpy.context.scene.collection.children.link(self.collection)
+
+        self.objects = {}
+        for shape, add_primitive in self.SHAPES.items():
+            template = None
+            objs = []
+            for i in range(n_per_shape):
+                name = 'Distractor.%s.%03d' % (shape, i)
+                obj = bpy.data.objects.get(name)
+                if obj is None:
+                    if template is None:
+                        template = self._template_mesh(add_primitive, shape)
+                    obj = bpy.data.objects.new(name, template.copy())
+                    self.collection.objects.link(obj)
+                objs.append(obj)
+            if template is not None:
+                bpy.data.meshes.remove(template)
+            self.objects[shape] = objs
+
+        self.hide_all()
+
+    @staticmethod
+    def _template_mesh(add_primitive, shape):
+        add_primitive(location=(0, 0, 0))
+        obj = bpy.context.object
+        mesh = obj.data
+        mesh.name = 'Distractor.%s' % shape
+        bpy.data.objects.remove(obj)
+        return mesh
+
+    def hide_all(self):
+        """Hides the distractors of the previous frame."""
+        for obj in self.collection.objects:
+            obj.hide_render = True
+            obj.hide_viewport = True
+        self.active = []
+        self._used = {shape: 0 for shape in self.SHAPES}
+
+    def show(self, shape, location, rotation, scale=1.0):
+        """Shows the next unused distractor of a shape.
+        Args:
+            shape (str): One of SHAPES.
+            location (Vector): Position of the distractor.
+            rotation (Vector): Euler rotation of the distractor.
+            scale (float, optional): Uniform scale. Defaults to 1.0.
+        Returns:
+            bpy.types.Object: The distractor object.
+        """
+        obj = self.objects[shape][self._used[shape]]
+        self._used[shape] += 1
+        obj.location = location
+        obj.rotation_euler = rotation
+        obj.scale = (scale, scale, scale)
+        obj.hide_render = False
+        obj.hide_viewport = False
+        self.active.append(obj)
+        return obj
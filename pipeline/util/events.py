@@ -0,0 +1,45 @@
+import json
+
+# Marker in front of the event lines blenderscript.py writes to stdout
+EVENT_PREFIX = '@blendr '
+
+
+# Receiver of the events instead of stdout, see set_sink
+_sink = None
+
+
+def set_sink(sink):
+    """Sends the emitted events to sink instead of stdout, e.g. to the client of a generation server job.
+    Args:
+        sink (callable): Called with every event dict, None writes events to stdout again.
+    """
+    global _sink
+    _sink = sink
+
+
+def emit(event, **fields):
+    """Writes an event line to stdout so the process running Blender can react to it.
+    Args:
+        event (str): Event name, e.g. 'frame'.
+        **fields: JSON serializable event data.
+    """
+    if _sink is not None:
+        _sink(dict(event=event, **fields))
+        return
+    print(EVENT_PREFIX + json.dumps(dict(event=event, **fields)), flush=True)
+
+
+def parse(line):
+    """Parses an event line written by emit.
+    Args:
+        line (str): Line read from the Blender process output.
+    Returns:
+        dict: The event, or None if the line is regular Blender output.
+    """
+    start = line.find(EVENT_PREFIX)
+    if start == -1:
+        return None
+    try:
+        return json.loads(line[start + len(EVENT_PREFIX):])
+    except ValueError:
+        return None
@@ -1,9 +1,13 @@
+import io
 import os
 import shutil
-import json
 import cv2
-import os
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from util import labels
+from util import shard_writer
 
 def move_images_to_folder(folder_path):
     # create folders for rgb and iseg images
@@ -42,101 +46,211 @@ def move_labels_to_folder(folder_path):
 
 
 
-def extract_bbox_annots(input_folder, output_folder):
-
-    # define the BGR values for each object
-    COLORS = {
-    (0, 255, 0): 'akkuhalter',
-    (0, 255, 255): 'ausleger',
-    (0, 230, 230): 'ausleger',
-    (0, 204, 204): 'ausleger',
-    (0, 179, 179): 'ausleger',
-    (0, 77, 255): 'deckplatte',
-    (255, 0, 0): 'grundplatte',
-    (153, 26, 255): 'landekufe',
-    (153, 51, 255): 'landekufe',
-    (255, 255, 0): 'motor',
-    (230, 230, 0): 'motor',
-    (204, 204, 0): 'motor',
-    (179, 179, 0): 'motor',
-    (0, 0, 255): 'propeller',
-    (0, 0, 230): 'propeller',
-    (0, 0, 204): 'propeller',
-    (0, 0, 179): 'propeller',
-    (26, 77, 128): 'schraube_m6',
-    (51, 77, 128): 'schraube_m6',
-    (77, 77, 128): 'schraube_m6',
-    (102, 77, 128): 'schraube_m6',
-    }
-
-    # define YOLO label format
-    LABEL_FORMAT = "{class_id} {center_x:.6f} {center_y:.6f} {width:.6f} {height:.6f}"
-
-    # define YOLO class IDs
-    CLASS_IDS = {
-    'akkuhalter': 0,
-    'ausleger': 1,
-    'deckplatte': 2,
-    'grundplatte': 3,
-    'landekufe': 4,
-    'motor': 5,
-    'propeller': 6,
-    'schraube_m6': 7
-    }
-
-    # loop through each image in the input folder
-    for filename in os.listdir(input_folder):
-        if filename.endswith('.png'):
-            # read the image and convert to BGR format
-            image = cv2.imread(os.path.join(input_folder, filename))
-            bgr_image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-
-            # create an empty list to store the YOLO labels
-            yolo_labels = []
-
-            # loop through each color and extract the bounding box information
-            for color, class_name in COLORS.items():
-                mask = cv2.inRange(image, color, color)
-                contours, hierarchy = cv2.findContours(mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
-                bounding_boxes = []
-                for i, contour in enumerate(contours):
-                    # check if the contour is a hole inside another contour
-                    if hierarchy[0][i][3] != -1:
-                        continue
-
-                    x, y, w, h = cv2.boundingRect(contour)
-
-                    area = w * h
-                    if area < 30:
-                        continue
-
-                    bounding_boxes.append((x, y, x + w, y + h))
-
-                # combine all bounding boxes of the same color into one
-                if bounding_boxes:
-                    x_min = min([bb[0] for bb in bounding_boxes])
-                    y_min = min([bb[1] for bb in bounding_boxes])
-                    x_max = max([bb[2] for bb in bounding_boxes])
-                    y_max = max([bb[3] for bb in bounding_boxes])
-                    center_x = (x_min + x_max) / (2 * image.shape[1])
-                    center_y = (y_min + y_max) / (2 * image.shape[0])
-                    width = (x_max - x_min) / image.shape[1]
-                    height = (y_max - y_min) / image.shape[0]
-
-                    # create the YOLO label string
-                    label = LABEL_FORMAT.format(
-                        class_id=CLASS_IDS[class_name],
-                        center_x=center_x,
-                        center_y=center_y,
-                        width=width,
-                        height=height
-                    )
-
-                    # add the YOLO label to the list
-                    yolo_labels.append(label)
-
-            # save the YOLO label file
-            label_filename = label_filename = f"rgb_image_{int(os.path.splitext(filename)[0].split('_')[-1]):03d}.txt"
-            with open(os.path.join(output_folder, label_filename), 'w') as f:
-                f.write('\n'.join(yolo_labels))
+def annotate_iseg_image(image, table, min_area=30):
+    """Computes the YOLO labels of a decoded iseg image.
+    Args:
+        image (np.ndarray): (H, W, 3) uint8 image in OpenCV channel order.
+        table (labels.LabelTable): Color lookup table built from config.components.
+        min_area (int, optional): Fragments with a smaller bounding rect are ignored. Defaults to 30.
+    Returns:
+        list: YOLO label strings.
+    """
+    # map pixels to components and reduce to one box per component
+    return annotate_instances(labels.instance_map(image, table), table, min_area)
+
+
+def annotate_instances(instances, table, min_area=30):
+    """Computes the YOLO labels of a component index map, e.g. a loaded id map.
+    Args:
+        instances (np.ndarray): (H, W) array of component indices, -1 for background.
+        table (labels.LabelTable): Color lookup table built from config.components.
+        min_area (int, optional): Fragments with a smaller bounding rect are ignored. Defaults to 30.
+    Returns:
+        list: YOLO label strings.
+    """
+    boxes, present = labels.instance_boxes(instances, len(table.names), min_area)
+    return labels.yolo_labels(boxes, present, table.class_ids, instances.shape[1], instances.shape[0])
+
+
+def annotate_iseg_file(iseg_file, output_folder, table, min_area=30):
+    """Writes the YOLO label file for a single iseg image or id map.
+    Args:
+        iseg_file (str): Path of the iseg image, or of the .npz id map.
+        output_folder (str): Folder the YOLO label file is written to.
+        table (labels.LabelTable): Color lookup table built from config.components.
+        min_area (int, optional): Fragments with a smaller bounding rect are ignored. Defaults to 30.
+    Returns:
+        str: Path of the written label file.
+    """
+    if iseg_file.endswith('.npz'):
+        # id maps are indexed directly
+        yolo_labels = annotate_instances(labels.load_id_map(iseg_file), table, min_area)
+    else:
+        # read the image in BGR format
+        image = cv2.imread(iseg_file)
+        if image is None:
+            raise ValueError(f'could not read image {iseg_file}')
+        yolo_labels = annotate_iseg_image(image, table, min_area)
+
+    # save the YOLO label file
+    label_file = os.path.join(output_folder, labels.label_filename(os.path.basename(iseg_file)))
+    labels.write_labels(label_file, yolo_labels)
+    return label_file
+
+
+def _annotate_chunk(filenames, input_folder, output_folder, components, min_area):
+    """Annotates a chunk of iseg images and collects per file failures instead of raising."""
+    table = labels.build_label_table(components)
+    failures = []
+    for filename in filenames:
+        try:
+            annotate_iseg_file(os.path.join(input_folder, filename), output_folder, table, min_area)
+        except Exception as e:
+            failures.append((filename, repr(e)))
+    return failures
+
+
+def extract_bbox_annots(input_folder, output_folder, components, min_area=30, jobs=1, chunksize=64):
+    """Writes one YOLO label file per iseg image in input_folder.
+    Each image is decoded in a single pass: pixels are packed to one integer, mapped to their
+    component through a lookup table built from config.components and reduced to per component extents.
+    Images are handed out in chunks to a pool of worker processes if jobs > 1.
+
+    Args:
+        input_folder (str): Folder containing the iseg images.
+        output_folder (str): Folder the YOLO label files are written to.
+        components (list): Component entries from config.json.
+        min_area (int, optional): Fragments with a smaller bounding rect are ignored. Defaults to 30.
+        jobs (int, optional): Number of worker processes, None for one per CPU. Defaults to 1.
+        chunksize (int, optional): Number of images per task handed to a worker. Defaults to 64.
+    Returns:
+        list: (filename, error) tuples of the images that could not be annotated.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    # sorted so chunks and outputs do not depend on directory order
+    filenames = sorted(f for f in os.listdir(input_folder) if f.endswith(('.png', '.npz')))
+    chunks = [filenames[i:i + chunksize] for i in range(0, len(filenames), chunksize)]
+    worker = partial(_annotate_chunk, input_folder=input_folder, output_folder=output_folder,
+                     components=components, min_area=min_area)
+
+    failures = []
+    if jobs <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            failures.extend(worker(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(chunks))) as executor:
+            for chunk_failures in executor.map(worker, chunks):
+                failures.extend(chunk_failures)
+    return failures
+
+
+def _annotate_shard(shard_path, components, min_area):
+    """Adds a YOLO label member to every sample of a tar shard that has an iseg image but no labels."""
+    table = labels.build_label_table(components)
+    samples = list(shard_writer.read_samples(shard_path))
+    unlabelled = [(key, members) for key, members in samples
+                  if 'txt' not in members and ('iseg.png' in members or 'iseg.npz' in members)]
+    if not unlabelled:
+        return []
+
+    failures = []
+    for key, members in unlabelled:
+        try:
+            if 'iseg.npz' in members:
+                yolo_labels = annotate_instances(labels.load_id_map(io.BytesIO(members['iseg.npz'])), table, min_area)
+            else:
+                image = cv2.imdecode(np.frombuffer(members['iseg.png'], np.uint8), cv2.IMREAD_COLOR)
+                if image is None:
+                    raise ValueError(f'could not decode iseg image of sample {key}')
+                yolo_labels = annotate_iseg_image(image, table, min_area)
+            members['txt'] = '\n'.join(yolo_labels).encode('utf-8')
+        except Exception as e:
+            failures.append(('%s/%s' % (os.path.basename(shard_path), key), repr(e)))
+    shard_writer.write_shard(shard_path, samples)
+    return failures
+
+
+def annotate_tar_shards(shard_folder, components, min_area=30, jobs=1):
+    """Adds YOLO labels to the samples of all tar shards in shard_folder, one shard per worker task.
+    Blender labels the frames it packs, so this only rewrites shards of earlier versions that were packed
+    without labels. Shards whose index marks them labelled are not opened at all.
+
+    Args:
+        shard_folder (str): Folder containing the tar shards.
+        components (list): Component entries from config.json.
+        min_area (int, optional): Fragments with a smaller bounding rect are ignored. Defaults to 30.
+        jobs (int, optional): Number of worker processes, None for one per CPU. Defaults to 1.
+    Returns:
+        list: (shard/key, error) tuples of the samples that could not be annotated.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    shards = sorted(os.path.join(shard_folder, f) for f in os.listdir(shard_folder) if f.endswith('.tar'))
+    shards = [shard for shard in shards if not shard_writer.is_labelled(shard)]
+    worker = partial(_annotate_shard, components=components, min_area=min_area)
+
+    failures = []
+    if jobs <= 1 or len(shards) <= 1:
+        for shard in shards:
+            failures.extend(worker(shard))
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(shards))) as executor:
+            for shard_failures in executor.map(worker, shards):
+                failures.extend(shard_failures)
+    return failures
+
+
+# Color lookup table of a streaming annotation worker process
+_worker_table = None
+
+
+def _init_worker(components):
+    global _worker_table
+    _worker_table = labels.build_label_table(components)
+
+
+def _annotate_one(iseg_file, output_folder, min_area):
+    annotate_iseg_file(iseg_file, output_folder, _worker_table, min_area)
+
+
+class StreamingAnnotator():
+    """Annotates iseg images while Blender is still rendering later frames.
+    Pass on_event to render.main; every 'frame' event submits the finished iseg image to a process pool.
+    """
+    def __init__(self, output_folder, components, min_area=30, jobs=None):
+        self.output_folder = output_folder
+        self.min_area = min_area
+        self.failures = []
+        self._pending = {}
+        self._executor = ProcessPoolExecutor(max_workers=jobs or os.cpu_count() or 1,
+                                             initializer=_init_worker, initargs=(components,))
+
+    def submit(self, iseg_file):
+        future = self._executor.submit(_annotate_one, iseg_file, self.output_folder, self.min_area)
+        self._pending[future] = os.path.basename(iseg_file)
+        future.add_done_callback(self._collect)
+
+    def on_event(self, event):
+        # frames labelled geometrically in blender need no iseg annotation
+        if event.get('event') == 'frame' and event.get('iseg') and not event.get('labelled'):
+            self.submit(event['iseg'])
+
+    def _collect(self, future):
+        filename = self._pending.pop(future)
+        if future.exception() is not None:
+            self.failures.append((filename, repr(future.exception())))
+
+    def close(self):
+        """Waits for all submitted images and shuts the pool down."""
+        self._executor.shutdown(wait=True)
+        self.failures.sort()
+        return self.failures
+
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *exc):
+        self.close()
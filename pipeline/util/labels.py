@@ -0,0 +1,316 @@
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
+# YOLO label format
+LABEL_FORMAT = "{class_id} {center_x:.6f} {center_y:.6f} {width:.6f} {height:.6f}"
+
+# Lookup table mapping packed segmentation colors to components and YOLO classes
+LabelTable = namedtuple('LabelTable', ['keys', 'instances', 'class_ids', 'names'])
+
+
+def to_uint8(value):
+    """Converts a color channel in [0, 1] to the 8 bit value written to the iseg PNGs.
+    Args:
+        value (float): Channel value as given in config.json.
+    Returns:
+        int: Channel value in [0, 255].
+    """
+    return int(value * 255 + 0.5)
+
+
+def pack_bgr(image):
+    """Packs the channels of a BGR image into one integer per pixel.
+    Args:
+        image (np.ndarray): (H, W, 3) uint8 image in OpenCV channel order.
+    Returns:
+        np.ndarray: (H, W) uint32 array holding (B << 16) | (G << 8) | R.
+    """
+    image = image.astype(np.uint32)
+    return (image[..., 0] << 16) | (image[..., 1] << 8) | image[..., 2]
+
+
+def category_ids(components):
+    """Assigns YOLO class ids to the categories in config.components.
+    Ids are given in order of first appearance, the same order used for the saver categories.
+    Args:
+        components (list): Component entries from config.json.
+    Returns:
+        dict: Category name -> class id.
+    """
+    ids = {}
+    for c in components:
+        if c['category'] not in ids:
+            ids[c['category']] = len(ids)
+    return ids
+
+
+def build_label_table(components):
+    """Builds the color lookup table used to decode iseg images.
+    Args:
+        components (list): Component entries from config.json (R/G/B/category).
+    Returns:
+        LabelTable: Sorted packed colors, component index per color, class id and name per component.
+    """
+    ids = category_ids(components)
+    colors = {}
+    for index, c in enumerate(components):
+        key = (to_uint8(c['B']) << 16) | (to_uint8(c['G']) << 8) | to_uint8(c['R'])
+        # first component wins if two share a color
+        colors.setdefault(key, index)
+
+    keys = np.array(sorted(colors), dtype=np.uint32)
+    instances = np.array([colors[k] for k in keys], dtype=np.int32)
+    class_ids = np.array([ids[c['category']] for c in components], dtype=np.int32)
+    names = [c['name'] for c in components]
+    return LabelTable(keys, instances, class_ids, names)
+
+
+def instance_map(image, table):
+    """Maps every pixel of a BGR iseg image to the index of its component.
+    Args:
+        image (np.ndarray): (H, W, 3) uint8 image in OpenCV channel order.
+        table (LabelTable): Table created by build_label_table.
+    Returns:
+        np.ndarray: (H, W) int32 array of component indices, -1 for background.
+    """
+    packed = pack_bgr(image)
+    if len(table.keys) == 0:
+        return np.full(packed.shape, -1, dtype=np.int32)
+    pos = np.searchsorted(table.keys, packed)
+    np.minimum(pos, len(table.keys) - 1, out=pos)
+    return np.where(table.keys[pos] == packed, table.instances[pos], -1).astype(np.int32)
+
+
+def instance_boxes(instances, n_instances, min_area=30):
+    """Reduces a component index map to one bounding box per component.
+    Extents are found in a single pass over the map. Like the contour based extraction this replaces,
+    connected fragments of a component whose bounding rect is smaller than min_area are dropped
+    before the box is taken, so stray specks do not stretch it.
+    Args:
+        instances (np.ndarray): (H, W) array of component indices, -1 for background.
+        n_instances (int): Number of components.
+        min_area (int, optional): Fragments with a smaller bounding rect (in pixels) are dropped. Defaults to 30.
+    Returns:
+        tuple: (n, 4) int array of boxes (x_min, y_min, x_max, y_max), max exclusive,
+            and (n,) bool array marking the components found in the image.
+    """
+    h, w = instances.shape
+    ys, xs = np.nonzero(instances >= 0)
+    ids = instances[ys, xs]
+
+    # per component occupancy of every row and column
+    rows = np.bincount(ids * h + ys, minlength=n_instances * h).reshape(n_instances, h) > 0
+    cols = np.bincount(ids * w + xs, minlength=n_instances * w).reshape(n_instances, w) > 0
+    present = np.bincount(ids, minlength=n_instances) > 0
+
+    boxes = np.stack([
+        cols.argmax(axis=1),
+        rows.argmax(axis=1),
+        w - cols[:, ::-1].argmax(axis=1),
+        h - rows[:, ::-1].argmax(axis=1),
+    ], axis=1)
+    if min_area > 1:
+        _drop_fragments(instances, boxes, present, min_area)
+    return boxes, present
+
+
+def _drop_fragments(instances, boxes, present, min_area):
+    try:
+        import cv2
+    except ImportError:
+        # blender has no OpenCV, it labels the frames it packs into tar shards with the numpy fallback
+        cv2 = None
+
+    for index in np.flatnonzero(present):
+        x_min, y_min, x_max, y_max = boxes[index]
+        # 8-connected fragments are the outer contours found by cv2.findContours
+        mask = (instances[y_min:y_max, x_min:x_max] == index).astype(np.uint8)
+        if cv2 is not None:
+            _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+            x, y, fw, fh = stats[1:, 0], stats[1:, 1], stats[1:, 2], stats[1:, 3]
+        else:
+            x, y, fw, fh = fragment_rects(mask)
+        keep = fw * fh >= min_area
+        if not keep.any():
+            present[index] = False
+        elif not keep.all():
+            boxes[index] = [x_min + x[keep].min(), y_min + y[keep].min(),
+                            x_min + (x + fw)[keep].max(), y_min + (y + fh)[keep].max()]
+
+
+def fragment_rects(mask):
+    """Bounding rects of the 8-connected fragments of a mask, the numpy counterpart of
+    cv2.connectedComponentsWithStats. Foreground runs of every row are merged with the runs
+    of the next row they touch, so the work grows with the number of runs, not pixels.
+    Args:
+        mask (np.ndarray): (H, W) array, nonzero pixels are foreground.
+    Returns:
+        tuple: x, y, width and height arrays, one entry per fragment.
+    """
+    h, w = mask.shape
+    padded = np.zeros((h, w + 2), np.int8)
+    padded[:, 1:-1] = mask != 0
+    steps = np.diff(padded, axis=1)
+    run_rows, starts = np.nonzero(steps == 1)
+    _, ends = np.nonzero(steps == -1)
+    if not len(starts):
+        return (np.zeros(0, int),) * 4
+
+    # union find over the runs, runs of adjacent rows touch if they overlap or meet diagonally
+    parent = list(range(len(starts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first = np.searchsorted(run_rows, np.arange(h + 1)).tolist()
+    starts_list, ends_list = starts.tolist(), ends.tolist()
+    for row in range(h - 1):
+        i, j = first[row], first[row + 1]
+        i_end, j_end = first[row + 1], first[row + 2]
+        while i < i_end and j < j_end:
+            if starts_list[i] <= ends_list[j] and starts_list[j] <= ends_list[i]:
+                parent[find(i)] = find(j)
+            if ends_list[i] < ends_list[j]:
+                i += 1
+            else:
+                j += 1
+
+    _, fragments = np.unique([find(i) for i in range(len(parent))], return_inverse=True)
+    n = fragments.max() + 1
+    x_min = np.full(n, w)
+    y_min = np.full(n, h)
+    x_max = np.zeros(n, int)
+    y_max = np.zeros(n, int)
+    np.minimum.at(x_min, fragments, starts)
+    np.minimum.at(y_min, fragments, run_rows)
+    np.maximum.at(x_max, fragments, ends)
+    np.maximum.at(y_max, fragments, run_rows + 1)
+    return x_min, y_min, x_max - x_min, y_max - y_min
+
+
+def yolo_labels(boxes, present, class_ids, width, height):
+    """Formats bounding boxes as YOLO label lines.
+    Args:
+        boxes (np.ndarray): (n, 4) boxes in pixels (x_min, y_min, x_max, y_max).
+        present (np.ndarray): (n,) bool mask of boxes to write.
+        class_ids (np.ndarray): (n,) YOLO class id per box.
+        width (int): Image width in pixels.
+        height (int): Image height in pixels.
+    Returns:
+        list: YOLO label strings.
+    """
+    labels = []
+    for (x_min, y_min, x_max, y_max), class_id in zip(boxes[present], class_ids[present]):
+        labels.append(LABEL_FORMAT.format(
+            class_id=class_id,
+            center_x=(x_min + x_max) / (2 * width),
+            center_y=(y_min + y_max) / (2 * height),
+            width=(x_max - x_min) / width,
+            height=(y_max - y_min) / height,
+        ))
+    return labels
+
+
+def write_labels(label_file, yolo_labels):
+    """Writes a YOLO label file, replacing it atomically so readers never see partial files.
+    Args:
+        label_file (str): Path of the label file.
+        yolo_labels (list): YOLO label strings.
+    """
+    tmp_file = str(label_file) + '.tmp'
+    with open(tmp_file, 'w') as f:
+        f.write('\n'.join(yolo_labels))
+    os.replace(tmp_file, label_file)
+
+
+def read_labels(label_file, width, height):
+    """Reads a YOLO label file back into pixel boxes.
+    Args:
+        label_file (str): Path of the label file.
+        width (int): Image width in pixels.
+        height (int): Image height in pixels.
+    Returns:
+        tuple: (n, 4) float array of boxes (x_min, y_min, x_max, y_max) in pixels and (n,) int32 class ids.
+    """
+    with open(label_file) as f:
+        rows = [line.split() for line in f if line.strip()]
+    if not rows:
+        return np.zeros((0, 4)), np.zeros(0, dtype=np.int32)
+    values = np.array([[float(v) for v in row[1:5]] for row in rows])
+    center, size = values[:, :2], values[:, 2:]
+    boxes = np.concatenate([center - size / 2, center + size / 2], axis=1) * [width, height, width, height]
+    return boxes, np.array([int(row[0]) for row in rows], dtype=np.int32)
+
+
+def label_filename(image_filename):
+    """Returns the YOLO label file name belonging to an rgb or iseg image.
+    Args:
+        image_filename (str): Name of the image file, e.g. iseg_image_000001.png.
+    Returns:
+        str: Label file name, e.g. rgb_image_000001.txt.
+    """
+    image_id = int(os.path.splitext(image_filename)[0].split('_')[-1])
+    return f"rgb_image_{image_id:06d}.txt"
+
+
+# Component ids of the single channel segmentation maps, written to the output dir
+ID_MAPPING_FILENAME = '_segmentation_ids.json'
+
+
+def id_map(instances, n_instances):
+    """Converts a component index map to the single channel id map stored instead of the iseg PNG.
+    Args:
+        instances (np.ndarray): (H, W) array of component indices, -1 for background.
+        n_instances (int): Number of components.
+    Returns:
+        np.ndarray: (H, W) uint8 array of component index + 1, 0 for background, uint16 if there are 255 components or more.
+    """
+    dtype = np.uint8 if n_instances < 255 else np.uint16
+    return (instances + 1).astype(dtype)
+
+
+def save_id_map(path, ids):
+    """Writes an id map as compressed NumPy file, replacing it atomically.
+    Args:
+        path (str): Path of the .npz file.
+        ids (np.ndarray): Id map created by id_map.
+    """
+    tmp_file = str(path) + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.savez_compressed(f, ids=ids)
+    os.replace(tmp_file, path)
+
+
+def load_id_map(file):
+    """Reads an id map written by save_id_map.
+    Args:
+        file (str or file-like): Path of the .npz file or an open binary file.
+    Returns:
+        np.ndarray: (H, W) int32 array of component indices, -1 for background, as returned by instance_map.
+    """
+    with np.load(file) as data:
+        return data['ids'].astype(np.int32) - 1
+
+
+def write_id_mapping(path, components):
+    """Writes the id -> component mapping of the id maps.
+    Args:
+        path (str): Path of the mapping file.
+        components (list): Component entries from config.json.
+    """
+    ids = category_ids(components)
+    mapping = {
+        'background': 0,
+        'ids': [{'id': index + 1, 'name': c['name'], 'category': c['category'], 'class_id': ids[c['category']]}
+                for index, c in enumerate(components)],
+    }
+    tmp_file = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_file, 'w') as f:
+        json.dump(mapping, f, indent=4)
+    os.replace(tmp_file, path)
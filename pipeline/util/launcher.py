@@ -0,0 +1,140 @@
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+from util import events
+
+
+def blender_command(blender_path, blender_file, script_path, script_args=(), threads=None):
+    """Builds the command line for a background Blender process running a python script.
+    Args:
+        blender_path (str): Path to the blender.exe file.
+        blender_file (str): Path to the .blend file to open.
+        script_path (str): Path to the python script that will be used in blender.
+        script_args (list, optional): Arguments passed to the script after '--'.
+        threads (int, optional): Number of render threads, None lets Blender use all cores.
+    Returns:
+        list: Command line arguments.
+    """
+    args = [blender_path]
+    if threads:
+        args += ['-t', str(threads)]
+    args += ['-b', blender_file, '--python', script_path]
+    if script_args:
+        args += ['--'] + [str(a) for a in script_args]
+    return args
+
+
+def shard_ranges(n_images, n_shards):
+    """Splits the image ids 0..n_images-1 into contiguous, disjoint ranges.
+    Args:
+        n_images (int): Total number of images.
+        n_shards (int): Number of shards.
+    Returns:
+        list: (start, count) tuple per non-empty shard.
+    """
+    n_shards = max(1, min(n_shards, n_images))
+    base, rest = divmod(n_images, n_shards)
+    ranges = []
+    start = 0
+    for shard in range(n_shards):
+        count = base + (1 if shard < rest else 0)
+        ranges.append((start, count))
+        start += count
+    return ranges
+
+
+def _pump(proc, index, lines):
+    """Reads the output of a process line by line into a queue."""
+    with proc.stdout:
+        for line in proc.stdout:
+            lines.put((index, line))
+    lines.put((index, None))
+
+
+def _kill_stalled(procs, last_output, stall_timeout):
+    """Kills the processes that wrote no output for stall_timeout seconds."""
+    now = time.monotonic()
+    for index, proc in enumerate(procs):
+        if proc.poll() is None and now - last_output[index] > stall_timeout:
+            print('Blender process {} wrote no output for {:.0f}s, killing it'.format(index, now - last_output[index]), flush=True)
+            proc.kill()
+            last_output[index] = float('inf')
+
+
+def _request_stop(stop_file):
+    """Creates the stop file the Blender processes check between frames."""
+    print('Stopping the Blender processes after their current frame', flush=True)
+    open(stop_file, 'w').close()
+
+
+def run_blenders(commands, on_event=None, cwd=None, stall_timeout=None, stop=None, stop_file=None):
+    """Runs Blender processes concurrently, forwards their output and dispatches the events they emit.
+    Args:
+        commands (list): Command lines created by blender_command.
+        on_event (callable, optional): Called in the calling thread with every event dict parsed from
+            the output, the index of the emitting process is added as 'process'. If None the output is not captured.
+        cwd (str, optional): Working directory of the processes.
+        stall_timeout (float, optional): Kill a process that wrote no output for this many seconds,
+            e.g. a Blender hanging in a render. Its output is captured even without on_event. Defaults to None.
+        stop (threading.Event, optional): Once set, stop_file is created, which blenderscript.py --stop-file
+            checks before every frame. Defaults to None.
+        stop_file (str, optional): Stop file passed to the processes, removed when they exited. Defaults to None.
+    Returns:
+        list: Return code of every Blender process, killed processes return a non-zero code.
+    """
+    watch = bool(stall_timeout) or stop is not None
+    if on_event is None and watch:
+        on_event = lambda event: None
+    if on_event is None:
+        procs = [subprocess.Popen(args, cwd=cwd) for args in commands]
+        return [proc.wait() for proc in procs]
+
+    lines = queue.Queue()
+    procs = []
+    for index, args in enumerate(commands):
+        proc = subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True, errors='replace', bufsize=1)
+        threading.Thread(target=_pump, args=(proc, index, lines), daemon=True).start()
+        procs.append(proc)
+
+    running = len(procs)
+    last_output = [time.monotonic()] * len(procs)
+    last_check = time.monotonic()
+    stopping = False
+    while running:
+        if stall_timeout and time.monotonic() - last_check > 1.0:
+            _kill_stalled(procs, last_output, stall_timeout)
+            last_check = time.monotonic()
+        if stop is not None and stop.is_set() and not stopping:
+            _request_stop(stop_file)
+            stopping = True
+        try:
+            index, line = lines.get(timeout=1.0 if watch else None)
+        except queue.Empty:
+            continue
+        last_output[index] = time.monotonic()
+        if line is None:
+            running -= 1
+            continue
+        event = events.parse(line)
+        if event is None:
+            sys.stdout.write(line)
+        else:
+            event['process'] = index
+            on_event(event)
+    codes = [proc.wait() for proc in procs]
+    if stopping and os.path.exists(stop_file):
+        os.remove(stop_file)
+    return codes
+
+
+def run_blender(args, on_event=None, cwd=None, stall_timeout=None, stop=None, stop_file=None):
+    """Runs a single Blender process, see run_blenders.
+    Returns:
+        int: Return code of the Blender process.
+    """
+    return run_blenders([args], on_event=on_event, cwd=cwd, stall_timeout=stall_timeout, stop=stop, stop_file=stop_file)[0]
@@ -0,0 +1,100 @@
+import glob
+import json
+import os
+import socket
+
+# Manifest of completed frames, written to the output dir by datasets of earlier versions
+MANIFEST_FILENAME = '_manifest.jsonl'
+# Part of the manifest appended to by one process, e.g. _manifest.host-1234.jsonl
+MANIFEST_PART = '_manifest.{}.jsonl'
+
+
+def writer_name():
+    """Returns a name identifying this process across hosts sharing an output dir."""
+    return '%s-%d' % (socket.gethostname(), os.getpid())
+
+
+class Manifest():
+    """Append-only record of the frames that were rendered and added to the saver completely.
+    Every frame is one JSON line, appended and flushed to disk in a single write,
+    so a crash can at most lose the frame that was being recorded.
+    Every process appends to its own part of the manifest, so shards and queue workers, also on other hosts,
+    never write to the same file. Reading takes the union of all parts, lines torn by a crash or still
+    being written by another process are skipped. Pass readonly=True for a manifest that is only inspected.
+    """
+    def __init__(self, output_dir, readonly=False):
+        self.output_dir = str(output_dir)
+        self.path = os.path.join(self.output_dir, MANIFEST_PART.format(writer_name()))
+        self.readonly = readonly
+        self.frames = {}
+        self._load()
+
+    def parts(self):
+        """Returns the paths of all parts of the manifest, oldest first."""
+        paths = glob.glob(os.path.join(glob.escape(self.output_dir), MANIFEST_PART.format('*')))
+        legacy = os.path.join(self.output_dir, MANIFEST_FILENAME)
+        if os.path.exists(legacy):
+            paths.append(legacy)
+        return sorted(paths, key=os.path.getmtime)
+
+    def _load(self):
+        # later records of a frame, e.g. from a resumed run, replace earlier ones
+        for path in self.parts():
+            with open(path, 'rb') as file:
+                data = file.read()
+            for line in data.splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self.frames[record['image_id']] = record['files']
+
+    def record(self, image_id, **files):
+        """Marks a frame as complete.
+        Args:
+            image_id (int): Id of the frame.
+            **files: Names of the frame's files by subfolder, e.g. rgb='rgb_image_000001.png' or shards='shard-000000-00000.tar',
+                none for a frame culled before rendering.
+        """
+        if self.readonly:
+            raise Exception('Manifest of {} was opened readonly'.format(self.output_dir))
+        line = json.dumps({'image_id': image_id, 'files': files}) + '\n'
+        # append mode writes at the end whatever was read before, on every platform
+        with open(self.path, 'ab+') as file:
+            # start on a fresh line after a line torn by a crashed process of the same name
+            if file.seek(0, os.SEEK_END):
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b'\n':
+                    line = '\n' + line
+            file.write(line.encode('utf-8'))
+            file.flush()
+            os.fsync(file.fileno())
+        self.frames[image_id] = files
+
+    def locate(self, filename, kind=None):
+        """Finds a frame file in its subfolder or, for datasets rendered before frames were written
+        to subfolders directly, in the output dir itself.
+        Args:
+            filename (str): Name of the file.
+            kind (str, optional): Subfolder to search, e.g. 'rgb', 'iseg' or 'shards'.
+        Returns:
+            str: Path of the file, or None if it does not exist.
+        """
+        candidates = [os.path.join(self.output_dir, filename)]
+        if kind:
+            candidates.insert(0, os.path.join(self.output_dir, kind, filename))
+        for path in candidates:
+            if os.path.exists(path):
+                return path
+        return None
+
+    def is_complete(self, image_id):
+        """Returns True if the frame was recorded and all of its files still exist."""
+        files = self.frames.get(image_id)
+        if files is None:
+            return False
+        return all(self.locate(name, kind) is not None for kind, name in files.items())
+
+    def next_id(self):
+        """Returns the first image id after the frames already recorded, used to append to a dataset."""
+        return max(self.frames) + 1 if self.frames else 0
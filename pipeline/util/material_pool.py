@@ -0,0 +1,115 @@
+import bpy
+import zpy
+from collections import OrderedDict
+
+
+class MaterialPool():
+    """Pool of texture materials built once and reused across frames.
+
+    One base material is made per texture of textures_dir when the pool is created. Every object gets
+    a single material of its own that is copied from a base once; later frames only swap the texture
+    images and reset the shader inputs from the base before jittering, so no materials or images are
+    created per frame. A capacity below the number of textures turns the bases into an LRU cache,
+    which saves memory at the cost of rebuilding evicted materials.
+    """
+    PREFIX = 'pool.'
+
+    def __init__(self, texture_paths, capacity=0):
+        self._bases = OrderedDict()
+        self._slots = {}
+        self._images = set()
+        self.use_textures(texture_paths, capacity)
+
+    def use_textures(self, texture_paths, capacity=0):
+        """Builds the base materials of a texture set up front, bases already in the pool are kept.
+        Args:
+            texture_paths (list): Texture image files.
+            capacity (int, optional): Maximum number of base materials, 0 for one per texture. Defaults to 0.
+        """
+        self.texture_paths = list(texture_paths)
+        self.capacity = max(1, capacity or len(self.texture_paths))
+        for texture_path in self.texture_paths[:self.capacity]:
+            self.base(texture_path)
+
+    def base(self, texture_path):
+        """Returns the base material of a texture, making it if needed.
+        Args:
+            texture_path (Path): Texture image file.
+        Returns:
+            bpy.types.Material: Base material, must not be assigned to objects directly.
+        """
+        key = str(texture_path)
+        mat = self._bases.get(key)
+        if mat is not None and mat.name in bpy.data.materials:
+            self._bases.move_to_end(key)
+            return mat
+
+        mat = zpy.material.make_mat_from_texture(texture_path)
+        mat.name = self.PREFIX + 'base.' + bpy.path.basename(key)
+        for node in _image_nodes(mat):
+            self._images.add(node.image.name)
+        self._bases[key] = mat
+
+        # evict least recently used textures
+        while len(self._bases) > self.capacity:
+            _, old = self._bases.popitem(last=False)
+            bpy.data.materials.remove(old)
+        self.purge()
+        return mat
+
+    def assign(self, obj, texture_path):
+        """Gives an object the texture of texture_path using its pooled material.
+        Args:
+            obj (bpy.types.Object): Object to texture.
+            texture_path (Path): Texture image file.
+        Returns:
+            bool: True if the object's material was (re)created, e.g. to segment the object again.
+        """
+        base = self.base(texture_path)
+        mat = self._slots.get(obj.name)
+        created = mat is None or mat.name not in bpy.data.materials
+        if created:
+            mat = base.copy()
+            mat.name = self.PREFIX + 'slot.' + obj.name
+            self._slots[obj.name] = mat
+        else:
+            _copy_state(base, mat)
+
+        if obj.active_material is not mat:
+            zpy.material.set_mat(obj, mat)
+            created = True
+        return created
+
+    def purge(self):
+        """Removes pooled materials and images that are no longer used by anything."""
+        for name in list(self._images):
+            image = bpy.data.images.get(name)
+            if image is None:
+                self._images.discard(name)
+            elif image.users == 0:
+                bpy.data.images.remove(image)
+                self._images.discard(name)
+
+    def __len__(self):
+        return len(self._bases)
+
+
+def _image_nodes(mat):
+    if not mat.node_tree:
+        return []
+    return [n for n in mat.node_tree.nodes if n.type == 'TEX_IMAGE' and n.image is not None]
+
+
+def _copy_state(src, dst):
+    """Copies the texture images and unlinked shader input values of src into dst.
+    Nodes only dst has, e.g. the AOV outputs added by zpy.objects.segment, are left untouched.
+    """
+    for node in src.node_tree.nodes:
+        target = dst.node_tree.nodes.get(node.name)
+        if target is None or target.type != node.type:
+            continue
+        if node.type == 'TEX_IMAGE':
+            target.image = node.image
+        for src_input, dst_input in zip(node.inputs, target.inputs):
+            if hasattr(src_input, 'default_value') and not dst_input.is_linked:
+                dst_input.default_value = src_input.default_value
@@ -0,0 +1,193 @@
+import os
+
+import numpy as np
+
+from util import sampling
+
+# Frames are sampled in blocks, every block has its own RNG stream per parameter group,
+# so the parameters of a frame only depend on the seed and its image id
+BLOCK_SIZE = 256
+
+# Stream ids of the parameter groups
+_LIGHT = 1
+_BACKGROUND = 2
+_TEXTURES = 3
+_DISTRACTORS = 4
+_CAMERA = 5
+
+# Distractor shapes, indexed by the distractor_shape plan entries
+SHAPES = ('cube', 'cylinder', 'cone', 'torus')
+
+# Colors of the randomized point light
+LIGHT_COLORS = np.array([
+    (0.9440666514472968, 0.5833314064014211, 0.8620217891113732),
+    (0.10667940786362784, 0.6366501465055134, 0.8283463249515829),
+    (0.3302847843832679, 0.6345777588778184, 0.1404223675732703),
+    (0.7401648553552618, 0.8317902032242835, 0.10106199897902346),
+    (0.45295583701408515, 0.5915025303641542, 0.6465851385385122),
+    (0.7123306351550376, 0.5129631064977251, 0.21762394723865053),
+    (0.09130264158123913, 0.5537163541914795, 0.16064870877864545),
+    (0.6707118865158586, 0.18080553053619286, 0.6469992264673323),
+    (0.43314508229358095, 0.9122424851506655, 0.11356637786000401),
+    (0.7862445863417918, 0.4991837341778049, 0.8092578403062234),
+    (0.51256704292842, 0.11446145740590452, 0.377651670065407),
+    (0.6092571721767102, 0.9609982643235238, 0.3617614595169364),
+    (0.41775889785188935, 0.5887628033917193, 0.3653242029611167),
+    (0.08168563243279225, 0.20787113902796528, 0.853123892762489),
+    (0.728912072767947, 0.007843865205733658, 0.44430589288037026),
+    (0.4227426992503953, 0.4819567510637641, 0.9994331877106425),
+    (0.43845994505785546, 0.3206641860930485, 0.18213702509162955),
+    (0.14302450174817516, 0.34570045520043546, 0.09624042133049515),
+    (0.06851751916568105, 0.9504095026623458, 0.4436218941396267),
+    (0.44803137650648206, 0.9420336857811692, 0.7011742274582891),
+    (0.9044282823872661, 0.06018959064986862, 0.6672269895484276),
+    (0.17929559468586476, 0.05729827561742895, 0.49895105147336904),
+    (0.7264269847796142, 0.1724740290693172, 0.5732874557940236),
+    (0.23126506532015478, 0.4739532054786436, 0.7826173889280275),
+    (0.9605147974634811, 0.22367623177522433, 0.05426495060923542),
+    (0.9917333698192003, 0.42190722736389363, 0.6050487503476861),
+    (0.05329161480666911, 0.12026604183618406, 0.5627467879416354),
+    (0.7226263870851404, 0.2542508788398701, 0.8884488745881918),
+    (0.6076647881760615, 0.08606657900248538, 0.8287388948003354),
+    (0.5671128089332944, 0.9573173892199068, 0.4108142077323873),
+])
+
+
+def _sample_blocks(seed, stream, image_ids, sample):
+    """Draws the values of a parameter group for the given frames.
+    Args:
+        seed (int): Random seed of the run.
+        stream (int): Id of the parameter group.
+        image_ids (np.ndarray): Ids of the frames.
+        sample (callable): Called with (rng, ids) for the ids of a whole block, returns a dict of arrays with one row per id.
+    Returns:
+        dict: Arrays with one row per image id.
+    """
+    blocks = image_ids // BLOCK_SIZE
+    out = {}
+    for block in np.unique(blocks):
+        rng = np.random.default_rng([seed, stream, int(block)])
+        values = sample(rng, np.arange(block * BLOCK_SIZE, (block + 1) * BLOCK_SIZE))
+        mask = blocks == block
+        rows = image_ids[mask] - block * BLOCK_SIZE
+        for key, value in values.items():
+            if key not in out:
+                out[key] = np.empty((len(image_ids),) + value.shape[1:], dtype=value.dtype)
+            out[key][mask] = value[rows]
+    return out
+
+
+def fibonacci_points(image_ids, n, r):
+    """Returns the points of a fibonacci sphere with n points for the given indices, see blender_util.fibonacci_sphere."""
+    return sampling.ViewpointSampler('fibonacci', (r,), n, decimals=3).sample(image_ids)
+
+
+def make_plan(config, start, count, n_points, n_backgrounds, n_textures, n_objects):
+    """Samples the randomized parameters of the frames start..start+count-1 in one vectorized pass.
+    Args:
+        config (Config): Loaded config.json.
+        start (int): Id of the first frame.
+        count (int): Number of frames.
+        n_points (int): Number of camera positions on the fibonacci lattice or stratification grid.
+        n_backgrounds (int): Number of background hdris.
+        n_textures (int): Number of textures.
+        n_objects (int): Number of assembly objects textured every frame.
+    Returns:
+        Plan: The sampled parameters.
+    """
+    seed = config.random_seed
+    image_ids = np.arange(start, start + count, dtype=np.int64)
+    n_max = config.n_distractors_max
+    camera = sampling.from_config(config.camera_sampling, config.r_camera, n_points, decimals=3)
+    light_sampler = sampling.from_config(dict({'method': 'uniform'}, **config.light_sampling), config.r_light, n_points)
+
+    def light(rng, ids):
+        n = len(ids)
+        return {
+            'light_position': light_sampler.sample(ids, rng),
+            'light_color': rng.integers(0, len(LIGHT_COLORS), n),
+            'light_intensity': rng.integers(config.intensity_min_light, config.intensity_max_light + 1, n),
+        }
+
+    def background(rng, ids):
+        n = len(ids)
+        return {
+            'hdri': rng.integers(0, max(n_backgrounds, 1), n),
+            'hdri_rotation': rng.uniform(0, 2 * np.pi, n),
+        }
+
+    def textures(rng, ids):
+        n = len(ids)
+        return {
+            'textures': rng.integers(0, max(n_textures, 1), (n, n_objects)),
+            'distractor_textures': rng.integers(0, max(n_textures, 1), (n, n_max)),
+        }
+
+    def distractors(rng, ids):
+        n = len(ids)
+        n_distractors = rng.integers(config.n_distractors_min, n_max + 1, n)
+        if config.add_distractors != 1:
+            n_distractors[:] = 0
+        shapes = rng.integers(0, len(SHAPES), (n, n_max)).astype(np.int8)
+        shapes[np.arange(n_max) >= n_distractors[:, None]] = -1
+        radius = rng.uniform(config.r_distractors_min, config.r_distractors_max, (n, n_max))
+        positions = sampling.uniform_directions(rng, (n, n_max)) * radius[..., None]
+        return {
+            'n_distractors': n_distractors,
+            'distractor_shape': shapes,
+            'distractor_position': positions.astype(np.float32),
+            'distractor_rotation': rng.uniform(0, 2 * np.pi, (n, n_max, 3)).astype(np.float32),
+            'distractor_scale': rng.uniform(config.scale_distractors_min, config.scale_distractors_max, (n, n_max)).astype(np.float32),
+        }
+
+    def camera_positions(rng, ids):
+        return {'camera_position': camera.sample(ids, rng)}
+
+    arrays = {'image_id': image_ids}
+    # the default fibonacci lattice needs no random numbers, its points only depend on the image id
+    if camera.random:
+        arrays.update(_sample_blocks(seed, _CAMERA, image_ids, camera_positions))
+    else:
+        arrays['camera_position'] = camera.sample(image_ids)
+    for stream, sample in ((_LIGHT, light), (_BACKGROUND, background), (_TEXTURES, textures), (_DISTRACTORS, distractors)):
+        arrays.update(_sample_blocks(seed, stream, image_ids, sample))
+    return Plan(arrays)
+
+
+def plan_filename(start, count):
+    """Returns the file name of the plan of a frame range."""
+    return '_plan_%06d_%06d.npz' % (start, count)
+
+
+class Plan():
+    """Per frame randomization parameters, replayed by the generation loop."""
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self._rows = {int(image_id): row for row, image_id in enumerate(arrays['image_id'])}
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def save(self, path):
+        # write next to the target first so a crash never leaves a truncated plan
+        tmp_path = str(path) + '.tmp.npz'
+        np.savez_compressed(tmp_path, **self.arrays)
+        os.replace(tmp_path, path)
+
+    def __contains__(self, image_id):
+        return image_id in self._rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def frame(self, image_id):
+        """Returns the parameters of a single frame.
+        Args:
+            image_id (int): Id of the frame.
+        Returns:
+            dict: Parameter name -> value for this frame.
+        """
+        row = self._rows[image_id]
+        return {key: value[row] for key, value in self.arrays.items()}
@@ -0,0 +1,238 @@
+import bpy
+import numpy as np
+from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+
+
+def world_vertices(obj, depsgraph):
+    """Returns the evaluated mesh vertices of an object in world coordinates.
+    Args:
+        obj (bpy.types.Object): Mesh object.
+        depsgraph (bpy.types.Depsgraph): Evaluated dependency graph.
+    Returns:
+        np.ndarray: (n, 3) vertex positions.
+    """
+    eval_obj = obj.evaluated_get(depsgraph)
+    mesh = eval_obj.to_mesh()
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    eval_obj.to_mesh_clear()
+    matrix = np.array(eval_obj.matrix_world)
+    return co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def project(points, camera, scene, depsgraph):
+    """Projects world points into the rendered image.
+    Args:
+        points (np.ndarray): (n, 3) world positions.
+        camera (bpy.types.Object): Camera object.
+        scene (bpy.types.Scene): Scene holding the render resolution.
+        depsgraph (bpy.types.Depsgraph): Evaluated dependency graph.
+    Returns:
+        tuple: (n, 2) pixel coordinates (y pointing down) and (n,) bool mask of points in front of the camera.
+    """
+    render = scene.render
+    width = render.resolution_x * render.resolution_percentage // 100
+    height = render.resolution_y * render.resolution_percentage // 100
+    projection = np.array(camera.calc_matrix_camera(depsgraph, x=width, y=height,
+                                                    scale_x=render.pixel_aspect_x, scale_y=render.pixel_aspect_y))
+    view = np.array(camera.matrix_world.inverted())
+    clip = np.c_[points, np.ones(len(points))] @ (projection @ view).T
+
+    in_front = clip[:, 3] > 1e-6
+    w = np.where(in_front, clip[:, 3], 1.0)
+    pixels = np.stack([
+        (clip[:, 0] / w + 1) / 2 * width,
+        (1 - clip[:, 1] / w) / 2 * height,
+    ], axis=1)
+    return pixels, in_front
+
+
+def bounding_box(pixels, in_front, width, height):
+    """Clips the projected vertices of an object to the frame and returns their extent.
+    Returns:
+        tuple: (x_min, y_min, x_max, y_max) in pixels, or None if the object is not in the frame.
+    """
+    pixels = pixels[in_front]
+    if len(pixels) == 0:
+        return None
+    x_min, y_min = np.clip(pixels.min(axis=0), 0, (width, height))
+    x_max, y_max = np.clip(pixels.max(axis=0), 0, (width, height))
+    if x_max <= x_min or y_max <= y_min:
+        return None
+    return x_min, y_min, x_max, y_max
+
+
+def visible_fraction(scene, depsgraph, camera, obj, points, samples=64, occluders=None):
+    """Estimates which part of an object is visible by casting rays from the camera to some of its vertices.
+    The fraction is taken over the sampled vertices on the side facing the camera: a ray that first hits the
+    object itself ends at a vertex on its far side, which says nothing about occlusion and is skipped.
+    Args:
+        scene (bpy.types.Scene): Scene to cast rays in.
+        depsgraph (bpy.types.Depsgraph): Evaluated dependency graph.
+        camera (bpy.types.Object): Camera object.
+        obj (bpy.types.Object): Object to test.
+        points (np.ndarray): (n, 3) world positions of vertices in the frame.
+        samples (int, optional): Maximum number of rays. Defaults to 64.
+        occluders (set, optional): Names of the objects that count as occluding, None for all other objects.
+    Returns:
+        float: Fraction of the sampled camera facing vertices that are not hidden behind other geometry.
+    """
+    if len(points) == 0:
+        return 0.0
+    picks = points[np.unique(np.linspace(0, len(points) - 1, min(samples, len(points))).astype(int))]
+    origin = camera.matrix_world.translation
+    visible = 0
+    facing = 0
+    for point in picks:
+        direction = Vector(point.tolist()) - origin
+        distance = direction.length
+        direction = direction.normalized()
+        # stop just short of the vertex so the surface it lies on does not count as a hit
+        hit, _, _, _, hit_obj, _ = scene.ray_cast(depsgraph, origin, direction, distance=distance * 0.999)
+        if hit and hit_obj is obj:
+            continue
+        facing += 1
+        if not hit or (occluders is not None and hit_obj.name not in occluders):
+            visible += 1
+    # only self hits: nothing else is in front of the object
+    return visible / facing if facing else 1.0
+
+
+def geometric_boxes(objs, camera, scene, min_area=30, occlusion_samples=0, min_visible=0.0):
+    """Computes the 2D bounding box of every object from its projected mesh, without rendering.
+    Args:
+        objs (list): Mesh objects to annotate.
+        camera (bpy.types.Object): Camera object.
+        scene (bpy.types.Scene): Scene holding the render resolution.
+        min_area (int, optional): Boxes with a smaller area in pixels are dropped. Defaults to 30.
+        occlusion_samples (int, optional): Rays per object for the visibility check, 0 to skip it. Defaults to 0.
+        min_visible (float, optional): Objects with a smaller visible fraction are dropped. Defaults to 0.0.
+    Returns:
+        tuple: (n, 4) float array of boxes (x_min, y_min, x_max, y_max) and (n,) bool array of objects in the image.
+    """
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    render = scene.render
+    width = render.resolution_x * render.resolution_percentage // 100
+    height = render.resolution_y * render.resolution_percentage // 100
+
+    boxes = np.zeros((len(objs), 4))
+    present = np.zeros(len(objs), dtype=bool)
+    for i, obj in enumerate(objs):
+        points = world_vertices(obj, depsgraph)
+        pixels, in_front = project(points, camera, scene, depsgraph)
+        box = bounding_box(pixels, in_front, width, height)
+        if box is None or (box[2] - box[0]) * (box[3] - box[1]) < min_area:
+            continue
+        if occlusion_samples > 0:
+            in_frame = in_front & (pixels[:, 0] >= 0) & (pixels[:, 0] <= width) & (pixels[:, 1] >= 0) & (pixels[:, 1] <= height)
+            if visible_fraction(scene, depsgraph, camera, obj, points[in_frame], occlusion_samples) <= min_visible:
+                continue
+        boxes[i] = box
+        present[i] = True
+    return boxes, present
+
+
+def _world_mesh(obj, depsgraph):
+    # evaluated vertices in world coordinates and the vertex indices of every polygon
+    eval_obj = obj.evaluated_get(depsgraph)
+    mesh = eval_obj.to_mesh()
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    polygons = [tuple(polygon.vertices) for polygon in mesh.polygons]
+    eval_obj.to_mesh_clear()
+    matrix = np.array(eval_obj.matrix_world)
+    return co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3], polygons
+
+
+def occluder_tree(meshes):
+    """Builds one BVH tree of several meshes, e.g. the distractors of a frame.
+    Args:
+        meshes (list): (vertices, polygons) per object in world coordinates.
+    Returns:
+        BVHTree: The tree, or None if there are no polygons.
+    """
+    vertices = []
+    polygons = []
+    offset = 0
+    for co, polys in meshes:
+        vertices.append(co)
+        polygons += [tuple(i + offset for i in polygon) for polygon in polys]
+        offset += len(co)
+    if not polygons:
+        return None
+    return BVHTree.FromPolygons(np.concatenate(vertices).tolist(), polygons)
+
+
+def segments_near_spheres(origin, points, centers, radii):
+    """Returns which segments from origin to points pass through at least one of the spheres."""
+    if len(centers) == 0:
+        return np.zeros(len(points), dtype=bool)
+    d = points - origin
+    length2 = np.maximum(np.einsum('ij,ij->i', d, d), 1e-12)
+    # closest point of every segment to every sphere center
+    t = np.clip(((centers - origin) @ d.T) / length2, 0.0, 1.0)
+    closest = origin + t[..., None] * d
+    dist2 = np.sum((closest - centers[:, None, :])**2, axis=-1)
+    return np.any(dist2 <= (radii**2)[:, None], axis=0)
+
+
+class VisibilityCheck():
+    """Estimates before rendering how much of every component a frame shows.
+
+    A fixed sample of vertices per component is taken once, the components do not move between frames.
+    Every frame the samples are projected in one pass and the ones in the frame are tested
+    for occlusion by ray casts against a BVH tree of the distractors only. Rays that miss the bounding
+    spheres of all distractors are known to be free without casting them.
+    """
+    def __init__(self, objs, samples=32):
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        points = []
+        for obj in objs:
+            co = world_vertices(obj, depsgraph)
+            if len(co):
+                co = co[np.unique(np.linspace(0, len(co) - 1, min(samples, len(co))).astype(int))]
+            points.append(co)
+        self.counts = [len(co) for co in points]
+        self.points = np.concatenate(points) if points else np.zeros((0, 3))
+
+    def fractions(self, camera, scene, occluders=()):
+        """Returns the visible fraction of the sampled points of every component.
+        Args:
+            camera (bpy.types.Object): Camera object, already placed and aimed.
+            scene (bpy.types.Scene): Scene holding the render resolution.
+            occluders (list, optional): Objects that can hide components, e.g. the shown distractors.
+        Returns:
+            np.ndarray: Fraction in [0, 1] per component.
+        """
+        # camera and distractors were just moved
+        bpy.context.view_layer.update()
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        render = scene.render
+        width = render.resolution_x * render.resolution_percentage // 100
+        height = render.resolution_y * render.resolution_percentage // 100
+
+        pixels, in_front = project(self.points, camera, scene, depsgraph)
+        visible = in_front & (pixels[:, 0] >= 0) & (pixels[:, 0] <= width) & (pixels[:, 1] >= 0) & (pixels[:, 1] <= height)
+
+        meshes = [_world_mesh(obj, depsgraph) for obj in occluders]
+        meshes = [(co, polys) for co, polys in meshes if len(co)]
+        origin = np.array(camera.matrix_world.translation)
+        centers = np.array([(co.min(axis=0) + co.max(axis=0)) / 2 for co, polys in meshes]).reshape(-1, 3)
+        radii = np.array([np.linalg.norm(co - center, axis=1).max() for (co, polys), center in zip(meshes, centers)])
+        candidates = visible & segments_near_spheres(origin, self.points, centers, radii)
+        tree = occluder_tree(meshes) if candidates.any() else None
+        if tree is not None:
+            for i in np.flatnonzero(candidates):
+                direction = self.points[i] - origin
+                distance = float(np.linalg.norm(direction))
+                hit = tree.ray_cast(Vector(origin.tolist()), Vector((direction / distance).tolist()), distance)
+                if hit[0] is not None:
+                    visible[i] = False
+
+        return np.array([chunk.mean() if len(chunk) else 0.0 for chunk in np.split(visible, np.cumsum(self.counts)[:-1])])
+
+    def accept(self, camera, scene, occluders=(), min_visible=0.5, min_components=1.0):
+        """True if at least min_components of the components show at least min_visible of their samples."""
+        fractions = self.fractions(camera, scene, occluders)
+        return len(fractions) == 0 or np.mean(fractions >= min_visible) >= min_components
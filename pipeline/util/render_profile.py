@@ -0,0 +1,116 @@
+import bpy
+from contextlib import contextmanager
+
+
+def apply_profile(profile, scene=None):
+    """Applies a render profile from config.json to the scene.
+    Settings missing from the profile keep the values stored in renderfile.blend.
+    Args:
+        profile (dict): Render profile, see Config.profile.
+        scene (bpy.types.Scene, optional): Scene to configure, defaults to the current scene.
+    """
+    scene = scene or bpy.context.scene
+    render = scene.render
+    cycles = scene.cycles
+
+    if 'engine' in profile:
+        render.engine = profile['engine']
+    if 'resolution' in profile:
+        render.resolution_x, render.resolution_y = profile['resolution']
+        render.resolution_percentage = 100
+    if 'threads' in profile:
+        render.threads_mode = 'FIXED' if profile['threads'] > 0 else 'AUTO'
+        if profile['threads'] > 0:
+            render.threads = profile['threads']
+    if 'tile_size' in profile:
+        # tiles moved from the render to the cycles settings in Blender 3.0
+        if hasattr(cycles, 'tile_size'):
+            cycles.tile_size = profile['tile_size']
+        else:
+            render.tile_x = render.tile_y = profile['tile_size']
+    if 'samples' in profile:
+        cycles.samples = profile['samples']
+    if 'adaptive_threshold' in profile:
+        cycles.use_adaptive_sampling = profile['adaptive_threshold'] > 0
+        if profile['adaptive_threshold'] > 0:
+            cycles.adaptive_threshold = profile['adaptive_threshold']
+    if 'denoise' in profile:
+        cycles.use_denoising = profile['denoise'] == 1
+
+
+def use_transparent_film(enabled=True, scene=None):
+    """Renders the world transparent so the rgb images can be composited onto other backgrounds.
+    The world still lights the scene, only camera rays hitting it become transparent. The compositor file
+    outputs fed by the Image socket of a render layer store the alpha channel, outputs of AOVs such as the
+    segmentation are left as they are.
+    zpy may create its file output nodes during a render, so this is called before every one.
+    Args:
+        enabled (bool, optional): False restores an opaque film with RGB outputs. Defaults to True.
+        scene (bpy.types.Scene, optional): Scene to configure, defaults to the current scene.
+    """
+    scene = scene or bpy.context.scene
+    color_mode = 'RGBA' if enabled else 'RGB'
+    scene.render.film_transparent = enabled
+    scene.render.image_settings.color_mode = color_mode
+    if scene.node_tree is None:
+        return
+    for node in _image_file_outputs(scene.node_tree):
+        node.format.color_mode = color_mode
+
+
+def _image_file_outputs(tree):
+    """File output nodes of a compositor tree that are linked to the rendered Image of a render layer."""
+    nodes = []
+    for link in tree.links:
+        if link.from_node.bl_idname == 'CompositorNodeRLayers' and link.from_socket.name == 'Image' \
+                and link.to_node.bl_idname == 'CompositorNodeOutputFile' and link.to_node not in nodes:
+            nodes.append(link.to_node)
+    return nodes
+
+
+@contextmanager
+def flat_pass(scene=None):
+    """Renders with a single sample, no light bounces and no denoising inside the block.
+    Segmentation AOVs do not depend on lighting, so this gives the same iseg image for a fraction of the cost.
+    """
+    scene = scene or bpy.context.scene
+    cycles = scene.cycles
+    settings = ('samples', 'use_adaptive_sampling', 'max_bounces', 'use_denoising')
+    saved = {name: getattr(cycles, name) for name in settings}
+    try:
+        cycles.samples = 1
+        cycles.use_adaptive_sampling = False
+        cycles.max_bounces = 0
+        cycles.use_denoising = False
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(cycles, name, value)
+
+
+class SampleBudget():
+    """Adapts the number of samples so frames stay within a time budget.
+    Samples are scaled down when a frame takes longer than the budget and slowly raised again,
+    never above the samples of the profile, when frames are clearly faster.
+    """
+    def __init__(self, budget, max_samples, min_samples=1, scene=None):
+        self.budget = budget
+        self.max_samples = max_samples
+        self.min_samples = max(1, min_samples)
+        self.scene = scene or bpy.context.scene
+        self.samples = max_samples
+
+    def update(self, elapsed):
+        """Sets the samples of the next frame from the render time of the last one.
+        Args:
+            elapsed (float): Render time of the last frame in seconds.
+        Returns:
+            int: Samples used for the next frame.
+        """
+        if elapsed > self.budget:
+            self.samples = int(self.samples * self.budget / elapsed)
+        elif elapsed < 0.75 * self.budget:
+            self.samples = int(self.samples * 1.1) + 1
+        self.samples = min(self.max_samples, max(self.min_samples, self.samples))
+        self.scene.cycles.samples = self.samples
+        return self.samples
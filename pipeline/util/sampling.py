@@ -0,0 +1,133 @@
+import numpy as np
+
+# Supported ways of placing points on a sphere
+METHODS = ('fibonacci', 'stratified', 'uniform')
+
+# Golden angle of the fibonacci lattice, in units of the point index
+_GOLDEN = np.pi * (1 + 5**0.5)
+
+
+def _to_cartesian(z, theta, radius):
+    phi = np.arccos(np.clip(z, -1.0, 1.0))
+    return np.stack([
+        radius * np.sin(phi) * np.cos(theta),
+        radius * np.sin(phi) * np.sin(theta),
+        radius * np.cos(phi),
+    ], axis=-1)
+
+
+def uniform_directions(rng, shape, z_range=(-1.0, 1.0)):
+    """Draws unit vectors uniformly distributed on the sphere (or a band of it).
+    Uniform z and azimuth give a uniform density on the sphere surface, unlike a uniform polar angle
+    which over-weights the poles.
+    Args:
+        rng (np.random.Generator): Random number generator.
+        shape (int or tuple): Number of vectors, or shape of the leading axes.
+        z_range (tuple, optional): Range of the z coordinate. Defaults to the whole sphere.
+    Returns:
+        np.ndarray: shape + (3,) unit vectors.
+    """
+    z = rng.uniform(z_range[0], z_range[1], shape)
+    theta = rng.uniform(0, 2 * np.pi, shape)
+    return _to_cartesian(z, theta, 1.0)
+
+
+class ViewpointSampler():
+    """Places cameras or lights on one or more spheres around the origin.
+
+    Points are addressed by index, so a frame's viewpoint only depends on its image id:
+        fibonacci  - index i of an n_points fibonacci lattice, evenly spread and deterministic
+        stratified - a random point in cell i of an n_points equal-area grid over height and azimuth
+        uniform    - independent uniform points on the sphere
+    Elevations are limited to a band, points cycle through the given radii and are optionally jittered
+    by a random angle. Randomness comes from an explicit np.random.Generator only.
+
+    Args:
+        method (str, optional): One of METHODS. Defaults to 'fibonacci'.
+        radii (sequence, optional): Sphere radii, index i uses radii[i % len(radii)]. Defaults to (1.0,).
+        n_points (int, optional): Size of the fibonacci lattice or stratification grid. Defaults to 1000.
+        elevation (tuple, optional): (min, max) elevation above the xy plane in degrees. Defaults to the whole sphere.
+        jitter (float, optional): Standard deviation of a random angular offset in radians. Defaults to 0.0.
+        decimals (int, optional): Round coordinates to this many decimals. Defaults to None.
+    """
+    def __init__(self, method='fibonacci', radii=(1.0,), n_points=1000, elevation=(-90.0, 90.0), jitter=0.0,
+                 decimals=None):
+        if method not in METHODS:
+            raise ValueError(f'unknown sampling method {method}, expected one of {METHODS}')
+        self.method = method
+        self.radii = np.atleast_1d(np.asarray(radii, dtype=float))
+        self.n_points = max(1, int(n_points))
+        self.z_range = (float(np.sin(np.radians(elevation[0]))), float(np.sin(np.radians(elevation[1]))))
+        self.jitter = jitter
+        self.decimals = decimals
+
+    @property
+    def random(self):
+        """True if sample needs a random number generator."""
+        return self.method != 'fibonacci' or self.jitter > 0
+
+    def directions(self, indices, rng=None):
+        """Returns the unit directions of the given point indices as (n, 3) array."""
+        indices = np.asarray(indices)
+        if self.random and rng is None:
+            raise ValueError(f'{self.method} sampling with jitter {self.jitter} needs a random number generator')
+        z_lo, z_hi = self.z_range
+
+        if self.method == 'fibonacci':
+            k = (indices % self.n_points) + 0.5
+            z = z_hi - (z_hi - z_lo) * k / self.n_points
+            directions = _to_cartesian(z, _GOLDEN * k, 1.0)
+        elif self.method == 'stratified':
+            # near square grid of equal area cells: rows of equal height, columns of equal azimuth
+            rows = max(1, int(round(np.sqrt(self.n_points / 2))))
+            cols = -(-self.n_points // rows)
+            cell = indices % (rows * cols)
+            u = (cell // cols + rng.random(indices.shape)) / rows
+            v = (cell % cols + rng.random(indices.shape)) / cols
+            directions = _to_cartesian(z_hi - (z_hi - z_lo) * u, 2 * np.pi * v, 1.0)
+        else:
+            directions = uniform_directions(rng, indices.shape, self.z_range)
+
+        if self.jitter > 0:
+            directions = directions + rng.normal(0.0, self.jitter, directions.shape)
+            directions /= np.linalg.norm(directions, axis=-1, keepdims=True)
+        return directions
+
+    def sample(self, indices, rng=None):
+        """Returns the points of the given indices as (n, 3) float array.
+        Args:
+            indices (np.ndarray): Point indices, e.g. image ids.
+            rng (np.random.Generator, optional): Needed unless the method is fibonacci without jitter.
+        Returns:
+            np.ndarray: (n, 3) positions.
+        """
+        indices = np.asarray(indices)
+        points = self.directions(indices, rng) * self.radii[indices % len(self.radii)][..., None]
+        if self.decimals is not None:
+            points = np.round(points, self.decimals)
+        return points
+
+    def batches(self, start, count, batch_size=65536, rng=None):
+        """Yields the points of indices start..start+count-1 in (batch_size, 3) arrays, for runs too large to hold at once."""
+        for first in range(start, start + count, batch_size):
+            yield self.sample(np.arange(first, min(first + batch_size, start + count)), rng)
+
+
+def from_config(settings, radius, n_points, decimals=None):
+    """Creates a sampler from a camera_sampling/light_sampling entry of config.json.
+    Args:
+        settings (dict): method, radii, elevation, jitter; missing keys use the defaults.
+        radius (float): Radius used if settings has no radii, e.g. r_camera.
+        n_points (int): Lattice/grid size, e.g. the number of images of the run.
+        decimals (int, optional): Rounding used if settings has no decimals. Defaults to None.
+    Returns:
+        ViewpointSampler: The sampler.
+    """
+    return ViewpointSampler(
+        method=settings.get('method', 'fibonacci'),
+        radii=settings.get('radii') or (radius,),
+        n_points=n_points,
+        elevation=settings.get('elevation', (-90.0, 90.0)),
+        jitter=settings.get('jitter', 0.0),
+        decimals=settings.get('decimals', decimals),
+    )
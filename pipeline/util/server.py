@@ -0,0 +1,206 @@
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import secrets
+import socket
+
+# Key authenticating clients of the generation server, required to listen on addresses other than loopback
+AUTHKEY_ENV = 'BLENDR_SERVER_KEY'
+
+# Random key of this install, created on first use and only readable by its owner, used if AUTHKEY_ENV is not set
+KEY_FILE = os.path.join(os.path.expanduser('~'), '.config', 'blendr', 'server_key')
+
+# Upper bound of a message, jobs carry a config.json and events a few fields
+MAX_MESSAGE_BYTES = 1 << 24
+
+# Seconds a client has for the handshake and for sending its job, the server serves one client at a time
+CLIENT_TIMEOUT = 10
+
+
+def parse_address(address):
+    """Parses a 'host:port' address, a bare port listens on localhost."""
+    host, sep, port = str(address).rpartition(':')
+    return (host if sep else 'localhost'), int(port)
+
+
+def is_loopback(host):
+    """Tells whether every address a host name resolves to is a loopback address."""
+    try:
+        infos = socket.getaddrinfo(host or None, None, proto=socket.IPPROTO_TCP, flags=socket.AI_PASSIVE)
+    except socket.gaierror:
+        return False
+    return all(ipaddress.ip_address(info[4][0].split('%')[0]).is_loopback for info in infos)
+
+
+def _authkey():
+    key = os.environ.get(AUTHKEY_ENV)
+    if key:
+        return key.encode('utf-8')
+    try:
+        with open(KEY_FILE, 'rb') as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(KEY_FILE), mode=0o700, exist_ok=True)
+    try:
+        fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # created by a concurrent process
+        return _authkey()
+    key = secrets.token_hex(32).encode('ascii')
+    with os.fdopen(fd, 'wb') as file:
+        file.write(key)
+    return key
+
+
+class Connection():
+    """Newline delimited JSON messages over a socket. Nothing but plain JSON is ever decoded."""
+    def __init__(self, sock):
+        self._sock = sock
+        self._file = sock.makefile('rb')
+
+    def send(self, message):
+        self._sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+    def recv(self):
+        line = self._file.readline(MAX_MESSAGE_BYTES + 1)
+        if not line.endswith(b'\n'):
+            raise ConnectionError('connection closed' if len(line) <= MAX_MESSAGE_BYTES else 'message too large')
+        message = json.loads(line)
+        if not isinstance(message, dict):
+            raise ValueError('expected a JSON object')
+        return message
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _digest(key, challenge):
+    return hmac.new(key, challenge.encode('ascii'), hashlib.sha256).hexdigest()
+
+
+class Listener():
+    """Accepts clients that prove they know the key of the server with an HMAC of a random challenge."""
+    def __init__(self, address, authkey):
+        self._authkey = authkey
+        self._sock = socket.create_server(address)
+        self.address = self._sock.getsockname()[:2]
+
+    def accept(self):
+        """Waits for the next authenticated client and reads its job. Clients failing the handshake
+        or not sending a job within CLIENT_TIMEOUT seconds are dropped, so they cannot block the server.
+        Returns:
+            tuple: Connection to the client and its job.
+        """
+        while True:
+            sock, peer = self._sock.accept()
+            connection = Connection(sock)
+            try:
+                sock.settimeout(CLIENT_TIMEOUT)
+                challenge = secrets.token_hex(32)
+                connection.send({'challenge': challenge})
+                response = connection.recv().get('digest')
+                if isinstance(response, str) and hmac.compare_digest(response, _digest(self._authkey, challenge)):
+                    connection.send({'welcome': True})
+                    job = connection.recv()
+                    # events of a long job are sent without a deadline
+                    sock.settimeout(None)
+                    return connection, job
+                print('Generation server rejected {}: wrong key'.format(peer[0]), flush=True)
+            except (OSError, ValueError) as e:
+                print('Generation server dropped {}: {}'.format(peer[0], e), flush=True)
+            connection.close()
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def listen(address):
+    """Opens the socket blenderscript.py --serve accepts jobs on.
+    Addresses other than loopback need a key set explicitly in BLENDR_SERVER_KEY, otherwise the
+    random key of this install is used.
+    """
+    host, port = parse_address(address)
+    if not is_loopback(host) and not os.environ.get(AUTHKEY_ENV):
+        raise Exception('Refusing to serve on {} without a key, set {} to listen on addresses other than loopback'.format(
+            address, AUTHKEY_ENV))
+    return Listener((host, port), authkey=_authkey())
+
+
+def connect(address):
+    """Opens an authenticated connection to a generation server."""
+    try:
+        sock = socket.create_connection(parse_address(address))
+    except ConnectionRefusedError:
+        raise Exception('No generation server running at {}, start one with render.py --serve'.format(address))
+    connection = Connection(sock)
+    try:
+        challenge = connection.recv()['challenge']
+        connection.send({'digest': _digest(_authkey(), challenge)})
+        connection.recv()
+    except (ConnectionError, KeyError):
+        connection.close()
+        raise Exception('Generation server at {} rejected the key, set the same {} on both sides'.format(
+            address, AUTHKEY_ENV))
+    return connection
+
+
+def make_job(json_config, start=0, count=None, resume=False, keep_previous=False, profile=None, trace=False):
+    """Builds a generation job for the server.
+    Args:
+        json_config (dict): Loaded config.json of the job, its input_dir has to match the scene of the server.
+        start (int, optional): Id of the first image. Defaults to 0.
+        count (int, optional): Number of images, n_images of the config if None.
+        resume (bool, optional): Skip frames completed by a previous run. Defaults to False.
+        keep_previous (bool, optional): Add the recorded frames before start to the annotation file. Defaults to False.
+        profile (str, optional): Render profile, the configured one if None.
+        trace (bool, optional): Write timing spans to <output_dir>/_trace. Defaults to False.
+    Returns:
+        dict: The job.
+    """
+    return {'config': json_config, 'start': start, 'count': count, 'resume': resume, 'keep_previous': keep_previous,
+            'profile': profile, 'trace': trace}
+
+
+def submit(address, job, on_event=None):
+    """Sends a job to a running generation server and waits until it is rendered.
+    Jobs are rendered one after another, a job submitted while another one runs waits for it.
+    Args:
+        address (str): 'host:port' of the server.
+        job (dict): Job created by make_job.
+        on_event (callable, optional): Called with every event of the job, e.g. finished frames.
+    Returns:
+        int: 0 if the job was rendered, 1 if it failed.
+    """
+    with connect(address) as connection:
+        connection.send(job)
+        while True:
+            event = connection.recv()
+            if event.get('event') == 'job_done':
+                if event.get('error'):
+                    print('Generation job failed: {}'.format(event['error']))
+                return event.get('code', 1)
+            if on_event is not None:
+                on_event(event)
+
+
+def stop(address):
+    """Asks a generation server to exit after its current job."""
+    with connect(address) as connection:
+        connection.send({'stop': True})
+        connection.recv()
@@ -0,0 +1,170 @@
+import io
+import json
+import os
+import tarfile
+import time
+
+
+class ShardWriter():
+    """Writes samples into size-limited tar shards that training dataloaders can stream.
+
+    Every sample is stored as '<key>.<ext>' members (WebDataset layout), e.g. 000042.rgb.png,
+    000042.iseg.png and 000042.txt. Shards are written to '<name>.tmp' and renamed once they are
+    complete, so readers and resumed runs never see partial shards. Partial shards left behind by a
+    crashed run with the same prefix are removed when the writer is created, their frames were never
+    recorded as complete and are rendered again.
+    """
+    def __init__(self, output_dir, prefix='shard', max_samples=1000, max_bytes=1 << 30):
+        self.output_dir = str(output_dir)
+        self.prefix = prefix
+        self.max_samples = max_samples
+        self.max_bytes = max_bytes
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._remove_partial()
+        self._index = self._next_index()
+        self._tar = None
+        self._keys = []
+        self._bytes = 0
+        self._labelled = True
+
+    def _remove_partial(self):
+        for name in os.listdir(self.output_dir):
+            if name.startswith(self.prefix + '-') and name.endswith('.tar.tmp'):
+                os.remove(os.path.join(self.output_dir, name))
+
+    def _next_index(self):
+        # continue after shards left by earlier runs with the same prefix
+        taken = [f for f in os.listdir(self.output_dir) if f.startswith(self.prefix + '-') and f.endswith('.tar')]
+        indices = [int(f[len(self.prefix) + 1:-len('.tar')]) for f in taken if f[len(self.prefix) + 1:-len('.tar')].isdigit()]
+        return max(indices) + 1 if indices else 0
+
+    @property
+    def shard_name(self):
+        return '%s-%05d.tar' % (self.prefix, self._index)
+
+    def add(self, key, members):
+        """Adds a sample to the current shard.
+        Args:
+            key (str): Sample key, e.g. the zero padded image id.
+            members (dict): Extension -> bytes or path of a file to store, e.g. {'rgb.png': path, 'txt': b'...'}.
+        Returns:
+            tuple: (shard name, keys) of the shard closed because it was full, or None.
+        """
+        if self._tar is None:
+            self._tar = tarfile.open(os.path.join(self.output_dir, self.shard_name + '.tmp'), 'w')
+
+        for ext, data in members.items():
+            self._bytes += _add_member(self._tar, '%s.%s' % (key, ext), data)
+        self._keys.append(key)
+        self._labelled = self._labelled and 'txt' in members
+
+        if len(self._keys) >= self.max_samples or self._bytes >= self.max_bytes:
+            return self.close()
+        return None
+
+    def close(self):
+        """Completes the current shard and writes its index next to it.
+        Returns:
+            tuple: (shard name, keys) of the completed shard, or None if it was empty.
+        """
+        if self._tar is None:
+            return None
+        self._tar.close()
+        name = self.shard_name
+        path = os.path.join(self.output_dir, name)
+        _write_shard_index(path, self._keys, self._bytes, self._labelled)
+        os.replace(path + '.tmp', path)
+
+        closed = (name, self._keys)
+        self._tar = None
+        self._keys = []
+        self._bytes = 0
+        self._labelled = True
+        self._index += 1
+        return closed
+
+
+def _add_member(tar, name, data):
+    """Adds bytes or the contents of a file to an open tar file, returns the number of bytes added."""
+    if not isinstance(data, (bytes, bytearray)):
+        with open(data, 'rb') as file:
+            data = file.read()
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+    return len(data)
+
+
+def _write_shard_index(path, keys, n_bytes, labelled):
+    with open(path + '.json', 'w') as file:
+        json.dump({'shard': os.path.basename(path), 'samples': keys, 'bytes': n_bytes, 'labelled': labelled}, file)
+
+
+def is_labelled(shard_path):
+    """Tells from the index of a shard whether all of its samples have a label member, without reading the shard.
+    Shards written before the index recorded it count as unlabelled.
+    """
+    try:
+        with open(shard_path + '.json', 'r') as file:
+            return json.load(file).get('labelled', False)
+    except (OSError, ValueError):
+        return False
+
+
+def write_shard(path, samples):
+    """Writes samples to a tar shard, replacing an existing shard atomically.
+    Args:
+        path (str): Path of the shard.
+        samples (iterable): (key, dict of extension -> bytes) tuples as yielded by read_samples.
+    """
+    keys, n_bytes, labelled = [], 0, True
+    with tarfile.open(path + '.tmp', 'w') as tar:
+        for key, members in samples:
+            for ext, data in members.items():
+                n_bytes += _add_member(tar, '%s.%s' % (key, ext), data)
+            keys.append(key)
+            labelled = labelled and 'txt' in members
+    _write_shard_index(path, keys, n_bytes, labelled)
+    os.replace(path + '.tmp', path)
+
+
+def read_samples(shard_path):
+    """Yields the samples of a tar shard in order.
+    Args:
+        shard_path (str): Path of the shard.
+    Yields:
+        tuple: (key, dict of extension -> bytes).
+    """
+    key, sample = None, {}
+    with tarfile.open(shard_path, 'r') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            member_key, ext = member.name.split('.', 1)
+            if member_key != key and sample:
+                yield key, sample
+                sample = {}
+            key = member_key
+            sample[ext] = tar.extractfile(member).read()
+    if sample:
+        yield key, sample
+
+
+def write_index(shard_dir, index_file):
+    """Collects the per shard indexes into one index of all complete shards.
+    Args:
+        shard_dir (str): Folder holding the shards.
+        index_file (str): Path of the combined index.
+    Returns:
+        list: Index entries, one per shard.
+    """
+    entries = []
+    for name in sorted(os.listdir(shard_dir)):
+        if name.endswith('.tar') and os.path.exists(os.path.join(shard_dir, name + '.json')):
+            with open(os.path.join(shard_dir, name + '.json'), 'r') as file:
+                entry = json.load(file)
+            entries.append({'shard': name, 'n_samples': len(entry['samples']), 'bytes': entry['bytes']})
+    with open(index_file, 'w') as file:
+        json.dump({'shards': entries}, file, indent=4)
+    return entries
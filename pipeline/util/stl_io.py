@@ -0,0 +1,86 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Record layout of a binary STL triangle
+_TRIANGLE_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attribute', '<u2'),
+])
+
+
+def read_triangles(path):
+    """Reads the triangles of a binary or ASCII STL file.
+    Binary files are memory-mapped instead of read record by record.
+    Args:
+        path (str): STL file.
+    Returns:
+        np.ndarray: (n, 3, 3) float32 array of triangle vertices.
+    """
+    size = os.path.getsize(path)
+    if size >= 84:
+        with open(path, 'rb') as file:
+            file.seek(80)
+            n = int(np.frombuffer(file.read(4), dtype='<u4')[0])
+        if size == 84 + n * _TRIANGLE_DTYPE.itemsize:
+            if n == 0:
+                return np.empty((0, 3, 3), dtype=np.float32)
+            records = np.memmap(path, dtype=_TRIANGLE_DTYPE, mode='r', offset=84, shape=(n,))
+            return np.array(records['vertices'], dtype=np.float32)
+
+    # ASCII STL, every 'vertex x y z' line is one corner
+    with open(path, 'r', errors='replace') as file:
+        coords = [line.split()[1:4] for line in file if line.lstrip().startswith('vertex')]
+    return np.array(coords, dtype=np.float32).reshape(-1, 3, 3)
+
+
+def index_triangles(triangles):
+    """Merges identical corners of a triangle soup into shared vertices.
+    Args:
+        triangles (np.ndarray): (n, 3, 3) triangle vertices.
+    Returns:
+        tuple: (m, 3) float32 unique vertices and (n, 3) int32 vertex indices per triangle.
+    """
+    # +0.0 turns -0.0 into 0.0 so both compare equal bytewise
+    corners = np.ascontiguousarray(triangles.reshape(-1, 3) + np.float32(0.0))
+    keys = corners.view(np.dtype((np.void, corners.dtype.itemsize * 3))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return corners[first], inverse.reshape(-1, 3).astype(np.int32)
+
+
+def load_stl(path):
+    """Loads an STL file as an indexed mesh.
+    Args:
+        path (str): STL file.
+    Returns:
+        dict: 'name' (file stem), 'vertices', 'faces' and 'bounds' ((3,) min and max corner).
+    """
+    vertices, faces = index_triangles(read_triangles(path))
+    if len(vertices):
+        bounds = (vertices.min(axis=0), vertices.max(axis=0))
+    else:
+        bounds = (np.zeros(3, dtype=np.float32), np.zeros(3, dtype=np.float32))
+    return {
+        'name': os.path.splitext(os.path.basename(path))[0],
+        'vertices': vertices,
+        'faces': faces,
+        'bounds': bounds,
+    }
+
+
+def load_stl_files(paths, jobs=None):
+    """Loads STL files in parallel worker processes.
+    Args:
+        paths (list): STL files.
+        jobs (int, optional): Number of worker processes, None for one per CPU, 1 to load in process.
+    Returns:
+        list: Result of load_stl per file, in the order of paths.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or len(paths) <= 1:
+        return [load_stl(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as executor:
+        return list(executor.map(load_stl, paths))
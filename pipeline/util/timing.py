@@ -0,0 +1,246 @@
+import json
+import os
+import time
+
+# Folder in the output dir holding the span files of all processes of a run
+TRACE_DIRNAME = '_trace'
+
+
+class _Span():
+    __slots__ = ('tracer', 'name', 'args', 'start', 't0')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter() - self.t0, **self.args)
+
+
+class _NullSpan():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Stages():
+    __slots__ = ('tracer', 'name', 'args', 'start', 't0', 'last')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = time.time()
+        self.t0 = self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.tracer.record(stage, self.start + (self.last - self.t0), now - self.last, **self.args)
+        self.last = now
+
+    def end(self):
+        self.tracer.record(self.name, self.start, time.perf_counter() - self.t0, **self.args)
+
+
+class _NullStages():
+    __slots__ = ()
+
+    def mark(self, stage):
+        return None
+
+    def end(self):
+        return None
+
+
+_NULL_STAGES = _NullStages()
+
+
+class Tracer():
+    """Records timing spans of named stages as JSON lines.
+
+    A disabled tracer hands out one shared no-op span, so instrumented code costs a method call per stage.
+    Spans are buffered and written by flush(), e.g. once per frame.
+    """
+    def __init__(self, path=None, process='main'):
+        self.path = path
+        self.process = process
+        self.enabled = path is not None
+        self._buffer = []
+        if self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def span(self, name, **args):
+        """Returns a context manager timing the block as span name, args are stored with the span."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def stages(self, name, **args):
+        """Times consecutive stages of a block without nesting it, e.g. the stages of a frame.
+        stages.mark(name) records the time since the previous mark as span name,
+        stages.end() records the whole block as span name.
+        """
+        if not self.enabled:
+            return _NULL_STAGES
+        return _Stages(self, name, args)
+
+    def record(self, name, start, duration, **args):
+        """Adds a span that started at start (seconds since the epoch) and took duration seconds."""
+        if self.enabled:
+            self._buffer.append({'name': name, 'start': start, 'duration': duration, 'process': self.process, 'args': args})
+
+    def flush(self):
+        if not self._buffer:
+            return
+        with open(self.path, 'a') as file:
+            file.write(''.join(json.dumps(span) + '\n' for span in self._buffer))
+        self._buffer = []
+
+
+def read_spans(trace_dir):
+    """Reads the spans of all JSONL files in trace_dir."""
+    spans = []
+    for name in sorted(os.listdir(trace_dir)):
+        if name.endswith('.jsonl'):
+            with open(os.path.join(trace_dir, name), 'r') as file:
+                for line in file:
+                    try:
+                        spans.append(json.loads(line))
+                    except ValueError:
+                        continue
+    return spans
+
+
+def write_chrome_trace(spans, output_file):
+    """Writes spans in the Chrome trace event format, viewable in chrome://tracing or Perfetto.
+    Every process becomes a separate track.
+    """
+    processes = sorted({span['process'] for span in spans})
+    pids = {process: pid for pid, process in enumerate(processes)}
+    trace_events = [{'name': 'process_name', 'ph': 'M', 'pid': pids[p], 'args': {'name': p}} for p in processes]
+    for span in spans:
+        trace_events.append({
+            'name': span['name'],
+            'ph': 'X',
+            'ts': span['start'] * 1e6,
+            'dur': span['duration'] * 1e6,
+            'pid': pids[span['process']],
+            'tid': 0,
+            'args': span.get('args', {}),
+        })
+    with open(output_file, 'w') as file:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, file)
+
+
+def percentile(sorted_values, q):
+    """Linear interpolated percentile q in [0, 100] of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def summarize(spans, frame_span='frame'):
+    """Summarizes the duration of every span name.
+    Args:
+        spans (list): Spans as read by read_spans.
+        frame_span (str, optional): Name of the span covering a whole frame, used for frames/sec. Defaults to 'frame'.
+    Returns:
+        dict: Stage name -> count, total, mean, p50, p90, p99 and max seconds, plus 'frames_per_second'
+            over the wall time covered by frame spans of all processes.
+    """
+    durations = {}
+    for span in spans:
+        durations.setdefault(span['name'], []).append(span['duration'])
+
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            'count': len(values),
+            'total': sum(values),
+            'mean': sum(values) / len(values),
+            'p50': percentile(values, 50),
+            'p90': percentile(values, 90),
+            'p99': percentile(values, 99),
+            'max': values[-1],
+        }
+
+    frames = [span for span in spans if span['name'] == frame_span]
+    if frames:
+        wall = max(s['start'] + s['duration'] for s in frames) - min(s['start'] for s in frames)
+        summary['frames_per_second'] = len(frames) / wall if wall > 0 else 0.0
+    return summary
+
+
+def format_summary(summary):
+    """Formats a summary as table, slowest stages first."""
+    lines = ['{:24s} {:>7s} {:>10s} {:>9s} {:>9s} {:>9s} {:>9s}'.format('stage', 'count', 'total s', 'mean ms', 'p50 ms', 'p90 ms', 'p99 ms')]
+    stages = sorted((item for item in summary.items() if isinstance(item[1], dict)), key=lambda item: -item[1]['total'])
+    for name, s in stages:
+        lines.append('{:24s} {:7d} {:10.2f} {:9.1f} {:9.1f} {:9.1f} {:9.1f}'.format(
+            name, s['count'], s['total'], 1000 * s['mean'], 1000 * s['p50'], 1000 * s['p90'], 1000 * s['p99']))
+    if 'frames_per_second' in summary:
+        lines.append('frames/sec: {:.3f}'.format(summary['frames_per_second']))
+    return '\n'.join(lines)
+
+
+class Progress():
+    """Prints progress and ETA of a run from the frame events of its Blender processes.
+    Pass on_event to render.main.
+    """
+    def __init__(self, total, interval=5.0):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.skipped = 0
+        self._start = time.time()
+        self._last_print = 0.0
+
+    def on_event(self, event):
+        if event.get('event') != 'frame':
+            return
+        self.done += 1
+        if event.get('skipped'):
+            self.skipped += 1
+        now = time.time()
+        if now - self._last_print >= self.interval or self.done >= self.total:
+            self._last_print = now
+            print(self.status(now), flush=True)
+
+    def status(self, now=None):
+        now = now or time.time()
+        rendered = self.done - self.skipped
+        elapsed = now - self._start
+        fps = rendered / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.done
+        eta = remaining / fps if fps > 0 else float('inf')
+        eta_text = '--' if eta == float('inf') else '{:d}m{:02d}s'.format(int(eta) // 60, int(eta) % 60)
+        return 'Frame {}/{} ({} skipped), {:.2f} frames/s, ETA {}'.format(self.done, self.total, self.skipped, fps, eta_text)
+
+
+def chain(*callbacks):
+    """Combines event callbacks, None entries are ignored. Returns None if there is none."""
+    callbacks = [c for c in callbacks if c is not None]
+    if not callbacks:
+        return None
+
+    def on_event(event):
+        for callback in callbacks:
+            callback(event)
+    return on_event
@@ -0,0 +1,275 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+# Work queue of a run, created in the output dir unless another path is given
+QUEUE_FILENAME = '_queue.sqlite'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    start INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    heartbeat REAL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def batch_ranges(start, count, batch_size):
+    """Splits the image ids start..start+count-1 into (start, count) batches of at most batch_size frames."""
+    batch_size = max(1, batch_size)
+    return [(first, min(batch_size, start + count - first)) for first in range(start, start + count, batch_size)]
+
+
+def worker_name(index=0):
+    """Returns a name identifying a worker across hosts sharing a queue."""
+    return '%s:%d:%d' % (socket.gethostname(), os.getpid(), index)
+
+
+def _connect(path):
+    # autocommit mode, transactions are started explicitly
+    db = sqlite3.connect(path, timeout=60, isolation_level=None)
+    db.row_factory = sqlite3.Row
+    return db
+
+
+class _Transaction():
+    def __init__(self, path):
+        self.db = _connect(path)
+
+    def __enter__(self):
+        # take the write lock up front so two workers never read the same pending batch
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.db.close()
+
+
+class WorkQueue():
+    """SQLite backed queue of frame batches shared by the Blender workers of a run.
+
+    Workers claim a pending batch, renew their claim with heartbeats while rendering and mark it done or failed.
+    A running batch whose heartbeat is older than the lease is assumed lost (crashed worker, rebooted host)
+    and goes back to pending, until it failed max_attempts times.
+    Every operation opens its own short transaction, so workers on several hosts can share the queue file
+    over a network filesystem with working file locks. Heartbeats use the wall clock, the hosts' clocks
+    have to agree to well below the lease.
+    """
+    def __init__(self, path, lease=300.0, max_attempts=3):
+        self.path = str(path)
+        self.lease = lease
+        self.max_attempts = max_attempts
+        db = self._connect()
+        try:
+            db.executescript(_SCHEMA)
+        finally:
+            db.close()
+
+    def _connect(self):
+        return _connect(self.path)
+
+    def _transaction(self):
+        return _Transaction(self.path)
+
+    def fill(self, ranges):
+        """Adds the batches of a run if the queue is empty.
+        Args:
+            ranges (list): (start, count) per batch, e.g. from batch_ranges.
+        Returns:
+            bool: True if the batches were added, False if the queue already had batches.
+        """
+        with self._transaction() as db:
+            if db.execute('SELECT COUNT(*) FROM batches').fetchone()[0]:
+                return False
+            db.executemany('INSERT INTO batches (start, count) VALUES (?, ?)', ranges)
+            return True
+
+    def reap(self):
+        """Returns running batches without a heartbeat for lease seconds to pending, or fails them after max_attempts.
+        Returns:
+            list: Ids of the reaped batches.
+        """
+        with self._transaction() as db:
+            stale = [row['id'] for row in db.execute(
+                "SELECT id FROM batches WHERE state = 'running' AND heartbeat < ?", (time.time() - self.lease,))]
+            for batch_id in stale:
+                self._release(db, batch_id, 'heartbeat lost')
+            return stale
+
+    def _release(self, db, batch_id, error):
+        db.execute("UPDATE batches SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                   "worker = NULL, error = ? WHERE id = ?", (self.max_attempts, error, batch_id))
+
+    def claim(self, worker):
+        """Claims the pending batch with the lowest id.
+        Args:
+            worker (str): Name of the claiming worker.
+        Returns:
+            sqlite3.Row: id, start, count and attempts of the batch, or None if no batch is pending.
+        """
+        with self._transaction() as db:
+            row = db.execute("SELECT * FROM batches WHERE state = 'pending' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE batches SET state = 'running', worker = ?, attempts = attempts + 1, heartbeat = ? "
+                       "WHERE id = ?", (worker, time.time(), row['id']))
+            return db.execute('SELECT * FROM batches WHERE id = ?', (row['id'],)).fetchone()
+
+    def heartbeat(self, batch_id, worker):
+        """Renews the claim of a batch. Returns False if the batch was reaped and is no longer owned by worker."""
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE batches SET heartbeat = ? WHERE id = ? AND worker = ? AND state = 'running'",
+                                (time.time(), batch_id, worker))
+            return cursor.rowcount == 1
+
+    def complete(self, batch_id, worker):
+        """Marks a batch done. Returns False if the batch was reaped in the meantime."""
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE batches SET state = 'done', error = NULL WHERE id = ? AND worker = ?",
+                                (batch_id, worker))
+            return cursor.rowcount == 1
+
+    def fail(self, batch_id, worker, error):
+        """Gives a batch back to the queue after a failed attempt, it is retried until it failed max_attempts times."""
+        with self._transaction() as db:
+            if db.execute('SELECT worker FROM batches WHERE id = ?', (batch_id,)).fetchone()['worker'] == worker:
+                self._release(db, batch_id, error)
+
+    def batches(self):
+        """Returns all batches ordered by id."""
+        db = self._connect()
+        try:
+            return db.execute('SELECT * FROM batches ORDER BY id').fetchall()
+        finally:
+            db.close()
+
+    def counts(self):
+        """Returns the number of batches per state."""
+        counts = {'pending': 0, 'running': 0, 'done': 0, 'failed': 0}
+        for row in self.batches():
+            counts[row['state']] += 1
+        return counts
+
+    def finished(self):
+        """True if no batch is pending or running."""
+        counts = self.counts()
+        return counts['pending'] == 0 and counts['running'] == 0
+
+    def finalized(self):
+        """True if a worker post-processed the run already, see claim_finalize."""
+        db = self._connect()
+        try:
+            return db.execute("SELECT 1 FROM meta WHERE key = 'finalized_by'").fetchone() is not None
+        finally:
+            db.close()
+
+    def claim_finalize(self, worker):
+        """Elects the one worker that post-processes the run once all batches are finished.
+        Returns:
+            bool: True for the first worker calling this, False for all others.
+        """
+        with self._transaction() as db:
+            db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('finalized_by', ?)", (worker,))
+            return db.execute("SELECT value FROM meta WHERE key = 'finalized_by'").fetchone()['value'] == worker
+
+
+class _Heartbeat():
+    """Renews the claim of a batch from a background thread while its Blender process runs.
+    Sets lost once the batch was reaped, e.g. after heartbeats failed for longer than the lease.
+    """
+    def __init__(self, queue, batch_id, worker, interval):
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(queue, batch_id, worker, interval), daemon=True)
+
+    def _run(self, queue, batch_id, worker, interval):
+        while not self._stop.wait(interval):
+            try:
+                if not queue.heartbeat(batch_id, worker):
+                    print('Batch {} was handed to another worker, stopping'.format(batch_id), flush=True)
+                    self.lost.set()
+                    return
+            except sqlite3.Error as e:
+                # a busy or briefly unreachable queue file is retried with the next heartbeat
+                print('Heartbeat of batch {} failed: {}'.format(batch_id, e), flush=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(queue, render_batch, worker, heartbeat=30.0, poll=10.0):
+    """Claims and renders batches until no batch is pending or running any more.
+    Batches running on other workers are waited for, they return to the queue if their worker is lost.
+    Args:
+        queue (WorkQueue): The shared queue.
+        render_batch (callable): Called with a claimed batch and an event that is set if the claim is lost,
+            renders the batch, stopping once the event is set, and returns None on success or an error message.
+        worker (str): Name of this worker, see worker_name.
+        heartbeat (float, optional): Seconds between heartbeats. Defaults to 30.
+        poll (float, optional): Seconds to wait for batches of other workers. Defaults to 10.
+    Returns:
+        int: Number of batches completed by this worker.
+    """
+    completed = 0
+    while True:
+        queue.reap()
+        batch = queue.claim(worker)
+        if batch is None:
+            if queue.finished():
+                return completed
+            time.sleep(poll)
+            continue
+
+        with _Heartbeat(queue, batch['id'], worker, heartbeat) as beat:
+            try:
+                error = render_batch(batch, beat.lost)
+            except Exception as e:
+                error = repr(e)
+
+        # the batch is done or retried by its new owner
+        if beat.lost.is_set():
+            continue
+        if error is None:
+            completed += queue.complete(batch['id'], worker)
+        else:
+            print('Batch {} (frames {}..{}) failed on attempt {}: {}'.format(
+                batch['id'], batch['start'], batch['start'] + batch['count'] - 1, batch['attempts'], error), flush=True)
+            queue.fail(batch['id'], worker, error)
+
+
+def run_workers(queue, render_batch, workers=1, heartbeat=30.0, poll=10.0):
+    """Runs several workers of this host in threads, each one driving its own Blender process, see run_worker.
+    Returns:
+        int: Number of batches completed by the workers of this host.
+    """
+    results = [0] * workers
+
+    def work(index):
+        results[index] = run_worker(queue, lambda batch, lost: render_batch(batch, index, lost), worker_name(index),
+                                    heartbeat, poll)
+
+    threads = [threading.Thread(target=work, args=(index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(results)